@@ -5,11 +5,32 @@ import configparser
 import time
 from configparser import ConfigParser
 import traceback
+import queue
+import threading
+from collections import deque
+from http_client import HttpClient
 
 config = ConfigParser()
 config.read('config.ini')
 WEB_API_ADDRESS = f"{config['WEB_SERVER']['host']}:{config['WEB_SERVER']['port']}"
 
+# 模型伺服器與本地 API 共用連線
+http_client = HttpClient()
+
+# 管線模式的預設值，可由 config.ini 的 [AI_WORKER <模型名稱>] 區段覆寫
+# min/max_concurrency：同時進行的模型請求數範圍；target_latency：每篇的目標延遲秒數（合併請求以篇數平均）；prefetch：預先認領的工作數
+# batch_token_budget：多篇合併成一次請求的估計 token 上限，0 表示不合併；max_batch_size：每次請求最多篇數
+# skip_cluster_duplicates：1 表示略過同一事件群組中已有其他報導分析過的新聞
+DEFAULT_WORKER_CONFIG = {
+    'min_concurrency': 1,
+    'max_concurrency': 4,
+    'target_latency': 20.0,
+    'prefetch': 20,
+    'batch_token_budget': 0,
+    'max_batch_size': 8,
+    'skip_cluster_duplicates': 0,
+}
+
 def get_token_from_config(config_path="config.ini"):
     """從 ini 檔案中讀取 token"""
     config = configparser.ConfigParser()
@@ -22,35 +43,46 @@ def fetch_models(token):
     headers = {"Authorization": f"Bearer {token}"}
 
     try:
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         print("請求失敗：", e)
         return None
 
-def fetch_news_list(count, model):
-    """取得待處理的新聞清單"""
+def fetch_news_list(count, model, priority='newest', source_order=None, skip_cluster_duplicates=False):
+    """
+    認領待處理的新聞清單（priority: newest 依時間新到舊、source 依 source_order 來源優先）
+    內容與已分析過的新聞相同時，伺服器直接套用快取的結果，不會出現在清單中
+    """
     url = f'http://{WEB_API_ADDRESS}/wait_ai_handle_list'
+    payload = {
+        'count': count, 'model': model, 'priority': priority, 'prompt_version': PROMPT_VERSION,
+        'skip_cluster_duplicates': skip_cluster_duplicates,
+    }
+    if source_order:
+        payload['source_order'] = source_order
     try:
-        response = requests.post(url, json={'count': count, 'model': model})
+        response = http_client.post(url, json=payload)
         return json.loads(response.text)
     except Exception as e:
         print("取得新聞清單失敗：", e)
         return []
 
-class ChatSession:
-    def __init__(self, token, model):
-        self.url = 'http://localhost:3000/api/chat/completions'
-        self.headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-        self.model = model
-        self.messages = [
-            {
-                "role": "system",
-                "content": """
+def nack_news(news, model):
+    """處理失敗，釋放工作讓其他 worker 重試"""
+    url = f'http://{WEB_API_ADDRESS}/wait_ai_handle_list/nack'
+    items = [{'id': news['id'], 'lease_token': news['lease_token']}]
+    try:
+        http_client.post(url, json={'items': items, 'model': model})
+    except Exception as e:
+        print("釋放工作失敗：", news['id'], e)
+
+# 提示詞版本；修改 SYSTEM_PROMPT 或 BATCH_INSTRUCTION 時需遞增，舊版本的快取結果不會再被使用
+PROMPT_VERSION = 1
+
+# 系統提示詞；每次請求都放在最前面且內容固定，後端可重用這段前綴的 KV cache
+SYSTEM_PROMPT = """
 你是一位專業的新聞分析師，擅長從新聞提取關鍵資訊。
 1. 標題：
 - 整理出一個可以貫穿整個文章的標題，使用肯定句，最多35個文字。
@@ -64,20 +96,60 @@ class ChatSession:
 5. 將以上結果轉換成json格式
 - {"title": "標題結果", "category": ["分類結果1", "分類結果2"], "keywords": ["關鍵字結果1", "關鍵字結果2"], "sentiment_analysis": "正面、負面、中立", "sentiment_analysis_detail": "分析結果"}
                 """
+
+# 多篇合併時放在使用者訊息最前面；系統提示詞不變，仍可重用前綴的 KV cache
+BATCH_INSTRUCTION = """
+以下有多篇新聞，每篇以 <news id="編號"> 與 </news> 標記。請逐篇依照上述規則分析，
+並以 ```json``` 區塊回傳一個 JSON 陣列，每篇一個物件，且加上該篇的 "news_id" 欄位，例如：
+[{"news_id": 編號, "title": "標題結果", "category": [...], "keywords": [...], "sentiment_analysis": "...", "sentiment_analysis_detail": "..."}]
+"""
+
+# 分析結果必須包含的欄位
+RESULT_KEYS = ('title', 'category', 'keywords', 'sentiment_analysis')
+
+# 每篇輸出結果預留的 token 數
+OUTPUT_TOKENS_PER_ARTICLE = 200
+
+class ChatSession:
+    def __init__(self, token, model, stateless=True):
+        """
+        stateless=True：每次只送出系統提示詞與本篇新聞（預設）
+        stateless=False：保留對話歷史（舊行為，prompt 會隨篇數累積）
+        """
+        self.url = 'http://localhost:3000/api/chat/completions'
+        self.headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        }
+        self.model = model
+        self.stateless = stateless
+        self.messages = [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
             }
         ]
+        # 每次呼叫的 token 用量與耗時
+        self.usage_log = []
 
     def chat(self, user_content):
-        self.messages.append({"role": "user", "content": user_content})
+        user_message = {"role": "user", "content": user_content}
+        if self.stateless:
+            messages = [self.messages[0], user_message]
+        else:
+            self.messages.append(user_message)
+            messages = self.messages
         data = {
             "model": self.model,
-            "messages": self.messages
+            "messages": messages
         }
         try:
-            response = requests.post(self.url, headers=self.headers, json=data)
+            t1 = time.time()
+            response = http_client.post(self.url, headers=self.headers, json=data)
             result = response.json()
-            # 將模型回應加入對話歷史以維持上下文
-            if "choices" in result and len(result["choices"]) > 0:
+            self.record_usage(result, time.time() - t1)
+            # 保留歷史模式下，將模型回應加入對話歷史以維持上下文
+            if not self.stateless and "choices" in result and len(result["choices"]) > 0:
                 self.messages.append({
                     "role": "assistant",
                     "content": result["choices"][0]["message"]["content"]
@@ -87,32 +159,360 @@ class ChatSession:
             print("模型互動失敗：", e)
             return None
 
+    def chat_batch(self, news_list):
+        """一次送出多篇新聞，回傳格式同 chat"""
+        articles = '\n'.join(f'<news id="{news["id"]}">\n{news["news_content"]}\n</news>' for news in news_list)
+        return self.chat(BATCH_INSTRUCTION + articles)
 
-def process_and_add_ai_news(token, news_list, model):
-    """處理新聞並新增至 AI 分析結果表"""
-    api_url = f"http://{WEB_API_ADDRESS}/add_ai_news"
+    def record_usage(self, result, elapsed):
+        """記錄單次呼叫的 prompt / completion token 數（後端未回傳 usage 時為 None）"""
+        usage = result.get("usage") or {}
+        self.usage_log.append({
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "elapsed": elapsed,
+        })
 
-    session = ChatSession(token=token, model=model)
+    def usage_summary(self):
+        """彙總 token 用量：呼叫次數、prompt / completion token 總數與平均、平均耗時"""
+        calls = len(self.usage_log)
+        if calls == 0:
+            return {"calls": 0}
+        prompt_tokens = sum(u["prompt_tokens"] or 0 for u in self.usage_log)
+        completion_tokens = sum(u["completion_tokens"] or 0 for u in self.usage_log)
+        return {
+            "calls": calls,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "avg_prompt_tokens": prompt_tokens / calls,
+            "avg_completion_tokens": completion_tokens / calls,
+            "avg_elapsed": sum(u["elapsed"] for u in self.usage_log) / calls,
+        }
 
-    for news in news_list:
-        jsondata = session.chat(news['news_content'])
-        if not jsondata:
+
+def parse_analysis(jsondata):
+    """從模型回應取出 ```json``` 區塊並轉成 dict，格式不符時拋出例外"""
+    content1 = jsondata['choices'][0]['message']['content']
+    re_obj = re.search(r'```json(.*?)```', content1, re.DOTALL)
+    return json.loads(re_obj[1])
+
+def parse_batch_analysis(jsondata, news_ids):
+    """
+    輸入：jsondata (模型回應)、news_ids (本批新聞 id)
+    輸出：{news_id: 分析結果}；只包含 id 屬於本批且欄位完整的項目，其餘由呼叫端改為單篇處理
+    """
+    content1 = jsondata['choices'][0]['message']['content']
+    re_obj = re.search(r'```json(.*?)```', content1, re.DOTALL)
+    items = json.loads(re_obj[1] if re_obj else content1[content1.index('['):content1.rindex(']') + 1])
+    if not isinstance(items, list):
+        raise ValueError('回應不是 JSON 陣列')
+
+    news_ids = set(news_ids)
+    results = {}
+    for item in items:
+        if not isinstance(item, dict) or not all(key in item for key in RESULT_KEYS):
             continue
         try:
-            content1 = jsondata['choices'][0]['message']['content']
-            re_obj = re.search(r'```json(.*?)```', content1, re.DOTALL)
-            result_json = json.loads(re_obj[1])
-            print(result_json)
-            data = {"news_id": news['id'], 'model': model, **result_json}
-            response = requests.post(api_url, json=data)
-
-            if response.status_code == 201:
-                print("新增成功:", news['id'], response.json())
-            else:
-                print("新增失敗:", response.status_code, response.json())
+            news_id = int(item.pop('news_id'))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if news_id in news_ids and news_id not in results:
+            results[news_id] = item
+    return results
+
+def estimate_tokens(text):
+    """粗估 token 數；中文約每字一個 token，以字數估計（偏保守）"""
+    return len(text)
+
+def pack_batches(news_list, token_budget, max_batch_size):
+    """
+    依序將新聞分批，每批估計 token 數（內容 + 輸出預留）不超過 token_budget、篇數不超過 max_batch_size
+    單篇超過上限時自成一批
+    """
+    batches = []
+    batch, used = [], 0
+    for news in news_list:
+        cost = estimate_tokens(news['news_content']) + OUTPUT_TOKENS_PER_ARTICLE
+        if batch and (used + cost > token_budget or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(news)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+def limited_chat(limiter, send, articles, sample=True):
+    """
+    送出一次模型請求；提供 limiter 時在其同時請求數內進行
+    sample 為 True 且有回應時，以每篇平均延遲（耗時 / articles）作為 limiter 的延遲樣本
+    """
+    if limiter is None:
+        return send()
+    limiter.acquire()
+    t1 = time.time()
+    jsondata = None
+    try:
+        jsondata = send()
+        return jsondata
+    finally:
+        limiter.release((time.time() - t1) / articles if sample and jsondata else None)
+
+def analyze_single(session, news, limiter=None, sample=True):
+    """單篇分析，失敗時回傳 None；sample=False 時不列入 limiter 的延遲樣本（合併請求失敗後的重試）"""
+    jsondata = limited_chat(limiter, lambda: session.chat(news['news_content']), 1, sample)
+    if not jsondata:
+        return None
+    try:
+        return parse_analysis(jsondata)
+    except Exception as e:
+        print("解析失敗：", news['id'], e)
+        return None
+
+def analyze_batch(session, news_list, limiter=None):
+    """
+    多篇合併成一次請求；解析失敗或缺少的項目改用單篇請求
+    提供 limiter 時每次模型請求各自取得同時請求數，延遲樣本只取合併請求（以篇數平均），不含改用單篇的重試
+    輸出：([(news, 分析結果或 None), ...], 改用單篇的篇數)
+    """
+    if len(news_list) == 1:
+        return [(news_list[0], analyze_single(session, news_list[0], limiter))], 0
+
+    results = {}
+    jsondata = limited_chat(limiter, lambda: session.chat_batch(news_list), len(news_list))
+    if jsondata:
+        try:
+            results = parse_batch_analysis(jsondata, [news['id'] for news in news_list])
         except Exception as e:
-            traceback.print_exc()
-            print("處理失敗：", news['id'], e)
+            print("合併回應解析失敗：", [news['id'] for news in news_list], e)
+
+    pairs = []
+    fallbacks = 0
+    for news in news_list:
+        result_json = results.get(news['id'])
+        if result_json is None:
+            fallbacks += 1
+            result_json = analyze_single(session, news, limiter, sample=False)
+        pairs.append((news, result_json))
+    return pairs, fallbacks
+
+def submit_analysis(news, model, result_json):
+    """上傳分析結果，失敗時釋放工作；回傳是否成功（租約已失效時 409，工作已由其他 worker 處理，不需釋放）"""
+    api_url = f"http://{WEB_API_ADDRESS}/add_ai_news"
+    data = {
+        **result_json, "news_id": news['id'], 'model': model, 'lease_token': news['lease_token'],
+        'prompt_version': PROMPT_VERSION,
+    }
+    response = http_client.post(api_url, json=data)
+
+    if response.status_code == 201:
+        print("新增成功:", news['id'], response.json())
+        return True
+    if response.status_code == 409:
+        print("租約已失效，略過:", news['id'], response.json())
+        return False
+    print("新增失敗:", response.status_code, response.json())
+    nack_news(news, model)
+    return False
+
+def process_and_add_ai_news(token, news_list, model, batch_token_budget=0, max_batch_size=8):
+    """
+    處理新聞並新增至 AI 分析結果表
+    batch_token_budget > 0 時，多篇合併成一次請求（見 pack_batches），解析失敗的篇章改用單篇請求
+    """
+    session = ChatSession(token=token, model=model)
+
+    if batch_token_budget > 0:
+        batches = pack_batches(news_list, batch_token_budget, max_batch_size)
+    else:
+        batches = [[news] for news in news_list]
+
+    fallbacks = 0
+    for batch in batches:
+        pairs, batch_fallbacks = analyze_batch(session, batch)
+        fallbacks += batch_fallbacks
+        for news, result_json in pairs:
+            if result_json is None:
+                nack_news(news, model)
+                continue
+            try:
+                print(result_json)
+                submit_analysis(news, model, result_json)
+            except Exception as e:
+                traceback.print_exc()
+                print("處理失敗：", news['id'], e)
+                nack_news(news, model)
+
+    if batch_token_budget > 0:
+        print(f"合併請求：{len(batches)} 次，共 {len(news_list)} 篇，改用單篇 {fallbacks} 篇")
+    print("token 用量：", session.usage_summary())
+
+
+class AdaptiveLimiter:
+    """
+    依模型伺服器延遲調整同時進行的請求數 (AIMD)
+    - 近期平均延遲低於 target_latency：上限 +1
+    - 高於 target_latency 的 1.5 倍：上限減為 3/4
+    每次模型請求各自 acquire / release，延遲樣本為每篇平均延遲（見 limited_chat）
+    """
+
+    def __init__(self, min_limit, max_limit, target_latency, window=10):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.limit = min_limit
+        self.in_flight = 0
+        self._latencies = deque(maxlen=window)
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None):
+        """latency 為 None 時只釋放，不列入延遲樣本（請求失敗或合併請求失敗後的重試）"""
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None:
+                self._latencies.append(latency)
+            if latency is not None and len(self._latencies) == self._latencies.maxlen:
+                avg = sum(self._latencies) / len(self._latencies)
+                if avg < self.target_latency and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._latencies.clear()
+                elif avg > self.target_latency * 1.5 and self.limit > self.min_limit:
+                    self.limit = max(self.min_limit, int(self.limit * 0.75))
+                    self._latencies.clear()
+            self._cond.notify_all()
+
+
+def get_worker_config(model):
+    """讀取模型的 worker 設定，config.ini 可用 [AI_WORKER <模型名稱>] 區段覆寫"""
+    worker_config = dict(DEFAULT_WORKER_CONFIG)
+    section = f'AI_WORKER {model}'
+    if config.has_section(section):
+        for key, value in config[section].items():
+            worker_config[key] = float(value) if key == 'target_latency' else int(value)
+    return worker_config
+
+
+def run_pipeline(token, model, report_interval=30):
+    """
+    管線模式：
+    1. 預先認領工作放入佇列 (prefetch)
+    2. 多個執行緒同時呼叫模型，同時進行數由 AdaptiveLimiter 控制
+       設定 batch_token_budget 時，每次請求合併佇列中已有的多篇（見 analyze_batch）
+    3. 另一個執行緒上傳結果
+    佇列皆有上限，下游變慢時上游會等待
+    """
+    worker_config = get_worker_config(model)
+    session = ChatSession(token=token, model=model)
+    limiter = AdaptiveLimiter(worker_config['min_concurrency'], worker_config['max_concurrency'], worker_config['target_latency'])
+    job_queue = queue.Queue(maxsize=worker_config['prefetch'])
+    result_queue = queue.Queue(maxsize=worker_config['prefetch'])
+    batch_token_budget = worker_config['batch_token_budget']
+    stats = {'done': 0, 'failed': 0, 'fallbacks': 0}
+    stats_lock = threading.Lock()
+
+    def count(key):
+        with stats_lock:
+            stats[key] += 1
+
+    def prefetcher():
+        # 佇列空出一半時再認領一批，沒有工作時結束
+        batch_size = max(1, worker_config['prefetch'] // 2)
+        while True:
+            news_list = fetch_news_list(
+                count=batch_size, model=model, skip_cluster_duplicates=bool(worker_config['skip_cluster_duplicates'])
+            )
+            if not news_list:
+                break
+            for news in news_list:
+                job_queue.put(news)
+        for _ in range(worker_config['max_concurrency']):
+            job_queue.put(None)
+
+    def take_batch(carry):
+        # 取出一批工作：先取一篇（必要時等待），再取佇列中已有的工作直到 token 上限
+        # 放不下的那篇留給下一批 (carry)；遇到結束標記時回傳 done=True
+        news = carry if carry is not None else job_queue.get()
+        if news is None:
+            return [], None, True
+        batch = [news]
+        if batch_token_budget <= 0:
+            return batch, None, False
+        used = estimate_tokens(news['news_content']) + OUTPUT_TOKENS_PER_ARTICLE
+        while len(batch) < worker_config['max_batch_size']:
+            try:
+                news = job_queue.get_nowait()
+            except queue.Empty:
+                break
+            if news is None:
+                return batch, None, True
+            cost = estimate_tokens(news['news_content']) + OUTPUT_TOKENS_PER_ARTICLE
+            if used + cost > batch_token_budget:
+                return batch, news, False
+            batch.append(news)
+            used += cost
+        return batch, None, False
+
+    def completer():
+        carry = None
+        done = False
+        while not done:
+            batch, carry, done = take_batch(carry)
+            if not batch:
+                break
+            pairs, fallbacks = analyze_batch(session, batch, limiter)
+            with stats_lock:
+                stats['fallbacks'] += fallbacks
+            for news, result_json in pairs:
+                if result_json is None:
+                    print("處理失敗：", news['id'])
+                    nack_news(news, model)
+                    count('failed')
+                else:
+                    result_queue.put((news, result_json))
+
+    def submitter():
+        while True:
+            item = result_queue.get()
+            if item is None:
+                return
+            news, result_json = item
+            try:
+                count('done' if submit_analysis(news, model, result_json) else 'failed')
+            except Exception as e:
+                print("上傳失敗：", news['id'], e)
+                nack_news(news, model)
+                count('failed')
+
+    start = time.time()
+    threads = [threading.Thread(target=prefetcher, daemon=True)]
+    threads += [threading.Thread(target=completer, daemon=True) for _ in range(worker_config['max_concurrency'])]
+    submit_thread = threading.Thread(target=submitter, daemon=True)
+    for thread in threads + [submit_thread]:
+        thread.start()
+
+    def report():
+        minutes = (time.time() - start) / 60
+        with stats_lock:
+            done, failed, fallbacks = stats['done'], stats['failed'], stats['fallbacks']
+        print(f"吞吐量: {done / minutes if minutes else 0:.1f} 篇/分鐘 (完成 {done}, 失敗 {failed}, 改用單篇 {fallbacks}, "
+              f"同時請求上限 {limiter.limit}, 佇列 {job_queue.qsize()}/{result_queue.qsize()})")
+
+    last_report = time.time()
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(1)
+        if time.time() - last_report >= report_interval:
+            report()
+            last_report = time.time()
+    result_queue.put(None)
+    submit_thread.join()
+    report()
+    print("token 用量：", session.usage_summary())
 
 if __name__ == "__main__":
     token = get_token_from_config()
@@ -122,14 +522,4 @@ if __name__ == "__main__":
 
     model = 'gemma3:4b-it-qat' # 使用的模型
     # model = 'gemma3:12b-it-qat'
-    while True:
-        t1 = time.time()
-        news_list = fetch_news_list(count=10, model=model)
-
-        if news_list:
-            process_and_add_ai_news(token, news_list, model)
-        else:
-            break
-
-        t2 = time.time()
-        print('\n\n用時(s):',  t2-t1)
+    run_pipeline(token, model)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from datetime import datetime
+
+# AI 分析結果快取 (ai_result_cache 表)
+# 以「正規化後內容的雜湊 + 模型 + 提示詞版本」為鍵，不同來源轉載的相同稿件只需分析一次
+# 項目數超過上限時，刪除最久未使用的項目
+
+# 快取的分析結果欄位（與 /add_ai_news 的輸入相同）
+RESULT_FIELDS = ('title', 'category', 'keywords', 'sentiment_analysis')
+
+LOOKUP_SQL = '''
+    SELECT content_hash, result FROM ai_result_cache
+    WHERE content_hash IN ({placeholders}) AND ai_model = ? AND prompt_version = ?
+'''
+
+# 刪除最久未使用的項目
+EVICT_SQL = '''
+    DELETE FROM ai_result_cache WHERE rowid IN (
+        SELECT rowid FROM ai_result_cache ORDER BY last_used_at LIMIT ?
+    )
+'''
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_content(content):
+    """
+    輸入：content (str)
+    輸出：正規化後的內容；全形半形統一 (NFKC) 並移除所有空白
+    """
+    return _WHITESPACE_RE.sub('', unicodedata.normalize('NFKC', content or ''))
+
+
+def content_hash(content):
+    """
+    輸入：content (str)
+    輸出：正規化內容的 SHA-256 (hex)，內容為空時為 None（不快取）
+    """
+    normalized = normalize_content(content)
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class AiResultCache:
+    """
+    輸入：
+        capacity: 最多保留的項目數
+        evict_interval: 每寫入幾筆檢查一次是否超過上限
+    """
+
+    def __init__(self, capacity=100000, evict_interval=100, chunk_size=500):
+        self.capacity = capacity
+        self.evict_interval = evict_interval
+        self.chunk_size = chunk_size
+        self._stores_since_evict = 0
+        self._stats = {'lookups': 0, 'hits': 0, 'stores': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def lookup(self, cursor, news_rows, model, prompt_version):
+        """
+        輸入：cursor、news_rows (含 id、news_content)、model (int)、prompt_version (int)
+        輸出：{news_id: 分析結果 dict}，只包含命中的新聞；命中的項目更新使用時間與次數
+        """
+        hash_to_ids = {}
+        for row in news_rows:
+            key = content_hash(row['news_content'])
+            if key:
+                hash_to_ids.setdefault(key, []).append(row['id'])
+
+        found = {}
+        keys = list(hash_to_ids)
+        for i in range(0, len(keys), self.chunk_size):
+            chunk = keys[i:i + self.chunk_size]
+            placeholders = ', '.join(['?'] * len(chunk))
+            cursor.execute(LOOKUP_SQL.format(placeholders=placeholders), chunk + [model, prompt_version])
+            for row in cursor.fetchall():
+                found[row[0]] = json.loads(row[1])
+
+        if found:
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            cursor.executemany(
+                """
+                UPDATE ai_result_cache SET hits = hits + ?, last_used_at = ?
+                WHERE content_hash = ? AND ai_model = ? AND prompt_version = ?
+                """,
+                [(len(hash_to_ids[key]), now, key, model, prompt_version) for key in found]
+            )
+
+        results = {news_id: found[key] for key, ids in hash_to_ids.items() if key in found for news_id in ids}
+        with self._lock:
+            self._stats['lookups'] += len(news_rows)
+            self._stats['hits'] += len(results)
+        return results
+
+    def store(self, cursor, content, model, prompt_version, result):
+        """
+        輸入：cursor、content (新聞內容)、model (int)、prompt_version (int)、result (分析結果 dict)
+        輸出：無；寫入或覆蓋快取，需在交易中呼叫
+        """
+        key = content_hash(content)
+        if not key:
+            return
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute(
+            """
+            INSERT INTO ai_result_cache (content_hash, ai_model, prompt_version, result, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (content_hash, ai_model, prompt_version) DO UPDATE
+            SET result = excluded.result, last_used_at = excluded.last_used_at
+            """,
+            (key, model, prompt_version, json.dumps({field: result[field] for field in RESULT_FIELDS}, ensure_ascii=False), now, now)
+        )
+        with self._lock:
+            self._stats['stores'] += 1
+            self._stores_since_evict += 1
+            should_evict = self._stores_since_evict >= self.evict_interval
+            if should_evict:
+                self._stores_since_evict = 0
+        if should_evict:
+            self.evict(cursor)
+
+    def evict(self, cursor):
+        """
+        輸入：cursor
+        輸出：刪除筆數 (int)；超過上限時刪除最久未使用的項目
+        """
+        total = cursor.execute("SELECT COUNT(*) FROM ai_result_cache").fetchone()[0]
+        excess = total - self.capacity
+        if excess <= 0:
+            return 0
+        cursor.execute(EVICT_SQL, (excess,))
+        with self._lock:
+            self._stats['evictions'] += cursor.rowcount
+        return cursor.rowcount
+
+    def stats(self, conn):
+        """
+        輸入：conn
+        輸出：本次啟動後的 lookups、hits、stores、evictions 與命中率，以及快取項目數與累計命中次數
+        """
+        with self._lock:
+            result = dict(self._stats)
+        result['hit_rate'] = round(result['hits'] / result['lookups'], 4) if result['lookups'] else None
+        row = conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM ai_result_cache").fetchone()
+        result['size'] = row[0]
+        result['total_hits'] = row[1]
+        return result
@@ -0,0 +1,67 @@
+"""
+POST /news 批次寫入基準測試：以 1k 篇新聞（每篇 5 個關鍵字）量測整批寫入時間
+
+用法：python benchmarks/bench_add_news.py [--articles 1000] [--keywords 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_nain  # noqa: E402
+
+
+def make_payload(batch, articles, keywords):
+    """
+    輸入：batch (int)、articles (int)、keywords (int)
+    輸出：POST /news 的 payload (list of dict)
+    """
+    return [
+        {
+            'news_title': f'title {batch}-{i}',
+            'news_content': '內容' * 200,
+            'news_url': f'https://example.com/{batch}/{i}',
+            'news_time': f'2025-01-01 {i % 24:02d}:00:00',
+            'source_website': i % 3 + 1,
+            'author': f'作者{i % 50}',
+            'category': f'類別{i % 10}',
+            'keywords': [f'關鍵字{(i + k) % 300}' for k in range(keywords)],
+            'query_state': 2,
+        }
+        for i in range(articles)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--keywords', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        web_nain.DATABASE = os.path.join(tmp, 'bench.db')
+        web_nain.init_db()
+        client = web_nain.app.test_client()
+
+        cases = [
+            ('新名稱', make_payload(0, args.articles, args.keywords)),
+            ('既有名稱', make_payload(1, args.articles, args.keywords)),
+            ('全部重複', make_payload(1, args.articles, args.keywords)),
+        ]
+        for name, payload in cases:
+            t1 = time.perf_counter()
+            res = client.post('/news', json=payload)
+            elapsed = time.perf_counter() - t1
+            body = res.get_json()
+            print(f'{name}: {len(payload)} 篇, 成功 {len(body["success"])}, 失敗 {len(body["errors"])}, '
+                  f'{elapsed * 1000:.1f} ms, {len(payload) / elapsed:.0f} 篇/秒')
+
+        for pool in web_nain.db_pools.values():
+            pool.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+多篇合併請求基準測試：以不同每批篇數分析同一組新聞，量測吞吐量與結果一致性
+
+以每批 1 篇的結果為基準，比較其他批次大小的分類、情感是否相同與關鍵字重疊率 (Jaccard)
+只呼叫模型，不會寫入分析結果；需要 config.ini 與可連線的模型伺服器
+
+用法：python benchmarks/bench_ai_batching.py [--model gemma3:4b-it-qat] [--articles 32] [--sizes 1,2,4,8] [--budget 8000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_handle_main  # noqa: E402
+
+
+def load_articles(database, count):
+    """
+    輸入：database (str)、count (int)
+    輸出：最新 count 篇有內容的新聞 [{'id', 'news_content'}, ...]
+    """
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(
+        "SELECT id, news_content FROM news WHERE query_state = 2 AND news_content != '' "
+        "ORDER BY news_time DESC LIMIT ?", (count,)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def as_set(value):
+    if isinstance(value, list):
+        return {str(v) for v in value}
+    return {str(value)} if value else set()
+
+
+def compare(baseline, results):
+    """
+    輸入：baseline、results ({news_id: 分析結果})
+    輸出：(分類相同比例, 情感相同比例, 關鍵字平均 Jaccard)，只計算兩邊都有結果的新聞
+    """
+    common = [news_id for news_id in baseline if news_id in results]
+    if not common:
+        return None, None, None
+    category = sum(as_set(baseline[i].get('category')) == as_set(results[i].get('category')) for i in common)
+    sentiment = sum(baseline[i].get('sentiment_analysis') == results[i].get('sentiment_analysis') for i in common)
+    jaccard = 0
+    for news_id in common:
+        a, b = as_set(baseline[news_id].get('keywords')), as_set(results[news_id].get('keywords'))
+        jaccard += len(a & b) / len(a | b) if a | b else 1
+    return category / len(common), sentiment / len(common), jaccard / len(common)
+
+
+def run(token, model, articles, batch_size, budget):
+    """
+    輸入：token、model、articles、batch_size、budget
+    輸出：({news_id: 分析結果}, 耗時秒數, 請求數, 改用單篇篇數)
+    """
+    session = ai_handle_main.ChatSession(token=token, model=model)
+    batches = ai_handle_main.pack_batches(articles, budget, batch_size)
+    results = {}
+    fallbacks = 0
+    t1 = time.perf_counter()
+    for batch in batches:
+        pairs, batch_fallbacks = ai_handle_main.analyze_batch(session, batch)
+        fallbacks += batch_fallbacks
+        for news, result_json in pairs:
+            if result_json is not None:
+                results[news['id']] = result_json
+    return results, time.perf_counter() - t1, session.usage_summary()['calls'], fallbacks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='gemma3:4b-it-qat')
+    parser.add_argument('--articles', type=int, default=32)
+    parser.add_argument('--sizes', default='1,2,4,8')
+    parser.add_argument('--budget', type=int, default=8000)
+    parser.add_argument('--database', default='news.db')
+    args = parser.parse_args()
+
+    token = ai_handle_main.get_token_from_config()
+    articles = load_articles(args.database, args.articles)
+    if not articles:
+        print('資料庫中沒有可分析的新聞')
+        return
+    sizes = sorted({int(size) for size in args.sizes.split(',')} | {1})
+
+    baseline = None
+    for batch_size in sizes:
+        results, elapsed, calls, fallbacks = run(token, args.model, articles, batch_size, args.budget)
+        if baseline is None:
+            baseline = results
+        category, sentiment, jaccard = compare(baseline, results)
+        accuracy = (f'分類一致 {category:.0%}, 情感一致 {sentiment:.0%}, 關鍵字 Jaccard {jaccard:.2f}'
+                    if category is not None else '無可比較結果')
+        print(f'每批 {batch_size} 篇: 請求 {calls} 次, 成功 {len(results)}/{len(articles)}, 改用單篇 {fallbacks}, '
+              f'{elapsed:.1f} 秒, {len(results) / elapsed * 60:.1f} 篇/分鐘, {accuracy}')
+
+
+if __name__ == '__main__':
+    main()
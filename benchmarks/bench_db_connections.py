@@ -0,0 +1,137 @@
+"""
+讀取延遲基準測試：在持續寫入的情況下量測查詢延遲
+- before：每次查詢新建連線、預設 journal (delete)
+- after：連線池 + WAL + 唯讀連線
+
+用法：python benchmarks/bench_db_connections.py [--rows 20000] [--seconds 5]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool, DEFAULT_PRAGMAS  # noqa: E402
+from migrations import migrate_db  # noqa: E402
+
+READ_SQL = '''
+SELECT news.id, news.news_time, ai_news.ai_title, news.image_url, news.source_website, news.news_url
+FROM news CROSS JOIN ai_news ON ai_news.news_id = news.id
+WHERE ai_news.ai_model = ?
+ORDER BY news.news_time DESC, news.id DESC LIMIT 10
+'''
+
+
+def build_db(path, rows, journal_mode):
+    """
+    輸入：path (str)、rows (int)、journal_mode (str)
+    輸出：無；建立含測試資料的資料庫
+    """
+    with sqlite3.connect(path) as conn:
+        conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+        migrate_db(conn)
+        conn.executemany(
+            'INSERT INTO news (news_time, news_title, news_content, news_url, source_website, query_state) VALUES (?, ?, ?, ?, ?, 2)',
+            ((f'2025-01-01 {i % 24:02d}:{i % 60:02d}:00', f'title {i}', 'content ' * 50, f'https://example.com/{i}', i % 3 + 1) for i in range(rows))
+        )
+        conn.executemany(
+            'INSERT INTO ai_news (news_id, ai_title, ai_sentiment_analysis, ai_model) VALUES (?, ?, 0, 1)',
+            ((i, f'ai title {i}') for i in range(1, rows + 1))
+        )
+        conn.commit()
+
+
+def writer(path, stop, pragmas):
+    """
+    輸入：path、stop (threading.Event)、pragmas (dict)
+    輸出：寫入筆數 (list，供主執行緒讀取)
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    i = 0
+    while not stop.is_set():
+        conn.execute(
+            'INSERT INTO news (news_time, news_title, news_url, source_website) VALUES (?, ?, ?, 1)',
+            ('2025-01-02 00:00:00', 'write', f'https://example.com/w/{threading.get_ident()}/{i}')
+        )
+        conn.commit()
+        i += 1
+    conn.close()
+
+
+def measure(read_once, seconds):
+    """
+    輸入：read_once (callable)、seconds (float)
+    輸出：每次讀取延遲 (list of 毫秒)
+    """
+    latencies = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        t1 = time.perf_counter()
+        read_once()
+        latencies.append((time.perf_counter() - t1) * 1000)
+    return latencies
+
+
+def run(mode, rows, seconds):
+    """
+    輸入：mode ('before' 或 'after')、rows (int)、seconds (float)
+    輸出：寫入期間的讀取延遲 (list of 毫秒)
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        if mode == 'before':
+            build_db(path, rows, 'delete')
+            writer_pragmas = {}
+
+            def read_once():
+                conn = sqlite3.connect(path, timeout=30)
+                conn.row_factory = sqlite3.Row
+                conn.execute(READ_SQL, (1,)).fetchall()
+                conn.close()
+        else:
+            build_db(path, rows, 'wal')
+            writer_pragmas = {'synchronous': DEFAULT_PRAGMAS['synchronous'], 'busy_timeout': DEFAULT_PRAGMAS['busy_timeout']}
+            pool = ConnectionPool(path, size=1, readonly=True)
+
+            def read_once():
+                conn = pool.acquire()
+                try:
+                    conn.execute(READ_SQL, (1,)).fetchall()
+                finally:
+                    pool.release(conn)
+
+        stop = threading.Event()
+        thread = threading.Thread(target=writer, args=(path, stop, writer_pragmas))
+        thread.start()
+        try:
+            latencies = measure(read_once, seconds)
+        finally:
+            stop.set()
+            thread.join()
+        if mode == 'after':
+            pool.close_all()
+        return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for mode in ('before', 'after'):
+        latencies = sorted(run(mode, args.rows, args.seconds))
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f'{mode:>6}: 讀取 {len(latencies)} 次, p50 {statistics.median(latencies):.3f} ms, '
+              f'p95 {p95:.3f} ms, max {latencies[-1]:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+新聞頁面解析基準測試：以保存的頁面比較 news_parsers 與原本 BeautifulSoup 全樹解析的速度，並檢查結果相同
+
+頁面保存在 benchmarks/fixtures/<種類>/*.html，種類見 PARSERS；
+目前的頁面為依各網站結構產生的合成頁面（含未加引號的 class、被註解掉的標題等情況），可用 save 換成實際頁面
+任一種類沒有頁面或結果不同時以非 0 結束
+用法：
+    python benchmarks/bench_parsers.py [--repeat 20] [--fixtures benchmarks/fixtures]
+    python benchmarks/bench_parsers.py save ttv_article https://news.ttv.com.tw/news/...
+    python benchmarks/bench_parsers.py save ebc_list https://news.ebc.net.tw/category/load --data cate_code=politics --data page=1
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import requests
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import news_parsers  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURE_LINK = 'https://www.setn.com//News.aspx?NewsID=0&utm_campaign=viewallnews'  # 三立內文頁的 link 參數
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36'
+
+
+# 原本 script_main.py 以 BeautifulSoup 建立完整樹的解析，作為比對基準
+
+def soup_ttv_list(text):
+    soup = BeautifulSoup(text, 'lxml')
+    req_news = []
+    for news in soup.select('article.container a'):
+        news_title = news.select('div.title')[0].text.strip()
+        news_time = news.select('div.time')[0].text.strip()
+        dt_object = datetime.strptime(news_time, "%Y.%m.%d %H:%M")
+        if dt_object.year < 2024:
+            continue
+        news_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
+        req_news.append({'news_time': news_time, 'news_title': news_title, 'news_url': news['href'], 'source_website': 1})
+    return req_news
+
+
+def soup_ttv_article(text):
+    soup = BeautifulSoup(text, 'lxml')
+    title = soup.select("h1.mb-ht-hf")[0].text.strip()
+    title = re.sub(r'\u3000', ' ', title)
+    category = [soup.select("div#crumbs li")[-1].text]
+    keywords = [li.text for li in soup.select("ul.news-status > ul.tag li")]
+    imgs = soup.select("article#contentarea img")
+    if len(imgs) > 1:
+        src = imgs[1]['src']
+    elif len(imgs) > 0:
+        src = imgs[0]['src']
+    else:
+        src = None
+    content = '\n'.join([x.text for x in soup.select("div#newscontent > p")])
+    author = re.search(r'責任編輯／([\u4e00-\u9fff]+)', content)
+    author = author[1] if author else None
+    return {'news_title': title, 'news_content': content, 'image_url': src, 'keywords': keywords, 'category': category, 'author': author}
+
+
+def soup_setn_article(link, text):
+    soup = BeautifulSoup(text, 'lxml')
+    soup_news_title = soup.select('h1.news-title-3')
+    if soup_news_title == []:
+        return None
+    news_title = soup_news_title[0].text
+    data = json.loads(soup.find('script', type='application/ld+json').string)
+    author = None
+    for k, v in data['author'].items():
+        if k == 'name':
+            author = v
+    src = None
+    for k, v in data['image'].items():
+        if k == 'url':
+            src = v
+    news_time = datetime.fromisoformat(data['datePublished']).strftime("%Y-%m-%d %H:%M:%S")
+    return {'news_title': news_title, 'news_content': data['description'], 'image_url': src, 'keywords': data['keywords'], 'category': data['articleSection'], 'author': author, 'query_state': 2, 'news_url': link, 'source_website': 2, 'news_time': news_time}
+
+
+def soup_ebc_list(text):
+    soup = BeautifulSoup(text, 'lxml')
+    return [{'news_title': news['title'], 'news_url': f"https://news.ebc.net.tw/{news['href']}", 'source_website': 3}
+            for news in soup.select('a.item.col3')]
+
+
+def soup_ebc_article(text):
+    soup = BeautifulSoup(text, 'lxml')
+    ld_json_scripts = soup.find('script', type='application/ld+json').string
+    data = json.loads(re.sub(r"[\x00-\x1F\x7F]", "", ld_json_scripts))[0]
+    keywords = data['keywords'].split(',') if 'keywords' in data else None
+    content = '\n'.join([x.text for x in soup.select("div.article_content > p")])
+    author = re.search(r'編輯 ([\u4e00-\u9fff]+)', data['author']['name'])
+    author = author[1] if author else data['author']['name']
+    news_time = datetime.fromisoformat(data['dateCreated']).strftime("%Y-%m-%d %H:%M:%S")
+    return {'news_title': data['headline'], 'news_content': content, 'image_url': data['image'], 'keywords': keywords, 'category': [data['articleSection']], 'author': author, 'news_time': news_time}
+
+
+# 種類 → (基準解析, news_parsers 解析)
+PARSERS = {
+    'ttv_list': (soup_ttv_list, news_parsers.parse_ttv_list),
+    'ttv_article': (soup_ttv_article, news_parsers.parse_ttv_article),
+    'setn_article': (lambda text: soup_setn_article(FIXTURE_LINK, text),
+                     lambda text: news_parsers.parse_setn_article(FIXTURE_LINK, text)),
+    'ebc_list': (soup_ebc_list, news_parsers.parse_ebc_list),
+    'ebc_article': (soup_ebc_article, news_parsers.parse_ebc_article),
+}
+
+
+def load_fixtures(fixture_dir, kind):
+    """
+    輸入：fixture_dir、kind (PARSERS 的種類)
+    輸出：[(檔名, HTML), ...]
+    """
+    directory = os.path.join(fixture_dir, kind)
+    if not os.path.isdir(directory):
+        return []
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.html'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                fixtures.append((name, f.read()))
+    return fixtures
+
+
+def time_parser(parser, fixtures, repeat):
+    # 每頁平均毫秒數
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, text in fixtures:
+            parser(text)
+    return (time.perf_counter() - started) * 1000 / (repeat * len(fixtures))
+
+
+def run(fixture_dir, repeat):
+    # 回傳失敗數：沒有頁面的種類數與結果不同的頁面數
+    failures = 0
+    for kind, (reference, fast) in PARSERS.items():
+        fixtures = load_fixtures(fixture_dir, kind)
+        if not fixtures:
+            failures += 1
+            print(f'{kind:13} 沒有頁面 ({os.path.join(fixture_dir, kind)})')
+            continue
+        for name, text in fixtures:
+            expected, actual = reference(text), fast(text)
+            if expected != actual:
+                failures += 1
+                print(f'{kind}/{name} 結果不同:\n  原本: {expected}\n  新的: {actual}')
+        reference_ms = time_parser(reference, fixtures, repeat)
+        fast_ms = time_parser(fast, fixtures, repeat)
+        print(f'{kind:13} {len(fixtures):3} 頁  BeautifulSoup {reference_ms:7.2f} ms/頁  '
+              f'news_parsers {fast_ms:7.2f} ms/頁  {reference_ms / fast_ms:5.1f}x')
+    return failures
+
+
+def save(fixture_dir, kind, url, data, name):
+    """
+    輸入：fixture_dir、kind、url、data (POST 表單欄位 list of 'key=value'，沒有時以 GET 取得)、name (檔名，預設由網址產生)
+    輸出：保存的檔案路徑
+    """
+    headers = {'user-agent': USER_AGENT}
+    if data:
+        response = requests.post(url, headers=headers, data=dict(item.split('=', 1) for item in data), timeout=30)
+    else:
+        response = requests.get(url, headers=headers, timeout=30)
+    response.raise_for_status()
+
+    directory = os.path.join(fixture_dir, kind)
+    os.makedirs(directory, exist_ok=True)
+    if not name:
+        name = re.sub(r'[^\w.-]+', '_', url.split('://', 1)[-1] + ('_' + '_'.join(data) if data else ''))[:120]
+    path = os.path.join(directory, name if name.endswith('.html') else name + '.html')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--fixtures', default=FIXTURE_DIR, help='頁面目錄')
+    save_parser = subparsers.add_parser('save', help='下載頁面保存為測試頁面')
+    save_parser.add_argument('kind', choices=PARSERS)
+    save_parser.add_argument('url')
+    save_parser.add_argument('--data', action='append', help='POST 表單欄位 key=value（東森清單）')
+    save_parser.add_argument('--name', help='檔名')
+    args = parser.parse_args()
+
+    if args.command == 'save':
+        print(save(args.fixtures, args.kind, args.url, args.data, args.name))
+        return
+    sys.exit(1 if run(args.fixtures, args.repeat) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+相關新聞索引基準測試：以合成向量建立 N 篇的索引，量測 top-k 查詢延遲
+
+每篇 MAX_TERMS 個特徵，特徵出現頻率依 Zipf 分布（少數特徵出現在大量文章中，倒排列很長）
+只量測向量查詢 (IndexState.top_k)，不含讀取資料庫與計算查詢向量（與索引大小無關）
+
+用法：python benchmarks/bench_related.py [--docs 1000000] [--queries 200] [--zipf 1.2] [--k 30]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from related_index import CURRENT_FILE, MAX_POSTINGS_PER_TERM, MAX_TERMS, NUM_FEATURES, IndexState, write_index  # noqa: E402
+
+
+def synthetic_vectors(docs, zipf, seed=1):
+    """
+    輸入：docs (篇數)、zipf (Zipf 分布參數，越小常見特徵越集中)、seed
+    輸出：(row_features, row_weights, df)
+    """
+    rng = np.random.default_rng(seed)
+    permutation = rng.permutation(NUM_FEATURES).astype(np.int32)
+    ranks = rng.zipf(zipf, size=(docs, MAX_TERMS)) % NUM_FEATURES
+    features = permutation[ranks]
+    weights = rng.random((docs, MAX_TERMS), dtype=np.float32) + 0.1
+    weights /= np.linalg.norm(weights, axis=1, keepdims=True)
+    df = np.bincount(features.ravel(), minlength=NUM_FEATURES).astype(np.int32)
+    return list(features), list(weights), df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--zipf', type=float, default=1.2)
+    parser.add_argument('--k', type=int, default=30)
+    args = parser.parse_args()
+
+    t1 = time.perf_counter()
+    row_features, row_weights, df = synthetic_vectors(args.docs, args.zipf)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_index(tmp, np.arange(1, args.docs + 1), row_features, row_weights, df, args.docs, 0)
+        print(f'建立 {args.docs} 篇索引: {time.perf_counter() - t1:.1f} 秒')
+
+        with open(os.path.join(tmp, CURRENT_FILE)) as f:
+            index = IndexState.load(tmp, f.read().strip())
+        rng = np.random.default_rng(2)
+        latencies = []
+        postings = []
+        for row in rng.integers(0, args.docs, args.queries):
+            q_features, q_weights = row_features[row], row_weights[row]
+            lengths = index.term_ptr[q_features + 1] - index.term_ptr[q_features]
+            postings.append(int(np.minimum(lengths, MAX_POSTINGS_PER_TERM).sum()))
+            t1 = time.perf_counter()
+            index.top_k(q_features, q_weights, args.k, exclude=row + 1)
+            latencies.append((time.perf_counter() - t1) * 1000)
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f'查詢 {args.queries} 次 (k={args.k}): p50 {statistics.median(latencies):.2f} ms, '
+              f'p95 {p95:.2f} ms, max {latencies[-1]:.2f} ms, 平均走訪 {statistics.mean(postings):.0f} 個倒排項目')
+
+
+if __name__ == '__main__':
+    main()
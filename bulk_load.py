@@ -0,0 +1,160 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+from db_pool import DEFAULT_PRAGMAS, apply_pragmas
+from migrations import migrate_db, rebuild_search_index
+from web_nain import name_cache, validate_news_items, remove_duplicate_news, ingest_news_batch
+
+# 離線批次匯入：讀取 NDJSON（每行一篇，格式同 POST /news 的 news object），直接寫入資料庫
+# - 每 chunk_size 篇為一個交易，驗證、去重與寫入沿用 POST /news 的函式，產生的資料列與關聯完全相同
+# - --drop-indexes：匯入前移除新聞與關聯表的非唯一索引及全文檢索觸發程序，匯入後重建
+#   （唯一索引用於去重與名稱 upsert，不移除）
+# 寫入時在同一個交易中更新 cache_scope（同 POST /news），執行中 web 伺服器的回應快取隨之失效
+
+LOAD_CHUNK_SIZE = 1000
+
+# 匯入時可暫時移除的索引所屬資料表
+SUSPENDABLE_INDEX_TABLES = ('news', 'news_keyword', 'news_category')
+# 匯入新聞、關鍵字時觸發的全文檢索觸發程序
+SUSPENDABLE_TRIGGERS = ('news_fts_insert', 'keyword_fts_insert')
+
+
+def iter_ndjson_chunks(stream, chunk_size, errors):
+    """
+    輸入：stream (文字檔案)、chunk_size (int)、errors (list，記錄無法解析的行)
+    輸出：generator，每次產生最多 chunk_size 篇新聞 (list of dict)
+    """
+    chunk = []
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            errors.append({'line': line_number, 'error': f'Invalid JSON: {e}'})
+            continue
+        if not isinstance(data, dict):
+            errors.append({'line': line_number, 'error': 'Each line should be a news object'})
+            continue
+        chunk.append(data)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def suspend_indexes(conn):
+    """
+    輸入：conn
+    輸出：被移除物件的建立語法 (list of str)；移除新聞與關聯表的非唯一索引及全文檢索觸發程序
+    """
+    placeholders = ', '.join(['?'] * len(SUSPENDABLE_INDEX_TABLES))
+    indexes = conn.execute(
+        f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name IN ({placeholders}) AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%'
+        """,
+        SUSPENDABLE_INDEX_TABLES
+    ).fetchall()
+    placeholders = ', '.join(['?'] * len(SUSPENDABLE_TRIGGERS))
+    triggers = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})",
+        SUSPENDABLE_TRIGGERS
+    ).fetchall()
+
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    conn.commit()
+    return [sql for _, sql in indexes + triggers]
+
+
+def restore_indexes(conn, statements):
+    """
+    輸入：conn、statements (suspend_indexes 的回傳值)
+    輸出：無；重建索引與觸發程序，並重建全文檢索索引
+    """
+    for sql in statements:
+        conn.execute(sql)
+    if any(sql.lstrip().upper().startswith('CREATE TRIGGER') for sql in statements):
+        rebuild_search_index(conn.cursor())
+    conn.commit()
+
+
+def bulk_load(conn, chunks, progress=None):
+    """
+    輸入：conn、chunks (逐批的新聞)、progress (callable(已處理篇數, 成功篇數, 秒數)，每批呼叫一次)
+    輸出：(成功篇數, 錯誤 list)；每批為一個交易
+    """
+    started = time.perf_counter()
+    loaded = 0
+    processed = 0
+    errors = []
+    cursor = conn.cursor()
+    for chunk in chunks:
+        results = {'success': [], 'errors': []}
+        insert_data = validate_news_items(chunk, results)
+        final_data = remove_duplicate_news(cursor, insert_data, results) if insert_data else []
+        if final_data:
+            ingest_news_batch(conn, final_data, results)
+        loaded += len(results['success'])
+        processed += len(chunk)
+        errors.extend(results['errors'])
+        if progress:
+            progress(processed, loaded, time.perf_counter() - started)
+    return loaded, errors
+
+
+def main():
+    # 用法：python bulk_load.py dump.ndjson [--database news.db] [--chunk-size 1000] [--drop-indexes] [--errors errors.ndjson]
+    parser = argparse.ArgumentParser(description='由 NDJSON 離線批次匯入新聞')
+    parser.add_argument('source', help="NDJSON 檔案，'-' 為 stdin")
+    parser.add_argument('--database', default='news.db')
+    parser.add_argument('--chunk-size', type=int, default=LOAD_CHUNK_SIZE)
+    parser.add_argument('--drop-indexes', action='store_true', help='匯入前移除非唯一索引，匯入後重建')
+    parser.add_argument('--errors', help='錯誤輸出檔 (NDJSON)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    conn.row_factory = sqlite3.Row
+    apply_pragmas(conn, DEFAULT_PRAGMAS)
+    migrate_db(conn)
+    name_cache.warm(conn)
+
+    def progress(processed, loaded, elapsed):
+        print(f'已處理 {processed} 篇, 寫入 {loaded} 篇, {loaded / elapsed:.0f} 篇/秒', file=sys.stderr)
+
+    stream = sys.stdin if args.source == '-' else open(args.source, encoding='utf-8')
+    parse_errors = []
+    statements = suspend_indexes(conn) if args.drop_indexes else []
+    started = time.perf_counter()
+    try:
+        loaded, errors = bulk_load(conn, iter_ndjson_chunks(stream, args.chunk_size, parse_errors), progress)
+    finally:
+        load_seconds = time.perf_counter() - started
+        if statements:
+            t1 = time.perf_counter()
+            restore_indexes(conn, statements)
+            print(f'重建索引 {time.perf_counter() - t1:.1f} 秒', file=sys.stderr)
+        if stream is not sys.stdin:
+            stream.close()
+
+    total_seconds = time.perf_counter() - started
+    errors = parse_errors + errors
+    print(f'寫入 {loaded} 篇, 錯誤 {len(errors)} 筆, 匯入 {load_seconds:.1f} 秒, 總計 {total_seconds:.1f} 秒, '
+          f'{loaded / total_seconds if total_seconds else 0:.0f} 篇/秒')
+    if args.errors:
+        with open(args.errors, 'w', encoding='utf-8') as f:
+            for error in errors:
+                f.write(json.dumps(error, ensure_ascii=False) + '\n')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 爬蟲的分段管線：抓取 (I/O 執行緒) → 解析 (行程池) → 批次上傳
+# - 抓取由 FetchEngine 進行，同時連線數與各網站速率另外設定；完成的回應放入解析佇列後才釋放抓取的同時請求數，
+#   解析佇列已滿時抓取與 submit 都會等待，呼叫端不會在下游停滯時持續認領工作
+# - 解析在 ProcessPoolExecutor 中執行，不受 GIL 限制，行程數依 CPU 核心數設定
+#   （解析函式與參數需可 pickle，使用 news_parsers 中的模組層級函式）
+# - 解析完成的結果放入上傳佇列，上傳執行緒累積 batch_size 筆或等待 batch_wait 秒後整批上傳
+# 解析佇列有上限、解析中與待上傳的筆數也有上限，下游較慢時上游會等待；stats() 回報各階段的佇列深度
+
+PIPELINE_QUEUE_SIZE = 100
+UPLOAD_BATCH_SIZE = 20
+UPLOAD_BATCH_WAIT = 1.0
+
+_STOP = object()
+
+
+class CrawlPipeline:
+    """
+    輸入：
+        engine: FetchEngine
+        upload: callable([(context, 解析結果), ...])，在上傳執行緒中整批呼叫
+        on_error: callable(context, exception)，抓取、解析或上傳失敗時逐筆呼叫
+        parse_workers: 解析行程數，預設為 CPU 核心數
+        batch_size / batch_wait: 每批最多筆數、第一筆進入後最多等待秒數
+        queue_size: 抓取完成、等待解析的佇列上限
+    """
+
+    def __init__(self, engine, upload, on_error=None, parse_workers=None,
+                 batch_size=UPLOAD_BATCH_SIZE, batch_wait=UPLOAD_BATCH_WAIT, queue_size=PIPELINE_QUEUE_SIZE):
+        self.engine = engine
+        self.upload = upload
+        self.on_error = on_error or (lambda context, error: None)
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+        self._fetched = queue.Queue(queue_size)  # (job, response 或 exception)
+        self._parsed = queue.Queue()             # (context, 解析結果)，筆數由 _parse_slots 限制
+        # 解析中與待上傳的筆數上限；上傳取出後才釋放，上傳較慢時解析會暫停
+        self._parse_slots = threading.BoundedSemaphore(self.parse_workers * 2 + batch_size)
+        self._pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._counts = {'submitted': 0, 'fetching': 0, 'parsing': 0, 'uploading': 0, 'uploaded': 0, 'failed': 0}
+        self._pending = 0
+
+        self._threads = [
+            threading.Thread(target=self._dispatch_parse, name='pipeline-parse', daemon=True),
+            threading.Thread(target=self._upload_batches, name='pipeline-upload', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._counts[key] += delta
+
+    def _finish(self, failed=0, uploaded=0):
+        with self._lock:
+            self._counts['failed'] += failed
+            self._counts['uploaded'] += uploaded
+            self._pending -= failed + uploaded
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _fail(self, context, error):
+        try:
+            self.on_error(context, error)
+        finally:
+            self._finish(failed=1)
+
+    def submit(self, method, url, parser, args=(), context=None, **kwargs):
+        """
+        輸入：
+            method、url、kwargs: 抓取的請求 (同 FetchEngine.submit)
+            parser: 解析函式，以 parser(*args, response.text) 在行程池中呼叫
+            context: 傳回 upload / on_error 的資料（例如待爬清單的 id 與租約）
+        輸出：無；同時抓取數已達上限（包含等待放入解析佇列的回應）時等待
+        """
+        with self._lock:
+            self._pending += 1
+            self._counts['submitted'] += 1
+            self._counts['fetching'] += 1
+        job = (parser, tuple(args), context)
+        try:
+            self.engine.submit(method, url, on_done=lambda f: self._on_fetched(job, f), **kwargs)
+        except Exception as e:
+            self._count(fetching=-1)
+            self._fail(context, e)
+
+    def _on_fetched(self, job, future):
+        # 在抓取執行緒中、釋放同時請求數之前執行；解析佇列已滿時等待，抓取執行緒與新的 submit 因此暫停
+        error = future.exception()
+        self._fetched.put((job, error if error is not None else future.result()))
+        self._count(fetching=-1)
+
+    def _dispatch_parse(self):
+        while True:
+            item = self._fetched.get()
+            if item is _STOP:
+                return
+            (parser, args, context), response = item
+            if isinstance(response, BaseException):
+                self._fail(context, response)
+                continue
+            self._parse_slots.acquire()
+            self._count(parsing=1)
+            try:
+                future = self._pool.submit(parser, *args, response.text)
+            except Exception as e:
+                self._parse_slots.release()
+                self._count(parsing=-1)
+                self._fail(context, e)
+                continue
+            future.add_done_callback(lambda f, context=context: self._on_parsed(context, f))
+
+    def _on_parsed(self, context, future):
+        self._count(parsing=-1)
+        error = future.exception()
+        if error is not None:
+            self._parse_slots.release()
+            self._fail(context, error)
+            return
+        self._parsed.put((context, future.result()))
+
+    def _upload_batches(self):
+        while True:
+            item = self._parsed.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.batch_wait
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._parsed.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            for _ in batch:
+                self._parse_slots.release()
+
+            self._count(uploading=len(batch))
+            error = None
+            try:
+                self.upload(batch)
+            except Exception as e:
+                error = e
+            self._count(uploading=-len(batch))
+            if error is None:
+                self._finish(uploaded=len(batch))
+            else:
+                for context, _ in batch:
+                    self._fail(context, error)
+            if stop:
+                return
+
+    def stats(self):
+        """
+        輸入：無
+        輸出：各階段的數量：抓取中、待解析佇列、解析中、待上傳佇列、上傳中，以及累計送出、完成與失敗數
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            'fetching': counts['fetching'],
+            'parse_queue': self._fetched.qsize(),
+            'parsing': counts['parsing'],
+            'upload_queue': self._parsed.qsize(),
+            'uploading': counts['uploading'],
+            'submitted': counts['submitted'],
+            'uploaded': counts['uploaded'],
+            'failed': counts['failed'],
+        }
+
+    def join(self, timeout=None):
+        """
+        輸入：timeout (秒，None 為不限)
+        輸出：是否所有已送出的工作都已上傳或失敗
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self):
+        """
+        輸入：無
+        輸出：無；等待所有工作完成後停止各階段與行程池
+        """
+        self.join()
+        self._fetched.put(_STOP)
+        self._parsed.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._pool.shutdown(wait=True)
+
+
+def report_stats(pipeline, interval, stop_event, output=print):
+    """
+    輸入：pipeline、interval (秒)、stop_event (threading.Event)、output (callable(str))
+    輸出：無；每 interval 秒輸出一次各階段佇列深度，直到 stop_event 被設定
+    """
+    while not stop_event.wait(interval):
+        stats = pipeline.stats()
+        output('管線 ' + ', '.join(f'{key}={value}' for key, value in stats.items()))
@@ -0,0 +1,113 @@
+import queue
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+# SQLite 連線池
+# 寫入連線啟用 WAL，讀取連線以唯讀模式開啟，讀寫互不阻塞
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',       # 寫入時不阻塞讀取
+    'synchronous': 'normal',     # WAL 下 normal 即可保證一致性
+    'cache_size': '-20000',      # 負數為 KiB，約 20MB
+    'mmap_size': '268435456',    # 256MB
+    'temp_store': 'memory',
+    'busy_timeout': '5000',      # 等待寫入鎖的毫秒數
+}
+
+# 唯讀連線不可（也不需要）設定的 pragma
+WRITE_ONLY_PRAGMAS = {'journal_mode', 'synchronous'}
+
+_PRAGMA_VALUE_RE = re.compile(r'^-?[\w]+$')
+
+
+def apply_pragmas(conn, pragmas):
+    """
+    輸入：conn (sqlite3 連線)、pragmas (dict)
+    輸出：無；依序執行 PRAGMA 設定
+    """
+    for name, value in pragmas.items():
+        value = str(value)
+        if not _PRAGMA_VALUE_RE.match(name) or not _PRAGMA_VALUE_RE.match(value):
+            raise ValueError(f'Invalid pragma: {name}={value}')
+        conn.execute(f'PRAGMA {name} = {value}')
+
+
+class ConnectionPool:
+    """
+    固定大小的連線池，連線可跨執行緒借用
+    輸入：database (str)、size (int)、readonly (bool)、pragmas (dict)
+    """
+
+    def __init__(self, database, size=8, readonly=False, pragmas=None):
+        self.database = database
+        self.size = size
+        self.readonly = readonly
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        if readonly:
+            self.pragmas = {k: v for k, v in self.pragmas.items() if k not in WRITE_ONLY_PRAGMAS}
+            self.pragmas['query_only'] = '1'
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """
+        輸入：無
+        輸出：新的 sqlite3 連線（已套用 pragma），不經過連線池
+        """
+        if self.readonly:
+            uri = Path(self.database).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.database, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def acquire(self, timeout=None):
+        """
+        輸入：timeout (秒)，連線池已滿時等待歸還的時間，None 為不限
+        輸出：sqlite3 連線；timeout 秒內沒有連線歸還時拋出 queue.Empty
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self.connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=timeout)
+
+    def release(self, conn):
+        """
+        輸入：conn (由 acquire 取得的連線)
+        輸出：無；回滾未結束的交易後歸還
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        """
+        輸入：無
+        輸出：無；關閉所有閒置連線
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
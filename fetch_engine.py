@@ -0,0 +1,129 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+# 爬蟲用的並行抓取引擎
+# - 每個 host 各自一個 token bucket，限制每秒請求數
+# - 同時進行中的請求數有上限（送出時超過上限會等待）
+# - 連線錯誤、429、5xx 以指數退避重試
+
+
+class TokenBucket:
+    """
+    輸入：rate (每秒補充的 token 數)、burst (最多累積的 token 數)
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        輸入：無
+        輸出：無；取得一個 token，不足時等待
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchEngine:
+    """
+    輸入：
+        max_in_flight: 同時進行中的請求上限
+        host_limits: {host: (rate, burst)}，未列出的 host 使用 default_limit
+        default_limit: (rate, burst)
+        max_retries: 重試次數
+        backoff: 第一次重試前等待秒數，之後每次加倍
+        session: 發送請求用的物件（需有 request 方法），預設為 requests
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_in_flight=8, host_limits=None, default_limit=(0.5, 2),
+                 max_retries=3, backoff=2.0, session=None):
+        self.host_limits = dict(host_limits or {})
+        self.default_limit = default_limit
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = session or requests
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, url):
+        host = urlsplit(url).hostname
+        with self._lock:
+            if host not in self._buckets:
+                rate, burst = self.host_limits.get(host, self.default_limit)
+                self._buckets[host] = TokenBucket(rate, burst)
+            return self._buckets[host]
+
+    def _request(self, method, url, kwargs):
+        bucket = self._bucket(url)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            if response.status_code in self.RETRY_STATUS and attempt < self.max_retries:
+                time.sleep(self._retry_delay(attempt, response.headers.get('Retry-After')))
+                continue
+            return response
+
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        return self.backoff * (2 ** attempt) * random.uniform(0.8, 1.2)
+
+    def submit(self, method, url, on_done=None, **kwargs):
+        """
+        輸入：method (str)、url (str)、on_done (callable(future)，選填)、kwargs (requests 參數)
+        輸出：Future，結果為 requests.Response；進行中的請求已達上限時等待
+        on_done 在請求完成後、釋放同時請求數之前呼叫；on_done 等待時（例如下游佇列已滿）不會送出新的請求
+        """
+        self._in_flight.acquire()
+        try:
+            future = self._executor.submit(self._request, method, url, kwargs)
+        except Exception:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda f: self._finish(f, on_done))
+        return future
+
+    def _finish(self, future, on_done):
+        try:
+            if on_done is not None:
+                on_done(future)
+        finally:
+            self._in_flight.release()
+
+    def fetch(self, method, url, **kwargs):
+        """
+        輸入：同 submit
+        輸出：requests.Response；在呼叫端執行緒等待結果
+        """
+        return self.submit(method, url, **kwargs).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 共用 HTTP client
+# - 以 requests.Session 保持連線 (keep-alive)，每個 host 各自一個連線池
+# - 選用的磁碟快取：記錄 ETag / Last-Modified，下次以條件式請求詢問，304 時直接回傳快取內容
+# - 快取總大小超過上限時，刪除最久未使用的項目
+
+
+class HttpClient:
+    """
+    輸入：
+        cache_dir: 快取目錄，None 表示不使用快取
+        max_cache_bytes: 快取大小上限
+        pool_connections: 保留連線池的 host 數
+        pool_maxsize: 每個 host 的連線數上限
+    """
+
+    def __init__(self, cache_dir=None, max_cache_bytes=200 * 1024 * 1024, pool_connections=16, pool_maxsize=16):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._cache_bytes = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._cache_bytes = sum(size for _, _, size in self._cache_entries())
+
+    def request(self, method, url, cache=False, **kwargs):
+        """
+        輸入：method、url、cache (bool，是否使用條件式快取，只對 GET 有效)、kwargs (requests 參數)
+        輸出：requests.Response；命中快取時 response.from_cache 為 True
+        """
+        if not (cache and self.cache_dir and method.upper() == 'GET'):
+            response = self.session.request(method, url, **kwargs)
+            response.from_cache = False
+            return response
+
+        key = self._cache_key(url, kwargs.get('params'))
+        meta = self._load_meta(key)
+        if meta:
+            headers = dict(kwargs.pop('headers', None) or {})
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+            kwargs['headers'] = headers
+
+        response = self.session.request(method, url, **kwargs)
+        if response.status_code == 304 and meta:
+            cached = self._load_response(key, meta)
+            if cached is not None:
+                with self._lock:
+                    self.stats['hits'] += 1
+                return cached
+
+        with self._lock:
+            self.stats['misses'] += 1
+        response.from_cache = False
+        if response.status_code == 200 and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            self._store(key, url, response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def _cache_key(self, url, params):
+        raw = json.dumps([url, sorted((params or {}).items())], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.json', base + '.body'
+
+    def _load_meta(self, key):
+        meta_path, _ = self._paths(key)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_response(self, key, meta):
+        """
+        輸入：key、meta
+        輸出：由快取內容組成的 requests.Response，快取檔案遺失時為 None
+        """
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(body_path, 'rb') as f:
+                body = f.read()
+            os.utime(meta_path)  # 記錄最近使用時間，供淘汰排序
+        except OSError:
+            return None
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.headers.update(meta.get('headers', {}))
+        response.url = meta['url']
+        response.encoding = meta.get('encoding')
+        response.from_cache = True
+        return response
+
+    def _store(self, key, url, response):
+        meta_path, body_path = self._paths(key)
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': response.encoding,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in ('content-type', 'etag', 'last-modified')},
+            'stored_at': time.time(),
+        }
+        body = response.content
+        with self._lock:
+            old_size = self._entry_size(key)
+            for path, data, mode in ((body_path, body, 'wb'), (meta_path, json.dumps(meta), 'w')):
+                tmp_path = f'{path}.{threading.get_ident()}.tmp'
+                with open(tmp_path, mode) as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self._cache_bytes += self._entry_size(key) - old_size
+            self.stats['stores'] += 1
+            self._evict()
+
+    def _entry_size(self, key):
+        size = 0
+        for path in self._paths(key):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def _cache_entries(self):
+        """
+        輸出：[(key, 最近使用時間, 大小), ...]
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            meta_path, _ = self._paths(key)
+            try:
+                used_at = os.path.getmtime(meta_path)
+            except OSError:
+                continue
+            entries.append((key, used_at, self._entry_size(key)))
+        return entries
+
+    def _evict(self):
+        # 需持有 self._lock
+        # 超過上限時一次降到 90%，避免每次寫入都掃描目錄
+        if self._cache_bytes <= self.max_cache_bytes:
+            return
+        target = self.max_cache_bytes * 0.9
+        for key, _, size in sorted(self._cache_entries(), key=lambda entry: entry[1]):
+            if self._cache_bytes <= target:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._cache_bytes -= size
+            self.stats['evictions'] += 1
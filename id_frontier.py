@@ -0,0 +1,96 @@
+import threading
+
+# 依流水號 ID 爬取新聞（三立 NewsID）的前緣搜尋
+# - 由上次確認的 ID 往後，每次同時探測 window 個連續 ID
+# - 整個視窗都不存在時，以指數間距同時探測後方的 ID，找到存在的位置後再以二分搜尋找出空缺後第一篇，
+#   空缺中的 ID 視為已刪除；指數探測到 max_jump 仍不存在即視為到達最新
+# - 探測結果會保留，跳躍與二分搜尋中已探測過的 ID 不會重複請求
+# 回傳的最後確認 ID 以下皆已探測或判定為空缺，下次由其後繼續
+
+FRONTIER_WINDOW = 16
+FRONTIER_MAX_JUMP = 4096
+PROBE_SPAN = 3  # 跳躍與二分搜尋時每個位置探測的連續 ID 數（單篇可能被刪除）
+
+
+class IdFrontier:
+    """
+    輸入：
+        probe_many: callable(ids) → {id: 結果}，同時探測多個 ID，不存在的 ID 結果為 None
+        on_found: callable(id, 結果)，每個存在的 ID 只呼叫一次
+        window: 每次同時探測的 ID 數
+        max_jump: 整個視窗都不存在時向後搜尋的最大距離
+    """
+
+    def __init__(self, probe_many, on_found, window=FRONTIER_WINDOW, max_jump=FRONTIER_MAX_JUMP):
+        self.probe_many = probe_many
+        self.on_found = on_found
+        self.window = window
+        self.max_jump = max_jump
+        self._results = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def _probe(self, ids):
+        # 回傳存在的 ID (sorted list)；已探測過的 ID 使用保留的結果
+        with self._lock:
+            pending = [i for i in ids if i not in self._results]
+        if pending:
+            results = self.probe_many(pending)
+            with self._lock:
+                self.requests += len(pending)
+                for i in pending:
+                    self._results[i] = results.get(i)
+            for i in pending:
+                if results.get(i) is not None:
+                    self.on_found(i, results[i])
+        return sorted(i for i in ids if self._results.get(i) is not None)
+
+    def _spans(self, starts):
+        return [i for start in starts for i in range(start, start + PROBE_SPAN)]
+
+    def _find_next_live(self, start):
+        """
+        輸入：start (整個視窗都不存在的視窗起點)
+        輸出：start 之後第一個存在的 ID；max_jump 內都不存在時為 None
+        """
+        # 指數跳躍：同時探測 start + window * 2^k
+        points = []
+        distance = self.window
+        while distance <= self.max_jump:
+            points.append(start + distance)
+            distance *= 2
+        live = self._probe(self._spans(points))
+        if not live:
+            return None
+
+        # 二分搜尋：lo 之前皆不存在，hi 存在
+        hi = live[0]
+        lo = max([start + self.window] + [point + PROBE_SPAN for point in points if point + PROBE_SPAN <= hi])
+        while hi - lo > self.window:
+            mid = (lo + hi) // 2
+            live = self._probe(self._spans([mid]))
+            if live:
+                hi = live[0]
+            else:
+                lo = mid + PROBE_SPAN
+        return lo
+
+    def crawl(self, last_id, checkpoint=None):
+        """
+        輸入：last_id (上次確認的 ID)、checkpoint (callable(last_id)，確認的 ID 前進時呼叫，用於保存進度)
+        輸出：本次確認的最後一個存在的 ID（沒有新的 ID 時為原本的 last_id）
+        """
+        next_id = last_id + 1
+        while True:
+            live = self._probe(list(range(next_id, next_id + self.window)))
+            if live:
+                last_id = live[-1]
+                next_id += self.window
+                if checkpoint:
+                    checkpoint(last_id)
+                continue
+
+            next_live = self._find_next_live(next_id)
+            if next_live is None:
+                return last_id
+            next_id = next_live
@@ -0,0 +1,647 @@
+import re
+import sqlite3
+import sys
+from datetime import datetime
+
+from response_cache import ALL_SCOPES, bump_scopes
+
+# 資料庫版本管理
+# 每一筆 migration 為 (版本, 說明, 函式)，依版本順序執行，已執行的版本記錄在 schema_version 表
+# 新增 migration 時只能往後加，不可修改已發佈的版本
+
+
+def _m001_baseline(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立原始資料表（既有資料庫會略過）
+    """
+    # author 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS author (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 作者唯一識別碼
+        name VARCHAR(50) NOT NULL,            -- 作者姓名
+        notes TEXT                            -- 備註
+    );
+    ''')
+
+    # news 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS news (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
+        news_time DATETIME,                   -- 新聞時間
+        news_title VARCHAR(50) NOT NULL,      -- 新聞標題
+        news_content TEXT,                    -- 新聞內容
+        image_url TEXT,                       -- 圖片連結
+        news_url TEXT NOT NULL,               -- 新聞連結
+        source_website INTEGER NOT NULL,      -- 來源網站
+        author_id INTEGER,                    -- 作者
+        query_state INTEGER DEFAULT 0,        -- 查詢狀態 (0: 有清單沒內容, 1: 查詢中, 2: 有內容)
+        FOREIGN KEY(author_id) REFERENCES author(id)
+    );
+    ''')
+
+    # keyword 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS keyword (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 關鍵字唯一識別碼
+        name VARCHAR(50) NOT NULL             -- 關鍵字名稱
+    );
+    ''')
+
+    # news_keyword 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS news_keyword (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
+        news_id INTEGER NOT NULL,             -- 關聯新聞 ID
+        keyword_id INTEGER NOT NULL,          -- 關聯關鍵字 ID
+        FOREIGN KEY(news_id) REFERENCES news(id),
+        FOREIGN KEY(keyword_id) REFERENCES keyword(id)
+    );
+    ''')
+
+    # category 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS category (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 類別唯一識別碼
+        name VARCHAR(50) NOT NULL             -- 類別名稱
+    );
+    ''')
+
+    # news_category 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS news_category (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
+        news_id INTEGER NOT NULL,             -- 關聯新聞 ID
+        category_id INTEGER NOT NULL,         -- 關聯類別 ID
+        FOREIGN KEY(news_id) REFERENCES news(id),
+        FOREIGN KEY(category_id) REFERENCES category(id)
+    );
+    ''')
+
+    # ai_news 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ai_news (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,    -- 唯一識別碼
+        news_id INTEGER NOT NULL,                -- 關聯新聞 ID
+        ai_title VARCHAR(50),                    -- AI 標題
+        ai_sentiment_analysis INTEGER NOT NULL,  -- AI 語意分析 (0:中立、1:正面、2:負面)
+        ai_model INTEGER NOT NULL,               -- AI 模型 (1:gemma3:12b-it-qat、)
+        FOREIGN KEY(news_id) REFERENCES news(id)
+    );
+    ''')
+
+    # ai_news_keyword 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ai_news_keyword (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
+        ai_news_id INTEGER NOT NULL,          -- 關聯 AI 新聞 ID
+        keyword_id INTEGER NOT NULL,          -- 關聯關鍵字 ID
+        FOREIGN KEY(ai_news_id) REFERENCES ai_news(id),
+        FOREIGN KEY(keyword_id) REFERENCES keyword(id)
+    );
+    ''')
+
+    # ai_news_category 表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ai_news_category (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
+        ai_news_id INTEGER NOT NULL,          -- 關聯 AI 新聞 ID
+        category_id INTEGER NOT NULL,         -- 關聯類別 ID
+        FOREIGN KEY(ai_news_id) REFERENCES ai_news(id),
+        FOREIGN KEY(category_id) REFERENCES category(id)
+    );
+    ''')
+
+
+def _m002_hot_query_indexes(cursor):
+    """
+    輸入：cursor
+    輸出：無；合併重複資料後建立查詢用索引
+    注意：會刪除重複的 news 與 ai_news 列（關聯資料改掛到保留的列），刪除的 id 會輸出
+    """
+    # 同一個 news_url 只保留最早的一筆，其餘新聞的關聯與分析結果改掛到保留的新聞
+    cursor.execute('''
+    CREATE TEMP TABLE news_map AS
+    SELECT news.id AS old_id, keep.id AS new_id
+    FROM news
+    JOIN (SELECT news_url, MIN(id) AS id FROM news GROUP BY news_url) keep ON keep.news_url = news.news_url
+    WHERE news.id <> keep.id
+    ''')
+    for ref_table in ('news_keyword', 'news_category', 'ai_news'):
+        cursor.execute(f'''
+        UPDATE {ref_table}
+        SET news_id = (SELECT new_id FROM news_map WHERE old_id = {ref_table}.news_id)
+        WHERE news_id IN (SELECT old_id FROM news_map)
+        ''')
+
+    # 同一篇新聞同一個模型只保留最早的分析結果，其餘結果的類別、關鍵字改掛到保留的結果
+    cursor.execute('''
+    CREATE TEMP TABLE ai_news_map AS
+    SELECT ai_news.id AS old_id, keep.id AS new_id
+    FROM ai_news
+    JOIN (SELECT news_id, ai_model, MIN(id) AS id FROM ai_news GROUP BY news_id, ai_model) keep
+      ON keep.news_id = ai_news.news_id AND keep.ai_model = ai_news.ai_model
+    WHERE ai_news.id <> keep.id
+    ''')
+    for ref_table in ('ai_news_keyword', 'ai_news_category'):
+        cursor.execute(f'''
+        UPDATE {ref_table}
+        SET ai_news_id = (SELECT new_id FROM ai_news_map WHERE old_id = {ref_table}.ai_news_id)
+        WHERE ai_news_id IN (SELECT old_id FROM ai_news_map)
+        ''')
+
+    # 合併後保留的列上重複的關聯只留一筆
+    relations = [
+        ('news_keyword', 'news_id', 'keyword_id', 'news_map'),
+        ('news_category', 'news_id', 'category_id', 'news_map'),
+        ('ai_news_keyword', 'ai_news_id', 'keyword_id', 'ai_news_map'),
+        ('ai_news_category', 'ai_news_id', 'category_id', 'ai_news_map'),
+    ]
+    for ref_table, owner_column, entity_column, map_table in relations:
+        cursor.execute(f'''
+        DELETE FROM {ref_table}
+        WHERE {owner_column} IN (SELECT new_id FROM {map_table})
+          AND id NOT IN (
+            SELECT MIN(id) FROM {ref_table}
+            WHERE {owner_column} IN (SELECT new_id FROM {map_table})
+            GROUP BY {owner_column}, {entity_column}
+          )
+        ''')
+
+    for table, map_table in (('ai_news', 'ai_news_map'), ('news', 'news_map')):
+        merged = cursor.execute(f'SELECT old_id, new_id FROM {map_table} ORDER BY old_id').fetchall()
+        if merged:
+            print(f'migration 2: 刪除重複的 {table} {len(merged)} 筆 (刪除的 id -> 保留的 id):',
+                  ', '.join(f'{old_id}->{new_id}' for old_id, new_id in merged))
+        cursor.execute(f'DELETE FROM {table} WHERE id IN (SELECT old_id FROM {map_table})')
+    cursor.execute('DROP TABLE ai_news_map')
+    cursor.execute('DROP TABLE news_map')
+
+    # check_existing_news_batch：news_url IN (...)
+    cursor.execute('CREATE UNIQUE INDEX idx_news_url ON news (news_url)')
+    # fetch_waiting_news：query_state + source_website 篩選、news_time 排序，含 news_url 為覆蓋索引
+    cursor.execute('CREATE INDEX idx_news_wait_query ON news (query_state, source_website, news_time, news_url)')
+    # fetch_waiting_ai_news：query_state = 2 依 news_time 排序
+    cursor.execute('CREATE INDEX idx_news_state_time ON news (query_state, news_time)')
+    # /api/ai_news：依 news_time 排序（可再依 source_website 篩選），再以 idx_ai_news_news_model 比對模型
+    cursor.execute('CREATE INDEX idx_news_time ON news (news_time)')
+    cursor.execute('CREATE INDEX idx_news_source_time ON news (source_website, news_time)')
+    # fetch_waiting_ai_news 的 LEFT JOIN、ai_news_detail 的 news_id 查詢
+    cursor.execute('CREATE UNIQUE INDEX idx_ai_news_news_model ON ai_news (news_id, ai_model)')
+
+    # get_or_create 名稱查詢
+    cursor.execute('CREATE INDEX idx_author_name ON author (name)')
+    cursor.execute('CREATE INDEX idx_keyword_name ON keyword (name)')
+    cursor.execute('CREATE INDEX idx_category_name ON category (name)')
+
+    # 關聯表查詢
+    cursor.execute('CREATE INDEX idx_news_keyword_news ON news_keyword (news_id, keyword_id)')
+    cursor.execute('CREATE INDEX idx_news_category_news ON news_category (news_id, category_id)')
+    cursor.execute('CREATE INDEX idx_ai_news_keyword_ai_news ON ai_news_keyword (ai_news_id, keyword_id)')
+    cursor.execute('CREATE INDEX idx_ai_news_category_ai_news ON ai_news_category (ai_news_id, category_id)')
+
+
+def _m003_unique_names(cursor):
+    """
+    輸入：cursor
+    輸出：無；合併同名的作者、關鍵字、類別後，將名稱索引改為 UNIQUE
+    """
+    name_tables = [
+        ('author', [('news', 'author_id')]),
+        ('keyword', [('news_keyword', 'keyword_id'), ('ai_news_keyword', 'keyword_id')]),
+        ('category', [('news_category', 'category_id'), ('ai_news_category', 'category_id')]),
+    ]
+    for table, references in name_tables:
+        # 重複名稱對應到最小的 id
+        cursor.execute(f'''
+        CREATE TEMP TABLE name_map AS
+        SELECT t.id AS old_id, keep.id AS new_id
+        FROM {table} t
+        JOIN (SELECT name, MIN(id) AS id FROM {table} GROUP BY name) keep ON keep.name = t.name
+        WHERE t.id <> keep.id
+        ''')
+        for ref_table, ref_column in references:
+            cursor.execute(f'''
+            UPDATE {ref_table}
+            SET {ref_column} = (SELECT new_id FROM name_map WHERE old_id = {ref_table}.{ref_column})
+            WHERE {ref_column} IN (SELECT old_id FROM name_map)
+            ''')
+        cursor.execute(f'DELETE FROM {table} WHERE id IN (SELECT old_id FROM name_map)')
+        cursor.execute('DROP TABLE name_map')
+
+        cursor.execute(f'DROP INDEX IF EXISTS idx_{table}_name')
+        cursor.execute(f'CREATE UNIQUE INDEX idx_{table}_name ON {table} (name)')
+
+
+def _m004_crawl_leases(cursor):
+    """
+    輸入：cursor
+    輸出：無；新增爬取租約欄位 (query_state 新增 3: 爬取失敗)
+    """
+    cursor.execute('ALTER TABLE news ADD COLUMN lease_token TEXT')                           # 租約識別碼
+    cursor.execute('ALTER TABLE news ADD COLUMN lease_expires_at DATETIME')                  # 租約到期時間
+    cursor.execute('ALTER TABLE news ADD COLUMN crawl_attempts INTEGER NOT NULL DEFAULT 0')  # 已認領次數
+    # 過期租約回收：query_state = 1 依到期時間
+    cursor.execute('CREATE INDEX idx_news_lease ON news (query_state, lease_expires_at)')
+
+
+def _m005_ai_jobs(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立 AI 分析工作佇列
+    """
+    cursor.execute('''
+    CREATE TABLE ai_job (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
+        news_id INTEGER NOT NULL,             -- 關聯新聞 ID
+        ai_model INTEGER NOT NULL,            -- AI 模型
+        state INTEGER NOT NULL DEFAULT 0,     -- 狀態 (0: 待處理, 1: 處理中, 2: 完成, 3: 失敗)
+        lease_token TEXT,                     -- 租約識別碼
+        lease_expires_at DATETIME,            -- 租約到期時間
+        attempts INTEGER NOT NULL DEFAULT 0,  -- 已認領次數
+        FOREIGN KEY(news_id) REFERENCES news(id)
+    );
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX idx_ai_job_news_model ON ai_job (news_id, ai_model)')
+    # 過期租約回收
+    cursor.execute('CREATE INDEX idx_ai_job_lease ON ai_job (state, lease_expires_at)')
+
+
+def _m006_ai_result_cache(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立 AI 分析結果快取（以正規化內容雜湊、模型、提示詞版本為鍵）
+    """
+    cursor.execute('''
+    CREATE TABLE ai_result_cache (
+        content_hash TEXT NOT NULL,           -- 正規化內容的 SHA-256
+        ai_model INTEGER NOT NULL,            -- AI 模型
+        prompt_version INTEGER NOT NULL,      -- 提示詞版本
+        result TEXT NOT NULL,                 -- 分析結果 (JSON)
+        hits INTEGER NOT NULL DEFAULT 0,      -- 命中次數
+        created_at DATETIME,                  -- 建立時間
+        last_used_at DATETIME,                -- 最近使用時間
+        PRIMARY KEY (content_hash, ai_model, prompt_version)
+    );
+    ''')
+    # 淘汰最久未使用的項目
+    cursor.execute('CREATE INDEX idx_ai_result_cache_used ON ai_result_cache (last_used_at)')
+
+
+# 全文檢索索引：(FTS5 表, 外部內容表, 欄位)
+SEARCH_INDEXES = [
+    ('news_fts', 'news', ('news_title', 'news_content')),
+    ('ai_news_fts', 'ai_news', ('ai_title',)),
+    ('keyword_fts', 'keyword', ('name',)),
+]
+
+
+def rebuild_search_index(cursor):
+    """
+    輸入：cursor
+    輸出：無；依目前資料重建全文檢索索引並合併索引區段
+    """
+    for fts_table, _, _ in SEARCH_INDEXES:
+        cursor.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('optimize')")
+
+
+def _m007_search_index(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立全文檢索索引 (FTS5 trigram，可比對任意 3 字以上的中文子字串) 與維護用的觸發程序
+    - news_fts：新聞標題、內容
+    - ai_news_fts：AI 標題
+    - keyword_fts：關鍵字名稱，再經由 news_keyword / ai_news_keyword 對應到新聞
+    皆以原資料表為外部內容表，不重複儲存文字；關聯表不需要觸發程序，寫入新聞的成本只多一次索引
+    """
+    for fts_table, content_table, columns in SEARCH_INDEXES:
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        cursor.execute(f'''
+        CREATE VIRTUAL TABLE {fts_table} USING fts5 (
+            {column_list}, content='{content_table}', content_rowid='id', tokenize='trigram'
+        )
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER {fts_table}_insert AFTER INSERT ON {content_table} BEGIN
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER {fts_table}_update AFTER UPDATE OF {column_list} ON {content_table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER {fts_table}_delete AFTER DELETE ON {content_table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+        ''')
+
+    # 關鍵字 → 新聞
+    cursor.execute('CREATE INDEX idx_news_keyword_keyword ON news_keyword (keyword_id, news_id)')
+    cursor.execute('CREATE INDEX idx_ai_news_keyword_keyword ON ai_news_keyword (keyword_id, ai_news_id)')
+
+    # 既有資料
+    rebuild_search_index(cursor)
+
+
+def _m008_story_clusters(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立近似重複新聞分群用的 MinHash / LSH 表與 news.cluster_id
+          （既有新聞先各自一群，以 python near_dup.py 重新分群）
+    """
+    cursor.execute('''
+    CREATE TABLE news_minhash (
+        news_id INTEGER PRIMARY KEY,          -- 關聯新聞 ID
+        signature BLOB NOT NULL,              -- MinHash 簽章 (32 個 uint32)
+        FOREIGN KEY(news_id) REFERENCES news(id)
+    );
+    ''')
+    cursor.execute('''
+    CREATE TABLE news_lsh (
+        band_hash INTEGER NOT NULL,           -- 簽章其中一段的雜湊值
+        news_id INTEGER NOT NULL,             -- 關聯新聞 ID
+        PRIMARY KEY (band_hash, news_id)
+    ) WITHOUT ROWID;
+    ''')
+
+    cursor.execute('ALTER TABLE news ADD COLUMN cluster_id INTEGER')  # 所屬群組（群組中第一篇新聞的 id）
+    cursor.execute('UPDATE news SET cluster_id = id')
+    # 同群組的新聞依時間排序（feed 合併、詳細頁列出同群新聞）
+    cursor.execute('CREATE INDEX idx_news_cluster ON news (cluster_id, news_time)')
+
+
+def _m009_ai_feed(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立 /api/ai_news 使用的反正規化 feed 表（每個模型、每篇已分析新聞一列），並由既有資料回填
+          由 insert_ai_news、update_news 在同一交易中維護
+    """
+    cursor.execute('''
+    CREATE TABLE ai_feed (
+        ai_model INTEGER NOT NULL,            -- AI 模型
+        news_id INTEGER NOT NULL,             -- 關聯新聞 ID
+        news_time DATETIME,                   -- 以下為 news / ai_news 的欄位複本
+        source_website INTEGER,
+        ai_title TEXT,
+        image_url TEXT,
+        news_url TEXT,
+        cluster_id INTEGER,
+        PRIMARY KEY (ai_model, news_id),
+        FOREIGN KEY(news_id) REFERENCES news(id)
+    );
+    ''')
+    cursor.execute('''
+    INSERT INTO ai_feed (ai_model, news_id, news_time, source_website, ai_title, image_url, news_url, cluster_id)
+    SELECT ai_news.ai_model, news.id, news.news_time, news.source_website, ai_news.ai_title,
+           news.image_url, news.news_url, news.cluster_id
+    FROM ai_news JOIN news ON news.id = ai_news.news_id
+    ''')
+    # feed 依模型（可再依來源）時間倒序分頁，各為單一索引範圍掃描
+    cursor.execute('CREATE INDEX idx_ai_feed_time ON ai_feed (ai_model, news_time, news_id)')
+    cursor.execute('CREATE INDEX idx_ai_feed_source_time ON ai_feed (ai_model, source_website, news_time, news_id)')
+    # collapse_clusters：同群組是否有更新的已分析新聞
+    cursor.execute('CREATE INDEX idx_ai_feed_cluster ON ai_feed (ai_model, cluster_id, news_time, news_id)')
+
+
+def _m010_rollups(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立 /api/trends 使用的彙總表（小時、日、月），並由既有分析結果計算
+    """
+    cursor.execute('''
+    CREATE TABLE rollup_keyword (
+        period TEXT NOT NULL,                 -- 粒度 (hour, day, month)
+        bucket TEXT NOT NULL,                 -- news_time 前綴
+        ai_model INTEGER NOT NULL,            -- AI 模型
+        keyword_id INTEGER NOT NULL,          -- 關鍵字
+        count INTEGER NOT NULL,               -- 出現次數
+        PRIMARY KEY (period, ai_model, bucket, keyword_id)
+    ) WITHOUT ROWID;
+    ''')
+    cursor.execute('''
+    CREATE TABLE rollup_category (
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        ai_model INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,         -- 類別
+        sentiment INTEGER NOT NULL,           -- 情感
+        count INTEGER NOT NULL,
+        PRIMARY KEY (period, ai_model, bucket, category_id, sentiment)
+    ) WITHOUT ROWID;
+    ''')
+    cursor.execute('''
+    CREATE TABLE rollup_sentiment (
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        ai_model INTEGER NOT NULL,
+        source_website INTEGER NOT NULL,      -- 來源網站
+        sentiment INTEGER NOT NULL,           -- 情感
+        count INTEGER NOT NULL,
+        PRIMARY KEY (period, ai_model, bucket, source_website, sentiment)
+    ) WITHOUT ROWID;
+    ''')
+    # 單一關鍵字、類別、來源的時間序列
+    cursor.execute('CREATE INDEX idx_rollup_keyword_series ON rollup_keyword (period, ai_model, keyword_id, bucket)')
+    cursor.execute('CREATE INDEX idx_rollup_category_series ON rollup_category (period, ai_model, category_id, bucket)')
+    cursor.execute('CREATE INDEX idx_rollup_sentiment_series ON rollup_sentiment (period, ai_model, source_website, bucket)')
+
+    # 由既有分析結果計算；SQL 固定為此版本的內容（不呼叫 rollups.rebuild_rollups，該模組之後的修改不影響此版本）
+    # 粒度與 bucket 長度：hour 'YYYY-MM-DD HH'、day 'YYYY-MM-DD'、month 'YYYY-MM'
+    for period, length in (('hour', 13), ('day', 10), ('month', 7)):
+        cursor.execute('''
+        INSERT INTO rollup_keyword (period, bucket, ai_model, keyword_id, count)
+        SELECT ?, substr(news.news_time, 1, ?), ai_news.ai_model, ai_news_keyword.keyword_id, COUNT(*)
+        FROM ai_news
+        JOIN news ON news.id = ai_news.news_id
+        JOIN ai_news_keyword ON ai_news_keyword.ai_news_id = ai_news.id
+        WHERE news.news_time IS NOT NULL
+        GROUP BY 2, 3, 4
+        ''', (period, length))
+        cursor.execute('''
+        INSERT INTO rollup_category (period, bucket, ai_model, category_id, sentiment, count)
+        SELECT ?, substr(news.news_time, 1, ?), ai_news.ai_model, ai_news_category.category_id,
+               ai_news.ai_sentiment_analysis, COUNT(*)
+        FROM ai_news
+        JOIN news ON news.id = ai_news.news_id
+        JOIN ai_news_category ON ai_news_category.ai_news_id = ai_news.id
+        WHERE news.news_time IS NOT NULL
+        GROUP BY 2, 3, 4, 5
+        ''', (period, length))
+        cursor.execute('''
+        INSERT INTO rollup_sentiment (period, bucket, ai_model, source_website, sentiment, count)
+        SELECT ?, substr(news.news_time, 1, ?), ai_news.ai_model, news.source_website,
+               ai_news.ai_sentiment_analysis, COUNT(*)
+        FROM ai_news
+        JOIN news ON news.id = ai_news.news_id
+        WHERE news.news_time IS NOT NULL
+        GROUP BY 2, 3, 4, 5
+        ''', (period, length))
+
+
+def _m011_crawl_state(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立各來源、類別清單頁的爬取進度（上次看到的最新一篇）
+    """
+    cursor.execute('''
+    CREATE TABLE crawl_state (
+        source_website INTEGER NOT NULL,      -- 來源網站
+        category TEXT NOT NULL,               -- 清單類別
+        last_url TEXT,                        -- 上次爬取時清單中最新一篇的連結
+        last_time DATETIME,                   -- 該篇的新聞時間（清單沒有時間的來源為 NULL）
+        updated_at DATETIME,                  -- 更新時間
+        PRIMARY KEY (source_website, category)
+    ) WITHOUT ROWID;
+    ''')
+
+
+def _m012_crawl_frontier(cursor):
+    """
+    輸入：cursor
+    輸出：無；爬取進度新增流水號欄位（依 ID 爬取的來源記錄最後確認的 ID）
+    """
+    cursor.execute('ALTER TABLE crawl_state ADD COLUMN last_id INTEGER')  # 最後確認的新聞 ID
+
+
+def _m013_cache_scopes(cursor):
+    """
+    輸入：cursor
+    輸出：無；建立回應快取的資料範圍序號表（見 response_cache），全域序號從 0 開始
+    """
+    cursor.execute('''
+    CREATE TABLE cache_scope (
+        scope TEXT PRIMARY KEY,   -- 資料範圍，例如 feed:<model>、news:<id>；'' 為全域序號、'*' 為全部
+        seq INTEGER NOT NULL      -- 最後一次寫入時的全域序號
+    ) WITHOUT ROWID;
+    ''')
+    cursor.execute("INSERT INTO cache_scope (scope, seq) VALUES ('', 0)")
+
+
+# 此版本之後，每個 migration 在同一個交易中讓所有回應快取失效
+CACHE_SCOPE_VERSION = 13
+
+MIGRATIONS = [
+    (1, 'baseline schema', _m001_baseline),
+    (2, 'indexes for hot queries', _m002_hot_query_indexes),
+    (3, 'unique author/keyword/category names', _m003_unique_names),
+    (4, 'crawl leases', _m004_crawl_leases),
+    (5, 'ai job queue', _m005_ai_jobs),
+    (6, 'ai result cache', _m006_ai_result_cache),
+    (7, 'full-text search index', _m007_search_index),
+    (8, 'near-duplicate story clusters', _m008_story_clusters),
+    (9, 'denormalized ai feed', _m009_ai_feed),
+    (10, 'trend rollups', _m010_rollups),
+    (11, 'crawl high-water marks', _m011_crawl_state),
+    (12, 'crawl id frontier', _m012_crawl_frontier),
+    (13, 'response cache scopes', _m013_cache_scopes),
+]
+
+
+def get_schema_version(conn):
+    """
+    輸入：conn (sqlite3 連線)
+    輸出：目前資料庫版本 (int)，未建立版本表時為 0
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,  -- 版本
+        description TEXT,             -- 說明
+        applied_at DATETIME           -- 執行時間
+    );
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate_db(conn):
+    """
+    輸入：conn (sqlite3 連線)
+    輸出：本次執行的版本 (list of int)；每個版本在各自的交易中執行，失敗時回滾該版本
+    """
+    current = get_schema_version(conn)
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN')
+            migration(cursor)
+            if version >= CACHE_SCOPE_VERSION:
+                bump_scopes(cursor, [ALL_SCOPES])
+            cursor.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def explain_query_plan(conn, sql, params=()):
+    """
+    輸入：conn, sql (str), params (tuple)
+    輸出：EXPLAIN QUERY PLAN 的說明文字 (list of str)
+    """
+    return [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+
+# 全文檢索虛擬表以 MATCH 查詢時顯示為 SCAN ... VIRTUAL TABLE INDEX 0:M...，不是全表掃描
+_FTS_MATCH_RE = re.compile(r'VIRTUAL TABLE INDEX \d+:\S')
+
+
+def is_full_scan(detail):
+    """
+    輸入：detail (EXPLAIN QUERY PLAN 的一行說明)
+    輸出：是否為未使用索引的全表掃描或暫存排序
+    """
+    if 'TEMP B-TREE' in detail:
+        return True
+    return detail.startswith('SCAN') and 'USING' not in detail and not _FTS_MATCH_RE.search(detail)
+
+
+def find_full_scans(conn, checks):
+    """
+    輸入：conn、checks (list of (查詢名稱, sql, params)，見 web_nain.PLAN_CHECKS)
+    輸出：{查詢名稱: [執行計畫]}，只列出含有全表掃描或暫存排序的查詢
+    """
+    problems = {}
+    for name, sql, params in checks:
+        plan = explain_query_plan(conn, sql, params)
+        if any(is_full_scan(detail) for detail in plan):
+            problems[name] = plan
+    return problems
+
+
+if __name__ == '__main__':
+    # 用法：python migrations.py [news.db] [--rebuild-search]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    database = args[0] if args else 'news.db'
+    with sqlite3.connect(database) as conn:
+        applied = migrate_db(conn)
+        print('目前版本:', get_schema_version(conn), '本次執行:', applied)
+
+        if '--rebuild-search' in sys.argv:
+            rebuild_search_index(conn.cursor())
+            conn.commit()
+            print('全文檢索索引已重建')
+
+        # 檢查的 SQL 取自實際執行查詢的模組（web_nain 匯入本模組，故在此才匯入）
+        from web_nain import PLAN_CHECKS
+        problems = find_full_scans(conn, PLAN_CHECKS)
+        for name, plan in problems.items():
+            print(f'{name} 未使用索引:')
+            for detail in plan:
+                print('   ', detail)
+        if problems:
+            sys.exit(1)
+        print('所有熱點查詢皆使用索引')
@@ -0,0 +1,150 @@
+import threading
+from collections import OrderedDict
+
+# 名稱 → id 快取 (author / keyword / category)
+# 只有已 commit 的對應才會進入快取；交易中新增的名稱先記在 pending，commit 後確認再寫入，
+# 避免交易回滾後快取指向不存在（或之後被重用）的 id
+
+NAME_TABLES = ('author', 'keyword', 'category')
+
+SELECT_IDS_SQL = "SELECT id, name FROM {table} WHERE name IN ({placeholders})"
+
+
+class NameCache:
+    """
+    每個資料表各自一個有上限的 LRU 快取
+    輸入：capacity (int)，每個資料表最多保留的名稱數
+    """
+
+    def __init__(self, capacity=50000, chunk_size=500):
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self._caches = {table: OrderedDict() for table in NAME_TABLES}
+        self._pending = {}
+        self._stats = {table: {'hits': 0, 'misses': 0, 'inserts': 0} for table in NAME_TABLES}
+        self._lock = threading.Lock()
+
+    def _put(self, table, name, entity_id):
+        cache = self._caches[table]
+        cache[name] = entity_id
+        cache.move_to_end(name)
+        if len(cache) > self.capacity:
+            cache.popitem(last=False)
+
+    def _select_ids(self, cursor, table, names):
+        """
+        輸入：cursor, table (str), names (list of str)
+        輸出：{name: id}，只包含資料庫中已存在的名稱
+        """
+        found = {}
+        for i in range(0, len(names), self.chunk_size):
+            chunk = names[i:i + self.chunk_size]
+            placeholders = ', '.join(['?'] * len(chunk))
+            cursor.execute(SELECT_IDS_SQL.format(table=table, placeholders=placeholders), chunk)
+            for row in cursor.fetchall():
+                found[row[1]] = row[0]
+        return found
+
+    def warm(self, conn):
+        """
+        輸入：conn
+        輸出：無；載入各資料表最新的名稱（最多 capacity 筆）
+        """
+        for table in NAME_TABLES:
+            rows = conn.execute(f"SELECT id, name FROM {table} ORDER BY id DESC LIMIT ?", (self.capacity,)).fetchall()
+            with self._lock:
+                for entity_id, name in reversed([(row[0], row[1]) for row in rows]):
+                    self._put(table, name, entity_id)
+
+    def resolve(self, cursor, table, names):
+        """
+        輸入：cursor, table (str), names (iterable of str)
+        輸出：{name: id}；快取未命中的名稱以 upsert 新增，需在交易中呼叫
+        """
+        if table not in NAME_TABLES:
+            raise ValueError(f'Invalid name table: {table}')
+        names = list(dict.fromkeys(name for name in names if name))
+
+        id_map = {}
+        missing = []
+        with self._lock:
+            cache = self._caches[table]
+            for name in names:
+                entity_id = cache.get(name)
+                if entity_id is None:
+                    missing.append(name)
+                else:
+                    cache.move_to_end(name)
+                    id_map[name] = entity_id
+            self._stats[table]['hits'] += len(id_map)
+            self._stats[table]['misses'] += len(missing)
+
+        if not missing:
+            return id_map
+
+        existing = self._select_ids(cursor, table, missing)
+        new_names = [name for name in missing if name not in existing]
+        created = {}
+        if new_names:
+            cursor.executemany(
+                f"INSERT INTO {table} (name) VALUES (?) ON CONFLICT(name) DO NOTHING",
+                [(name,) for name in new_names]
+            )
+            created = self._select_ids(cursor, table, new_names)
+
+        with self._lock:
+            pending = self._pending.setdefault(id(cursor.connection), {})
+            for name, entity_id in existing.items():
+                # 同一個交易稍早新增、尚未 commit 的名稱維持 pending
+                if (table, name) not in pending:
+                    self._put(table, name, entity_id)
+            for name, entity_id in created.items():
+                pending[(table, name)] = entity_id
+            self._stats[table]['inserts'] += len(created)
+
+        id_map.update(existing)
+        id_map.update(created)
+        return id_map
+
+    def commit(self, conn):
+        """
+        輸入：conn
+        輸出：無；commit 後重新查詢該連線交易中新增的名稱再放入快取
+              （交易中可能有 savepoint 回滾，不能直接信任 pending 的 id）
+        """
+        conn.commit()
+        with self._lock:
+            pending = self._pending.pop(id(conn), {})
+        by_table = {}
+        for table, name in pending:
+            by_table.setdefault(table, []).append(name)
+
+        cursor = conn.cursor()
+        for table, names in by_table.items():
+            found = self._select_ids(cursor, table, names)
+            with self._lock:
+                for name, entity_id in found.items():
+                    self._put(table, name, entity_id)
+
+    def discard(self, conn):
+        """
+        輸入：conn
+        輸出：無；交易回滾時丟棄該連線尚未 commit 的名稱
+        """
+        with self._lock:
+            self._pending.pop(id(conn), None)
+
+    def stats(self):
+        """
+        輸入：無
+        輸出：各資料表的 hits、misses、inserts、size 與命中率
+        """
+        with self._lock:
+            result = {}
+            for table in NAME_TABLES:
+                stat = dict(self._stats[table])
+                lookups = stat['hits'] + stat['misses']
+                stat['size'] = len(self._caches[table])
+                stat['hit_rate'] = round(stat['hits'] / lookups, 4) if lookups else None
+                result[table] = stat
+            return result
@@ -0,0 +1,245 @@
+import hashlib
+import random
+import re
+import sqlite3
+import struct
+import sys
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ai_result_cache import normalize_content
+from response_cache import ALL_SCOPES, bump_scopes
+
+# 跨來源近似重複新聞分群 (MinHash + LSH)
+# - 每篇新聞內容取 3 字元 shingle，計算 32 個 MinHash 值（numpy 向量化），存在 news_minhash (128 bytes / 篇)
+#   簽章只依內容計算，寫入時在交易開始前先算好，交易中只做 LSH 查詢與寫入
+# - 32 個值分成 8 段 (band) 各 4 個，每段雜湊成一個整數存在 news_lsh；任一段相同即為候選
+#   Jaccard 0.8 的兩篇約 98% 會成為候選、0.3 約 6%
+# - 候選中估計 Jaccard >= SIMILARITY_THRESHOLD 且發布時間相近、最相似的新聞所屬群組即為新新聞的群組，
+#   找不到時自成一群 (cluster_id = news.id)；每段最多比對 id 最大（最新寫入）的 MAX_CANDIDATES 篇
+
+NUM_PERM = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+SIMILARITY_THRESHOLD = 0.6
+MIN_CONTENT_LENGTH = 50     # 內容太短時不分群
+CLUSTER_WINDOW_DAYS = 3     # 只與前後幾天內的新聞比對
+MAX_CANDIDATES = 50         # 每段最多比對的候選數（大量相同內容時避免逐篇比對全部）
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(20250101)  # 固定種子，確保每次啟動的雜湊函式相同
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+# (a * gram + b) % _PRIME 以 uint64 計算：a 拆成高低 32 位元，a_hi * gram * 2^32 利用 2^61 ≡ 1 (mod _PRIME) 化簡，
+# 各項皆不超過 2^63，結果與 Python 整數運算相同
+_A_LOW = np.array([a & 0xFFFFFFFF for a, _ in _PERMUTATIONS], np.uint64)[:, None]
+_A_HIGH = np.array([a >> 32 for a, _ in _PERMUTATIONS], np.uint64)[:, None]
+_B = np.array([b for _, b in _PERMUTATIONS], np.uint64)[:, None]
+_P = np.uint64(_PRIME)
+_LOW29 = np.uint64((1 << 29) - 1)
+_SIGNATURE_FORMAT = f'<{NUM_PERM}I'
+_PUNCTUATION_RE = re.compile(r'[^\w]')
+
+
+def shingles(content):
+    """
+    輸入：content (str)
+    輸出：正規化（移除空白與標點）後的 3 字元 shingle 雜湊值集合，內容太短時為空集合
+    """
+    text = _PUNCTUATION_RE.sub('', normalize_content(content))
+    if len(text) < MIN_CONTENT_LENGTH:
+        return set()
+    return {zlib.crc32(text[i:i + SHINGLE_SIZE].encode('utf-8')) for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(content):
+    """
+    輸入：content (str)
+    輸出：MinHash 簽章 (tuple of NUM_PERM int)，內容太短時為 None
+    """
+    grams = shingles(content)
+    if not grams:
+        return None
+    grams = np.fromiter(grams, np.uint64, len(grams))[None, :]
+    low = (_A_LOW * grams) % _P
+    high = _A_HIGH * grams
+    high = ((high >> np.uint64(29)) + ((high & _LOW29) << np.uint64(32))) % _P
+    values = (low + high + _B) % _P
+    return tuple(int(value) & _MAX_HASH for value in values.min(axis=1))
+
+
+def similarity(signature1, signature2):
+    """
+    輸入：兩個 MinHash 簽章
+    輸出：估計的 Jaccard 相似度 (0 ~ 1)
+    """
+    return sum(x == y for x, y in zip(signature1, signature2)) / NUM_PERM
+
+
+def band_hashes(signature):
+    """
+    輸入：signature (MinHash 簽章)
+    輸出：各段的雜湊值 (list of int，SQLite 可儲存的有號 64 位元整數)
+    """
+    hashes = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f'<B{ROWS_PER_BAND}I', band, *rows), digest_size=8).digest()
+        hashes.append(int.from_bytes(digest, 'little', signed=True))
+    return hashes
+
+
+def pack_signature(signature):
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(blob):
+    return struct.unpack(_SIGNATURE_FORMAT, blob)
+
+
+def similar_news_query(band_hash, news_id, news_time):
+    """
+    輸入：band_hash (一段的雜湊值)、news_id (排除自己)、news_time (str 或 None)
+    輸出：(sql, params)；查詢該段相同、發布時間相近的候選新聞 (id, cluster_id, signature)，
+          依 id 由大到小最多 MAX_CANDIDATES 篇（沿 news_lsh 主鍵反向讀取，不需排序）
+    """
+    query = '''
+        SELECT news.id, news.cluster_id, news_minhash.signature
+        FROM news_lsh AS candidate
+        JOIN news ON news.id = candidate.news_id
+        JOIN news_minhash ON news_minhash.news_id = candidate.news_id
+        WHERE candidate.band_hash = ? AND candidate.news_id != ?
+    '''
+    params = [band_hash, news_id]
+    if news_time:
+        time = datetime.strptime(news_time, "%Y-%m-%d %H:%M:%S")
+        query += ' AND news.news_time BETWEEN ? AND ?'
+        params += [
+            (time - timedelta(days=CLUSTER_WINDOW_DAYS)).strftime("%Y-%m-%d %H:%M:%S"),
+            (time + timedelta(days=CLUSTER_WINDOW_DAYS)).strftime("%Y-%m-%d %H:%M:%S"),
+        ]
+    query += ' ORDER BY candidate.news_id DESC LIMIT ?'
+    params.append(MAX_CANDIDATES)
+    return query, params
+
+
+def find_similar(cursor, signature, news_id, news_time):
+    """
+    輸入：cursor、signature (MinHash 簽章)、news_id (排除自己)、news_time (str 或 None)
+    輸出：(最相似新聞的 cluster_id, 相似度)，沒有相似度 >= SIMILARITY_THRESHOLD 的新聞時為 (None, None)
+    """
+    # 多段相同的候選會出現多次，只需計算一次；分數相同時取 id 較大者，找到完全相同的簽章即停止
+    best = (None, None)
+    best_id = None
+    seen = set()
+    for band_hash in band_hashes(signature):
+        for row in cursor.execute(*similar_news_query(band_hash, news_id, news_time)).fetchall():
+            if row[0] in seen:
+                continue
+            seen.add(row[0])
+            score = similarity(signature, unpack_signature(row[2]))
+            if score >= SIMILARITY_THRESHOLD and (best[1] is None or (score, row[0]) > (best[1], best_id)):
+                best = (row[1] if row[1] is not None else row[0], score)
+                best_id = row[0]
+                if score == 1:
+                    return best
+    return best
+
+
+def remove_signature(cursor, news_id):
+    """
+    輸入：cursor、news_id
+    輸出：無；刪除該篇新聞的簽章與 LSH 項目（由舊簽章算出 band 雜湊，以主鍵刪除）
+    """
+    row = cursor.execute('SELECT signature FROM news_minhash WHERE news_id = ?', (news_id,)).fetchone()
+    if row is None:
+        return
+    cursor.executemany(
+        'DELETE FROM news_lsh WHERE band_hash = ? AND news_id = ?',
+        [(band_hash, news_id) for band_hash in band_hashes(unpack_signature(row[0]))]
+    )
+    cursor.execute('DELETE FROM news_minhash WHERE news_id = ?', (news_id,))
+
+
+def assign_cluster(cursor, news_id, signature, news_time):
+    """
+    輸入：cursor、news_id、signature (minhash(新聞內容)，內容太短時為 None)、news_time (str 或 None)
+    輸出：指派的 cluster_id；更新簽章、LSH 與 news.cluster_id，需在交易中呼叫（簽章在交易外計算）
+    """
+    remove_signature(cursor, news_id)
+    cluster_id = None
+    if signature is not None:
+        cluster_id, _ = find_similar(cursor, signature, news_id, news_time)
+        cursor.execute('INSERT INTO news_minhash (news_id, signature) VALUES (?, ?)', (news_id, pack_signature(signature)))
+        cursor.executemany(
+            'INSERT OR IGNORE INTO news_lsh (band_hash, news_id) VALUES (?, ?)',
+            [(band_hash, news_id) for band_hash in band_hashes(signature)]
+        )
+    cluster_id = cluster_id or news_id
+    cursor.execute('UPDATE news SET cluster_id = ? WHERE id = ?', (cluster_id, news_id))
+    return cluster_id
+
+
+# 重新分群後，依新的群組重新標記 AI 工作的群組重複略過狀態 (見 web_nain.mark_cluster_duplicates)
+_RESET_SKIPPED_JOBS_SQL = 'UPDATE ai_job SET state = 0 WHERE state = 4'
+_MARK_SKIPPED_JOBS_SQL = '''
+    INSERT INTO ai_job (news_id, ai_model, state)
+    SELECT member.id, ai_news.ai_model, 4
+    FROM ai_news
+    JOIN news AS sibling ON sibling.id = ai_news.news_id
+    JOIN news AS member ON member.cluster_id = sibling.cluster_id AND member.id != sibling.id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM ai_news AS done WHERE done.news_id = member.id AND done.ai_model = ai_news.ai_model
+    )
+    ON CONFLICT (news_id, ai_model) DO UPDATE SET state = 4 WHERE ai_job.state = 0
+'''
+
+
+def rebuild_clusters(conn, batch_size=1000):
+    """
+    輸入：conn、batch_size (每批讀取的篇數)
+    輸出：(處理篇數, 群組數)；依 id 順序重新計算所有新聞的簽章與群組，並同步 ai_feed 的群組欄位
+    整個重建在同一個交易中，中斷時保留原本的分群；新聞以 id 分批讀取，不會一次載入所有內容
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('DELETE FROM news_lsh')
+        cursor.execute('DELETE FROM news_minhash')
+
+        count = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                'SELECT id, news_content, news_time FROM news WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                assign_cluster(cursor, row[0], minhash(row[1]), row[2])
+            count += len(rows)
+            last_id = rows[-1][0]
+
+        # feed 表中的群組欄位
+        cursor.execute('UPDATE ai_feed SET cluster_id = (SELECT cluster_id FROM news WHERE news.id = ai_feed.news_id)')
+        cursor.execute(_RESET_SKIPPED_JOBS_SQL)
+        cursor.execute(_MARK_SKIPPED_JOBS_SQL)
+        # 群組全部重算，執行中伺服器的回應快取全部失效
+        bump_scopes(cursor, [ALL_SCOPES])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    clusters = conn.execute('SELECT COUNT(DISTINCT cluster_id) FROM news').fetchone()[0]
+    return count, clusters
+
+
+if __name__ == '__main__':
+    # 用法：python near_dup.py [news.db]，重新計算既有新聞的分群
+    database = sys.argv[1] if len(sys.argv) > 1 else 'news.db'
+    with sqlite3.connect(database) as conn:
+        count, clusters = rebuild_clusters(conn)
+        print(f'已處理 {count} 篇，共 {clusters} 群')
@@ -0,0 +1,266 @@
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import zlib
+from datetime import datetime
+
+# 新聞資料匯出（NDJSON / CSV），供 /export 與命令列使用
+# - 依 news.id 遞增分批讀取，每批只保留 batch_size 篇，記憶體用量與總筆數無關
+# - 每篇新聞附上作者、關鍵字、類別，以及各模型的 AI 分析結果
+# - 以最後收到的 id 作為 after_id 即可從中斷處繼續
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_BATCH_SIZE = 500
+CSV_LIST_SEPARATOR = '|'  # CSV 中關鍵字、類別等清單欄位以此分隔
+
+NEWS_COLUMNS = (
+    'id', 'news_time', 'news_title', 'news_content', 'image_url', 'news_url',
+    'source_website', 'query_state', 'cluster_id'
+)
+
+
+def parse_export_time(value):
+    """
+    輸入：value (str，YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS)
+    輸出：YYYY-MM-DD HH:MM:SS 格式的字串；格式錯誤時拋出 ValueError
+    """
+    return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _group_names(cursor, query, ids):
+    """
+    輸入：cursor、query (以 {placeholders} 代入 IN 條件，回傳 (id, name))、ids
+    輸出：{id: [name, ...]}
+    """
+    result = {}
+    if not ids:
+        return result
+    placeholders = ', '.join(['?'] * len(ids))
+    for row in cursor.execute(query.format(placeholders=placeholders), ids):
+        result.setdefault(row[0], []).append(row[1])
+    return result
+
+
+def fetch_export_batch(cursor, after_id, batch_size, since=None, until=None, source_website=None):
+    """
+    輸入：cursor、after_id (int)、batch_size (int)、since / until (str，news_time 範圍，含 since 不含 until)、source_website (int)
+    輸出：id 大於 after_id 的下一批新聞 (list of dict)，含 author、keywords、categories 與 ai (list)
+    """
+    query = f'''
+    SELECT {', '.join('news.' + column for column in NEWS_COLUMNS)}, author.name AS author
+    FROM news LEFT JOIN author ON author.id = news.author_id
+    WHERE news.id > ?
+    '''
+    params = [after_id]
+    if since:
+        query += ' AND news.news_time >= ?'
+        params.append(since)
+    if until:
+        query += ' AND news.news_time < ?'
+        params.append(until)
+    if source_website:
+        query += ' AND news.source_website = ?'
+        params.append(source_website)
+    query += ' ORDER BY news.id LIMIT ?'
+    params.append(batch_size)
+
+    columns = NEWS_COLUMNS + ('author',)
+    rows = [dict(zip(columns, row)) for row in cursor.execute(query, params).fetchall()]
+    ids = [row['id'] for row in rows]
+
+    keywords = _group_names(cursor, '''
+        SELECT news_keyword.news_id, keyword.name FROM news_keyword JOIN keyword ON keyword.id = news_keyword.keyword_id
+        WHERE news_keyword.news_id IN ({placeholders}) ORDER BY news_keyword.id
+    ''', ids)
+    categories = _group_names(cursor, '''
+        SELECT news_category.news_id, category.name FROM news_category JOIN category ON category.id = news_category.category_id
+        WHERE news_category.news_id IN ({placeholders}) ORDER BY news_category.id
+    ''', ids)
+
+    ai_rows = []
+    if ids:
+        placeholders = ', '.join(['?'] * len(ids))
+        ai_rows = cursor.execute(f'''
+            SELECT id, news_id, ai_model, ai_title, ai_sentiment_analysis FROM ai_news
+            WHERE news_id IN ({placeholders}) ORDER BY news_id, ai_model
+        ''', ids).fetchall()
+    ai_ids = [row[0] for row in ai_rows]
+    ai_keywords = _group_names(cursor, '''
+        SELECT ai_news_keyword.ai_news_id, keyword.name FROM ai_news_keyword JOIN keyword ON keyword.id = ai_news_keyword.keyword_id
+        WHERE ai_news_keyword.ai_news_id IN ({placeholders}) ORDER BY ai_news_keyword.id
+    ''', ai_ids)
+    ai_categories = _group_names(cursor, '''
+        SELECT ai_news_category.ai_news_id, category.name FROM ai_news_category JOIN category ON category.id = ai_news_category.category_id
+        WHERE ai_news_category.ai_news_id IN ({placeholders}) ORDER BY ai_news_category.id
+    ''', ai_ids)
+
+    ai_results = {}
+    for ai_id, news_id, model, title, sentiment in ai_rows:
+        ai_results.setdefault(news_id, []).append({
+            'ai_model': model,
+            'ai_title': title,
+            'ai_sentiment_analysis': sentiment,
+            'keywords': ai_keywords.get(ai_id, []),
+            'categories': ai_categories.get(ai_id, []),
+        })
+
+    for row in rows:
+        row['keywords'] = keywords.get(row['id'], [])
+        row['categories'] = categories.get(row['id'], [])
+        row['ai'] = ai_results.get(row['id'], [])
+    return rows
+
+
+def iter_export_batches(conn, after_id=0, since=None, until=None, source_website=None, limit=None,
+                        batch_size=EXPORT_BATCH_SIZE):
+    """
+    輸入：conn、after_id、since、until、source_website、limit (最多筆數，None 為不限)、batch_size
+    輸出：generator，依 id 遞增逐批產生新聞 (list of dict)
+    """
+    cursor = conn.cursor()
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        rows = fetch_export_batch(cursor, after_id, size, since, until, source_website)
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]['id']
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            return
+
+
+def label_row(row, source_websites, sentiments, models):
+    """
+    輸入：row (fetch_export_batch 的一筆)、來源、情感、模型的 {代碼: 名稱}
+    輸出：無；將代碼換成名稱
+    """
+    row['source_website'] = source_websites.get(row['source_website'], row['source_website'])
+    for ai in row['ai']:
+        ai['ai_model'] = models.get(ai['ai_model'], ai['ai_model'])
+        ai['ai_sentiment_analysis'] = sentiments.get(ai['ai_sentiment_analysis'], ai['ai_sentiment_analysis'])
+
+
+def iter_ndjson(batches):
+    """
+    輸入：batches (逐批的新聞)
+    輸出：generator，每批產生一段 NDJSON 文字（每篇一行）
+    """
+    for rows in batches:
+        yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+
+def csv_header(models):
+    """
+    輸入：models (模型名稱 list)
+    輸出：CSV 欄位名稱 (list)；每個模型一組 AI 欄位
+    """
+    header = list(NEWS_COLUMNS) + ['author', 'keywords', 'categories']
+    for model in models:
+        header += [f'{model}:{field}' for field in ('ai_title', 'ai_sentiment_analysis', 'keywords', 'categories')]
+    return header
+
+
+def iter_csv(batches, models):
+    """
+    輸入：batches (逐批的新聞，已換成名稱)、models (模型名稱 list，決定 AI 欄位順序)
+    輸出：generator，先產生標題列，之後每批產生一段 CSV 文字；清單欄位以 CSV_LIST_SEPARATOR 分隔
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(csv_header(models))
+    yield buffer.getvalue()
+
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            line = [row[column] for column in NEWS_COLUMNS] + [
+                row['author'], CSV_LIST_SEPARATOR.join(row['keywords']), CSV_LIST_SEPARATOR.join(row['categories'])
+            ]
+            by_model = {ai['ai_model']: ai for ai in row['ai']}
+            for model in models:
+                ai = by_model.get(model)
+                line += [
+                    ai['ai_title'], ai['ai_sentiment_analysis'],
+                    CSV_LIST_SEPARATOR.join(ai['keywords']), CSV_LIST_SEPARATOR.join(ai['categories'])
+                ] if ai else ['', '', '', '']
+            writer.writerow(line)
+        yield buffer.getvalue()
+
+
+def iter_gzip(chunks):
+    """
+    輸入：chunks (文字片段)
+    輸出：generator，gzip 壓縮後的 bytes 片段
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31：gzip 格式
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(conn, export_format, labels, **filters):
+    """
+    輸入：
+        conn
+        export_format: 'ndjson' 或 'csv'
+        labels: (來源, 情感, 模型) 的 {代碼: 名稱}
+        filters: after_id、since、until、source_website、limit（同 iter_export_batches）
+    輸出：generator，匯出內容的文字片段
+    """
+    source_websites, sentiments, models = labels
+
+    def labelled():
+        for rows in iter_export_batches(conn, **filters):
+            for row in rows:
+                label_row(row, source_websites, sentiments, models)
+            yield rows
+
+    if export_format == 'csv':
+        return iter_csv(labelled(), list(models.values()))
+    return iter_ndjson(labelled())
+
+
+def main():
+    # 用法：python news_export.py [news.db] [--format ndjson|csv] [--since ...] [--until ...]
+    #                            [--source-website 1] [--after-id 0] [--limit N] [--gzip] [-o 檔名]
+    from web_nain import SOURCE_WEBSITE_ENUM, SENTIMENT_ANALYSIS_ENUM, AI_MODEL_ENUM
+
+    parser = argparse.ArgumentParser(description='匯出新聞與 AI 分析結果')
+    parser.add_argument('database', nargs='?', default='news.db')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--since', type=parse_export_time, help='news_time 起點（含）')
+    parser.add_argument('--until', type=parse_export_time, help='news_time 終點（不含）')
+    parser.add_argument('--source-website', type=int)
+    parser.add_argument('--after-id', type=int, default=0, help='從此 id 之後繼續匯出')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('-o', '--output', help='輸出檔名，未指定時輸出到 stdout')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f'file:{args.database}?mode=ro', uri=True)
+    chunks = iter_export(
+        conn, args.format, (SOURCE_WEBSITE_ENUM, SENTIMENT_ANALYSIS_ENUM, AI_MODEL_ENUM),
+        after_id=args.after_id, since=args.since, until=args.until,
+        source_website=args.source_website, limit=args.limit
+    )
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for data in iter_gzip(chunks) if args.gzip else (chunk.encode('utf-8') for chunk in chunks):
+            output.write(data)
+    finally:
+        if args.output:
+            output.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
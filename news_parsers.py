@@ -0,0 +1,171 @@
+import json
+import re
+from datetime import datetime
+
+import lxml.html
+
+# 各新聞網站的頁面解析，與 script_main.py 的抓取分開，可離線以 benchmarks/fixtures 的頁面測試
+# - 不建立 BeautifulSoup 樹：以 lxml 解析後用 XPath 取值，同一頁只解析一次
+# - 三立、東森內文頁的大部分欄位在 application/ld+json 中，取出 JSON 後直接使用
+# 輸出與原本以 BeautifulSoup(text, 'lxml') 逐欄位取值的結果相同（python benchmarks/bench_parsers.py 檢查）
+# 以正規表達式直接切出 HTML 片段較快，但無法正確處理註解、未加引號的屬性等，三立的標題判斷錯誤會被當成 NewsID 不存在
+
+_CONTROL_CHARS_RE = re.compile(r"[\x00-\x1F\x7F]")
+
+
+def _has_class(class_name):
+    # XPath 條件：class 屬性包含 class_name（同 CSS 的 .class_name）
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def _parse_html(text):
+    try:
+        return lxml.html.document_fromstring(text)
+    except ValueError:
+        # 含 XML 編碼宣告的字串無法直接解析
+        return lxml.html.document_fromstring(text.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+
+
+def _ld_json(root):
+    # 第一個 application/ld+json 的內容，沒有時為 None
+    scripts = root.xpath("//script[@type='application/ld+json']")
+    return scripts[0].text if scripts else None
+
+
+def parse_ttv_list(text):
+    """
+    輸入：text (台視新聞清單頁 HTML)
+    輸出：[{news_time, news_title, news_url, source_website}, ...]；略過 2024 年以前的新聞
+    """
+    root = _parse_html(text)
+    news_list = []
+    for a in root.xpath(f"//article[{_has_class('container')}]//a"):
+        news_title = a.xpath(f".//div[{_has_class('title')}]")[0].text_content().strip()
+        news_time = a.xpath(f".//div[{_has_class('time')}]")[0].text_content().strip()
+
+        dt_object = datetime.strptime(news_time, "%Y.%m.%d %H:%M")
+        # 判斷時間
+        if dt_object.year < 2024:
+            continue
+
+        news_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
+        news_list.append({'news_time': news_time, 'news_title': news_title, 'news_url': a.attrib['href'], 'source_website': 1})
+    return news_list
+
+
+def parse_ttv_article(text):
+    """
+    輸入：text (台視新聞內文頁 HTML)
+    輸出：{news_title, news_content, image_url, keywords, category, author}
+    """
+    root = _parse_html(text)
+
+    # 標題
+    title = root.xpath(f"//h1[{_has_class('mb-ht-hf')}]")[0].text_content().strip()
+    title = re.sub(r'\u3000', ' ', title)
+
+    # 類別
+    category = [root.xpath("//div[@id='crumbs']//li")[-1].text_content()]
+
+    # 標籤
+    keywords = [li.text_content() for li in root.xpath(f"//ul[{_has_class('news-status')}]/ul[{_has_class('tag')}]//li")]
+
+    # 抓取圖片
+    imgs = root.xpath("//article[@id='contentarea']//img")
+    if len(imgs) > 1:
+        src = imgs[1].attrib['src']
+    elif len(imgs) > 0:
+        src = imgs[0].attrib['src']
+    else:
+        src = None
+
+    # 內文
+    p = root.xpath("//div[@id='newscontent']/p")
+    content = '\n'.join([x.text_content() for x in p])
+
+    # 抓取編輯
+    author = re.search(r'責任編輯／([\u4e00-\u9fff]+)', content)
+    author = author[1] if author else None
+
+    return {'news_title': title, 'news_content': content, 'image_url': src, 'keywords': keywords, 'category': category, 'author': author}
+
+
+def parse_setn_article(link, text):
+    """
+    輸入：link (新聞連結)、text (三立新聞內文頁 HTML)
+    輸出：新聞 (dict，格式同 POST /news)；NewsID 不存在時為 None
+    """
+    root = _parse_html(text)
+    titles = root.xpath(f"//h1[{_has_class('news-title-3')}]")
+    if not titles:
+        return None
+    news_title = titles[0].text_content()
+
+    data = json.loads(_ld_json(root))
+
+    # 內文
+    content = data['description']
+
+    # 抓取編輯
+    author = data['author'].get('name')
+
+    # 抓取圖片
+    src = data['image'].get('url')
+
+    # 日期時間
+    dt = datetime.fromisoformat(data['datePublished'])
+    news_time = dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    keywords = data['keywords']
+    category = data['articleSection']
+
+    return {'news_title': news_title, 'news_content': content, 'image_url': src, 'keywords': keywords, 'category': category, 'author': author, 'query_state': 2, 'news_url': link, 'source_website': 2, 'news_time': news_time}
+
+
+def parse_ebc_list(text):
+    """
+    輸入：text (東森新聞清單 category/load 回應的 HTML)
+    輸出：[{news_title, news_url, source_website}, ...]
+    """
+    root = _parse_html(text)
+    news_list = []
+    for a in root.xpath(f"//a[{_has_class('item')} and {_has_class('col3')}]"):
+        link = f"https://news.ebc.net.tw/{a.attrib['href']}"
+        news_list.append({'news_title': a.attrib['title'], 'news_url': link, 'source_website': 3})
+    return news_list
+
+
+def parse_ebc_article(text):
+    """
+    輸入：text (東森新聞內文頁 HTML)
+    輸出：{news_title, news_content, image_url, keywords, category, author, news_time}
+    """
+    root = _parse_html(text)
+    data = json.loads(_CONTROL_CHARS_RE.sub("", _ld_json(root)))[0]
+
+    # 標題
+    title = data['headline']
+
+    # 類別
+    category = [data['articleSection']]
+
+    # 標籤
+    keywords = data['keywords'].split(',') if 'keywords' in data else None
+
+    # 抓取圖片
+    src = data['image']
+
+    # 內文
+    p = root.xpath(f"//div[{_has_class('article_content')}]/p")
+    content = '\n'.join([x.text_content() for x in p])
+
+    # 抓取編輯
+    # 實習編輯 黃X亮
+    author = re.search(r'編輯 ([\u4e00-\u9fff]+)', data['author']['name'])
+    author = author[1] if author else data['author']['name']
+
+    # 日期時間
+    dt_object = datetime.fromisoformat(data['dateCreated'])
+    news_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
+
+    return {'news_title': title, 'news_content': content, 'image_url': src, 'keywords': keywords, 'category': category, 'author': author, 'news_time': news_time}
@@ -0,0 +1,423 @@
+import copy
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from ai_result_cache import normalize_content
+from db_pool import ConnectionPool
+
+# 相關新聞推薦索引（/api/ai_news/<id>/related）
+# - 每篇已分析的新聞為一個 TF-IDF 向量：內容的字元 bigram 與 AI 關鍵字（跨模型聯集，權重較高），
+#   特徵以 crc32 雜湊到固定空間，每篇只保留權重最高的 MAX_TERMS 個特徵並正規化
+# - 建立索引 (build_index) 時寫成倒排索引的 .npy 檔（term_ptr / rows / weights，CSC 格式），伺服器以 mmap 載入
+# - 建立之後新增的分析結果 (ai_news.id > last_ai_news_id) 由背景執行緒補進記憶體中的增量索引
+#   （分析結果寫入後喚醒，另外每 REFRESH_INTERVAL 秒檢查一次）；新的索引狀態建立完成後才切換，查詢不等待更新
+# - 查詢時只走訪與目標新聞共有特徵的倒排列，以 numpy 向量化加總 cosine 分數後取 top-k；
+#   倒排列依權重由高到低排列，每個特徵最多走訪 MAX_POSTINGS_PER_TERM 筆（常見特徵的低權重尾端對排名影響很小）
+# 增量超過 MAX_DELTA_DOCS 篇時背景執行緒重新建立索引；另外執行 python related_index.py news.db 重建時，下次更新載入新版
+
+FEATURE_SPACE = 1 << 20          # 內容 bigram 的雜湊空間；關鍵字使用其後的另一段相同大小的空間
+NUM_FEATURES = FEATURE_SPACE * 2
+MAX_TERMS = 24                   # 每篇保留的特徵數（1M 篇約 200MB）
+KEYWORD_WEIGHT = 3               # 一個 AI 關鍵字相當於出現幾次的內容 bigram
+MAX_POSTINGS_PER_TERM = 20000    # 查詢時每個特徵最多走訪的倒排項目數
+BUILD_BATCH_SIZE = 1000
+CURRENT_FILE = 'CURRENT'         # 索引目錄中記錄目前版本子目錄的檔案
+MAX_DELTA_DOCS = 50000           # 增量索引篇數上限，超過時重新建立索引
+REFRESH_INTERVAL = 30            # 背景更新的間隔秒數（寫入分析結果時另外喚醒）
+
+_PUNCTUATION_RE = re.compile(r'[^\w]')
+
+
+def article_terms(content, keywords):
+    """
+    輸入：content (str)、keywords (list of str，AI 關鍵字)
+    輸出：{特徵: 次數} (Counter)
+    """
+    text = _PUNCTUATION_RE.sub('', normalize_content(content))
+    counts = Counter(zlib.crc32(text[i:i + 2].encode('utf-8')) % FEATURE_SPACE for i in range(len(text) - 1))
+    for keyword in keywords:
+        counts[FEATURE_SPACE + zlib.crc32(normalize_content(keyword).encode('utf-8')) % FEATURE_SPACE] += KEYWORD_WEIGHT
+    return counts
+
+
+def weigh_terms(counts, df, num_docs):
+    """
+    輸入：counts (article_terms 的結果)、df (各特徵的文件數 ndarray)、num_docs (int)
+    輸出：(features int32 ndarray, weights float32 ndarray)；TF-IDF 權重最高的 MAX_TERMS 個特徵，L2 正規化
+    """
+    if not counts:
+        return np.empty(0, np.int32), np.empty(0, np.float32)
+    features = np.fromiter(counts.keys(), np.int32, len(counts))
+    tf = np.fromiter(counts.values(), np.float64, len(counts))
+    weights = (1 + np.log(tf)) * (np.log((num_docs + 1) / (df[features] + 1)) + 1)
+    if len(features) > MAX_TERMS:
+        top = np.argpartition(-weights, MAX_TERMS)[:MAX_TERMS]
+        features, weights = features[top], weights[top]
+    weights /= np.linalg.norm(weights)
+    return features, weights.astype(np.float32)
+
+
+def fetch_articles(cursor, news_ids):
+    """
+    輸入：cursor、news_ids (list of int，最多 SQLite 參數上限)
+    輸出：{news_id: (content, [AI 關鍵字])}；不存在的新聞不列出
+    """
+    if not news_ids:
+        return {}
+    placeholders = ', '.join(['?'] * len(news_ids))
+    articles = {
+        row[0]: (row[1] or '', [])
+        for row in cursor.execute(f'SELECT id, news_content FROM news WHERE id IN ({placeholders})', news_ids)
+    }
+    cursor.execute(f'''
+        SELECT DISTINCT ai_news.news_id, keyword.name FROM ai_news
+        JOIN ai_news_keyword ON ai_news_keyword.ai_news_id = ai_news.id
+        JOIN keyword ON keyword.id = ai_news_keyword.keyword_id
+        WHERE ai_news.news_id IN ({placeholders})
+    ''', news_ids)
+    for news_id, name in cursor.fetchall():
+        if news_id in articles:
+            articles[news_id][1].append(name)
+    return articles
+
+
+def iter_analysed_articles(conn, batch_size=BUILD_BATCH_SIZE):
+    """
+    輸入：conn、batch_size
+    輸出：generator，依 news_id 遞增產生 (news_id, content, keywords)，只包含已有分析結果的新聞
+    """
+    cursor = conn.cursor()
+    last_id = 0
+    while True:
+        news_ids = [row[0] for row in cursor.execute(
+            'SELECT DISTINCT news_id FROM ai_news WHERE news_id > ? ORDER BY news_id LIMIT ?', (last_id, batch_size)
+        ).fetchall()]
+        if not news_ids:
+            return
+        articles = fetch_articles(cursor, news_ids)
+        for news_id in news_ids:
+            if news_id in articles:
+                yield (news_id,) + articles[news_id]
+        last_id = news_ids[-1]
+
+
+def build_index(conn, directory):
+    """
+    輸入：conn、directory (索引目錄)
+    輸出：索引資訊 (dict)；計算所有已分析新聞的向量後以 write_index 寫入
+    """
+    last_ai_news_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM ai_news').fetchone()[0]
+
+    # 第一次走訪：文件數與各特徵的文件數
+    df = np.zeros(NUM_FEATURES, np.int32)
+    num_docs = 0
+    for _, content, keywords in iter_analysed_articles(conn):
+        features = np.fromiter(article_terms(content, keywords).keys(), np.int32)
+        df[features] += 1
+        num_docs += 1
+
+    # 第二次走訪：各篇向量
+    news_ids, row_features, row_weights = [], [], []
+    for news_id, content, keywords in iter_analysed_articles(conn):
+        features, weights = weigh_terms(article_terms(content, keywords), df, num_docs)
+        news_ids.append(news_id)
+        row_features.append(features)
+        row_weights.append(weights)
+
+    return write_index(directory, news_ids, row_features, row_weights, df, num_docs, last_ai_news_id)
+
+
+def write_index(directory, news_ids, row_features, row_weights, df, num_docs, last_ai_news_id):
+    """
+    輸入：directory、news_ids (依 id 遞增)、row_features / row_weights (各篇向量)、df、num_docs、last_ai_news_id
+    輸出：索引資訊 (dict)；轉為依特徵排序（同特徵內依權重遞減）的倒排索引後寫入新的版本子目錄，切換 CURRENT 並刪除舊版本
+    """
+    lengths = np.fromiter((len(features) for features in row_features), np.int64, len(row_features))
+    features = np.concatenate(row_features) if row_features else np.empty(0, np.int32)
+    weights = np.concatenate(row_weights) if row_weights else np.empty(0, np.float32)
+    rows = np.repeat(np.arange(len(news_ids), dtype=np.int32), lengths)
+    order = np.lexsort((-weights, features))  # 依特徵排序，同一特徵內依權重由高到低
+    term_ptr = np.zeros(NUM_FEATURES + 1, np.int64)
+    np.cumsum(np.bincount(features, minlength=NUM_FEATURES), out=term_ptr[1:])
+
+    os.makedirs(directory, exist_ok=True)
+    version = time.strftime('%Y%m%d%H%M%S')
+    target = os.path.join(directory, version)
+    os.makedirs(target, exist_ok=True)
+    np.save(os.path.join(target, 'news_ids.npy'), np.asarray(news_ids, np.int64))
+    np.save(os.path.join(target, 'term_ptr.npy'), term_ptr)
+    np.save(os.path.join(target, 'rows.npy'), rows[order])
+    np.save(os.path.join(target, 'weights.npy'), weights[order])
+    np.save(os.path.join(target, 'df.npy'), df)
+    meta = {'num_docs': num_docs, 'last_ai_news_id': last_ai_news_id, 'postings': int(len(features))}
+    with open(os.path.join(target, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    tmp_path = os.path.join(directory, CURRENT_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+
+    # 舊版本可能仍被執行中的伺服器 mmap（Windows 無法刪除），刪除失敗時略過
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name != version and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return meta
+
+
+class IndexState:
+    """
+    某個時間點的索引內容（基礎索引與增量索引）；建立後不再修改，更新時產生新的 IndexState，查詢不需持有鎖
+    """
+
+    def __init__(self):
+        self.version = None
+        self.news_ids = np.empty(0, np.int64)
+        self.term_ptr = None
+        self.rows = self.weights = None
+        self.df = np.zeros(NUM_FEATURES, np.int32)
+        self.num_docs = 0
+        self.last_ai_news_id = 0
+        self.delta = {}        # 特徵 → {news_id: 權重}
+        self.delta_docs = {}   # news_id → features
+
+    @classmethod
+    def load(cls, directory, version):
+        """
+        輸入：directory (索引目錄)、version (版本子目錄名稱，None 為空索引)
+        輸出：IndexState；倒排索引以 mmap 載入
+        """
+        state = cls()
+        state.version = version
+        if version is None:
+            return state
+        path = os.path.join(directory, version)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        state.news_ids = np.load(os.path.join(path, 'news_ids.npy'))
+        state.term_ptr = np.load(os.path.join(path, 'term_ptr.npy'), mmap_mode='r')
+        state.rows = np.load(os.path.join(path, 'rows.npy'), mmap_mode='r')
+        state.weights = np.load(os.path.join(path, 'weights.npy'), mmap_mode='r')
+        state.df = np.load(os.path.join(path, 'df.npy'))  # 增量新增時會更新，需載入記憶體
+        state.num_docs = meta['num_docs']
+        state.last_ai_news_id = meta['last_ai_news_id']
+        return state
+
+    def in_base(self, news_id):
+        position = np.searchsorted(self.news_ids, news_id)
+        return position < len(self.news_ids) and self.news_ids[position] == news_id
+
+    def with_articles(self, articles, last_ai_news_id):
+        """
+        輸入：articles (iterable of (news_id, content, keywords))、last_ai_news_id (納入後最後的 ai_news.id)
+        輸出：加入這些新聞後的新 IndexState（本身不變）；已在索引中的新聞（例如另一個模型的分析結果）以新的向量取代
+        """
+        state = copy.copy(self)
+        state.df = self.df.copy()
+        state.delta = dict(self.delta)
+        state.delta_docs = dict(self.delta_docs)
+        copied = set()  # 已複製、可修改的倒排列
+
+        def postings(feature):
+            if feature not in copied:
+                state.delta[feature] = dict(state.delta.get(feature, ()))
+                copied.add(feature)
+            return state.delta[feature]
+
+        for news_id, content, keywords in articles:
+            counts = article_terms(content, keywords)
+            is_new = news_id not in state.delta_docs and not state.in_base(news_id)
+            if is_new and counts:
+                state.df[np.fromiter(counts.keys(), np.int32, len(counts))] += 1
+                state.num_docs += 1
+            for feature in state.delta_docs.pop(news_id, ()):
+                postings(feature).pop(news_id, None)
+            features, weights = weigh_terms(counts, state.df, state.num_docs)
+            for feature, weight in zip(features.tolist(), weights.tolist()):
+                postings(feature)[news_id] = weight
+            state.delta_docs[news_id] = features.tolist()
+        state.last_ai_news_id = last_ai_news_id
+        return state
+
+    def top_k(self, q_features, q_weights, k, exclude=None):
+        """
+        輸入：q_features / q_weights (查詢向量)、k、exclude (不列入的 news_id)
+        輸出：[(news_id, 分數), ...] 依分數由高到低，最多 k 筆
+        """
+        # 基礎索引：串接各特徵倒排列的前段，以 bincount 依列號累加分數
+        scores = np.empty(0, np.float64)
+        candidates = np.empty(0, np.int64)
+        if self.term_ptr is not None and len(q_features):
+            starts = self.term_ptr[q_features]
+            ends = np.minimum(self.term_ptr[q_features + 1], starts + MAX_POSTINGS_PER_TERM)
+            rows = np.concatenate([self.rows[start:end] for start, end in zip(starts, ends)])
+            weights = np.concatenate([self.weights[start:end] for start, end in zip(starts, ends)])
+            if len(rows):
+                weights = weights * np.repeat(q_weights, ends - starts)
+                dense = np.bincount(rows, weights=weights, minlength=len(self.news_ids))
+                touched = np.flatnonzero(dense)
+                scores = dense[touched]
+                candidates = self.news_ids[touched]
+
+        # 增量索引；已被增量取代的基礎索引向量不列入
+        delta_scores = Counter()
+        for feature, q_weight in zip(q_features.tolist(), q_weights.tolist()):
+            for doc_id, weight in self.delta.get(feature, {}).items():
+                delta_scores[doc_id] += weight * q_weight
+        if self.delta_docs and len(candidates):
+            replaced = np.fromiter(self.delta_docs.keys(), np.int64, len(self.delta_docs))
+            keep = ~np.isin(candidates, replaced)
+            candidates, scores = candidates[keep], scores[keep]
+        if delta_scores:
+            candidates = np.concatenate([candidates, np.fromiter(delta_scores.keys(), np.int64, len(delta_scores))])
+            scores = np.concatenate([scores, np.fromiter(delta_scores.values(), np.float64, len(delta_scores))])
+        if exclude is not None:
+            keep = candidates != exclude
+            candidates, scores = candidates[keep], scores[keep]
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return [(int(candidates[i]), float(scores[i])) for i in order]
+
+
+class RelatedIndex:
+    """
+    輸入：directory (build_index 的索引目錄)、database (資料庫路徑，設定時第一次使用時啟動背景更新執行緒)、
+          max_delta_docs (增量篇數上限，超過時重新建立索引)、interval (背景更新的間隔秒數)
+    目錄不存在時視為空索引，所有已分析新聞皆由增量索引補上
+    """
+
+    def __init__(self, directory, database=None, max_delta_docs=MAX_DELTA_DOCS, interval=REFRESH_INTERVAL):
+        self.directory = directory
+        self.database = database
+        self.max_delta_docs = max_delta_docs
+        self.interval = interval
+        self._state = IndexState()
+        self._lock = threading.Lock()          # 只在切換 _state 與啟動執行緒時持有
+        self._refresh_lock = threading.Lock()  # 同時只有一個更新
+        self._wake = threading.Event()
+        self._worker = None
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _start_worker(self):
+        if self.database is None or self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='related-index', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        conn = ConnectionPool(self.database, size=1, readonly=True).connect()
+        while True:
+            try:
+                self.refresh(conn)
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def notify(self):
+        """
+        輸入：無
+        輸出：無；新的分析結果 commit 後呼叫，背景執行緒立即補上（不在請求中計算）
+        """
+        self._start_worker()
+        self._wake.set()
+
+    def _new_articles(self, cursor, state):
+        # state 之後新增的分析結果：(最後的 ai_news.id, 新聞 id list)
+        last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM ai_news').fetchone()[0]
+        if last_id <= state.last_ai_news_id:
+            return last_id, []
+        return last_id, [row[0] for row in cursor.execute(
+            'SELECT DISTINCT news_id FROM ai_news WHERE id > ? AND id <= ?', (state.last_ai_news_id, last_id)
+        ).fetchall()]
+
+    def _with_new_articles(self, cursor, state, last_id, news_ids):
+        if not news_ids:
+            return state
+
+        def articles():
+            for i in range(0, len(news_ids), BUILD_BATCH_SIZE):
+                for news_id, (content, keywords) in fetch_articles(cursor, news_ids[i:i + BUILD_BATCH_SIZE]).items():
+                    yield news_id, content, keywords
+        return state.with_articles(articles(), last_id)
+
+    def refresh(self, conn):
+        """
+        輸入：conn
+        輸出：無；重新建立過索引時載入新版並補上之後新增的分析結果，增量超過 max_delta_docs 篇時重新建立索引
+        新的狀態在鎖外建立，完成後才切換，查詢不會等待更新
+        """
+        with self._refresh_lock:
+            cursor = conn.cursor()
+            state = self._state
+            version = self._current_version()
+            if version != state.version:
+                state = IndexState.load(self.directory, version)
+            last_id, news_ids = self._new_articles(cursor, state)
+            if len(state.delta_docs) + len(news_ids) > self.max_delta_docs:
+                build_index(conn, self.directory)
+                state = IndexState.load(self.directory, self._current_version())
+                last_id, news_ids = self._new_articles(cursor, state)
+            state = self._with_new_articles(cursor, state, last_id, news_ids)
+            with self._lock:
+                self._state = state
+
+    def query(self, cursor, news_id, k):
+        """
+        輸入：cursor、news_id、k (int)
+        輸出：[(news_id, 分數), ...] 依 cosine 相似度由高到低，最多 k 筆，不含自己；新聞不存在時為 None
+        """
+        self._start_worker()
+        article = fetch_articles(cursor, [news_id]).get(news_id)
+        if article is None:
+            return None
+        state = self._state
+        q_features, q_weights = weigh_terms(article_terms(*article), state.df, state.num_docs)
+        return state.top_k(q_features, q_weights, k, exclude=news_id)
+
+    def stats(self):
+        """
+        輸入：無
+        輸出：版本、基礎索引篇數、增量篇數與最後納入的 ai_news.id
+        """
+        state = self._state
+        return {
+            'version': state.version,
+            'base_docs': int(len(state.news_ids)),
+            'delta_docs': len(state.delta_docs),
+            'num_docs': state.num_docs,
+            'last_ai_news_id': state.last_ai_news_id,
+        }
+
+
+if __name__ == '__main__':
+    # 用法：python related_index.py [news.db] [related_index]，重新建立相關新聞索引
+    database = sys.argv[1] if len(sys.argv) > 1 else 'news.db'
+    directory = sys.argv[2] if len(sys.argv) > 2 else 'related_index'
+    with sqlite3.connect(database) as conn:
+        started = time.perf_counter()
+        meta = build_index(conn, directory)
+        print(f"已建立 {meta['num_docs']} 篇的索引 ({meta['postings']} 個特徵, {time.perf_counter() - started:.1f} 秒)")
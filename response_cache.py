@@ -0,0 +1,145 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 讀取 API 的回應快取
+# - 每個資料範圍 (例如 feed:<model>、news:<id>、cluster:<id>) 最後一次被寫入的序號存在 cache_scope 表，
+#   寫入者在同一個交易中更新（見 bump_scopes），回滾時一併回滾；web 伺服器以外的程式
+#   (bulk_load.py、near_dup.py、rollups.py、migrations.py) 寫入後，執行中的伺服器也會讓快取失效
+# - 快取項目記錄產生時的序號與依賴的範圍；依賴範圍或 ALL_SCOPES 之後有寫入即失效，每次命中讀取一次 cache_scope
+# - ETag 由依賴範圍的序號產生，條件式請求 (If-None-Match) 相同時回傳 304；序號存在資料庫中，重新啟動後 ETag 不變
+#   查詢期間有任何寫入時，回應可能是寫入前的資料，不放入快取也不附 ETag
+
+# cache_scope 中的特殊範圍：SEQUENCE_SCOPE 為全域序號（每次寫入遞增），ALL_SCOPES 讓所有快取項目失效
+SEQUENCE_SCOPE = ''
+ALL_SCOPES = '*'
+
+BUMP_SEQUENCE_SQL = "UPDATE cache_scope SET seq = seq + 1 WHERE scope = '' RETURNING seq"
+SET_SCOPE_SQL = 'INSERT INTO cache_scope (scope, seq) VALUES (?, ?) ON CONFLICT (scope) DO UPDATE SET seq = excluded.seq'
+SCOPE_SEQ_SQL = 'SELECT scope, seq FROM cache_scope WHERE scope IN ({placeholders})'
+
+
+def bump_scopes(cursor, scopes):
+    """
+    輸入：cursor、scopes (資料範圍)；需在寫入資料的同一個交易中呼叫
+    輸出：新的全域序號；commit 後依賴這些範圍的快取項目失效
+    """
+    seq = cursor.execute(BUMP_SEQUENCE_SQL).fetchone()[0]
+    cursor.executemany(SET_SCOPE_SQL, [(scope, seq) for scope in scopes])
+    return seq
+
+
+def scope_versions(conn, scopes):
+    """
+    輸入：conn、scopes (資料範圍，數量不超過 SQLite 參數上限)
+    輸出：{scope: 最後寫入的序號}，從未寫入的範圍不在結果中
+    """
+    placeholders = ', '.join(['?'] * len(scopes))
+    return dict(conn.execute(SCOPE_SEQ_SQL.format(placeholders=placeholders), list(scopes)).fetchall())
+
+
+class CacheEntry:
+    def __init__(self, seq, deps, etag, body, headers):
+        self.seq = seq
+        self.deps = deps
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+
+
+class ResponseCache:
+    """
+    輸入：capacity (int)，最多保留的回應數
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def begin(self, conn):
+        """
+        輸入：conn (查詢資料用的連線)
+        輸出：目前的全域序號；需在查詢資料前取得，查詢期間發生的寫入才能讓結果失效
+        """
+        return scope_versions(conn, [SEQUENCE_SCOPE]).get(SEQUENCE_SCOPE, 0)
+
+    def invalidate(self, cursor, *scopes):
+        """
+        輸入：cursor、資料範圍 (str)；需在寫入資料的同一個交易中呼叫
+        輸出：無；commit 後依賴這些範圍的快取項目失效
+        """
+        if not scopes:
+            return
+        bump_scopes(cursor, scopes)
+        with self._lock:
+            self._stats['invalidations'] += 1
+
+    def get(self, conn, key):
+        """
+        輸入：conn (查詢資料用的連線)、key (hashable，路由與參數)
+        輸出：仍然有效的 CacheEntry，沒有或已失效時為 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            versions = scope_versions(conn, entry.deps + (ALL_SCOPES,))
+            fresh = all(seq <= entry.seq for seq in versions.values())
+        with self._lock:
+            if entry is not None and fresh:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry
+            if entry is not None and self._entries.get(key) is entry:
+                del self._entries[key]
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, conn, key, seq, deps, body, headers=None):
+        """
+        輸入：conn (查詢資料用的連線)、key、seq (begin 取得的序號)、deps (依賴的資料範圍)、body (bytes)、headers (dict)
+        輸出：CacheEntry；查詢期間有寫入時不放入快取、etag 為 None（仍可回傳給本次請求）
+        """
+        deps = tuple(sorted(set(deps)))
+        versions = scope_versions(conn, deps + (ALL_SCOPES, SEQUENCE_SCOPE))
+        fresh = versions.get(SEQUENCE_SCOPE, 0) == seq
+        etag = None
+        if fresh:
+            # seq 之後沒有任何寫入，versions 即查詢當時的版本
+            raw = repr((key, deps, [versions.get(scope, 0) for scope in deps + (ALL_SCOPES,)])).encode('utf-8')
+            etag = 'W/"' + hashlib.sha1(raw).hexdigest()[:20] + '"'
+        entry = CacheEntry(seq, deps, etag, body, dict(headers or {}))
+        if fresh:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def is_not_modified(self, entry, if_none_match):
+        """
+        輸入：entry、if_none_match (請求的 If-None-Match 標頭)
+        輸出：bool，客戶端的 ETag 與 entry 相同；entry 沒有 ETag 時為 False
+        """
+        if not if_none_match or entry.etag is None:
+            return False
+        matched = entry.etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if matched:
+            with self._lock:
+                self._stats['not_modified'] += 1
+        return matched
+
+    def stats(self):
+        """
+        輸入：無
+        輸出：hits、misses、not_modified (304 次數)、invalidations、size 與命中率
+        """
+        with self._lock:
+            result = dict(self._stats)
+            result['size'] = len(self._entries)
+        lookups = result['hits'] + result['misses']
+        result['hit_rate'] = round(result['hits'] / lookups, 4) if lookups else None
+        return result
@@ -0,0 +1,166 @@
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+from response_cache import ALL_SCOPES, bump_scopes
+
+# AI 分析結果的彙總表（/api/trends）
+# - rollup_keyword：關鍵字出現次數
+# - rollup_category：類別出現次數（依情感細分）
+# - rollup_sentiment：各來源的情感分布
+# 依新聞時間分成小時、日、月三種粒度，bucket 為 news_time 的前綴（'YYYY-MM-DD HH'、'YYYY-MM-DD'、'YYYY-MM'）
+# 寫入分析結果時以 apply_rollups 遞增更新，rebuild_rollups 由 ai_news 全部重算
+
+# 粒度 → bucket 長度（news_time 前綴字數）
+PERIODS = {
+    'hour': 13,
+    'day': 10,
+    'month': 7,
+}
+
+# 彙總表：(表名, 維度欄位)
+ROLLUP_TABLES = {
+    'keyword': ('rollup_keyword', ('keyword_id',)),
+    'category': ('rollup_category', ('category_id', 'sentiment')),
+    'sentiment': ('rollup_sentiment', ('source_website', 'sentiment')),
+}
+
+
+def bucket_of(news_time, period):
+    """
+    輸入：news_time (str，YYYY-MM-DD HH:MM:SS)、period ('hour'、'day'、'month')
+    輸出：所屬 bucket (str)
+    """
+    return news_time[:PERIODS[period]]
+
+
+def _upsert_sql(table, dimensions):
+    columns = ', '.join(dimensions)
+    placeholders = ', '.join(['?'] * (len(dimensions) + 4))
+    return f'''
+        INSERT INTO {table} (period, bucket, ai_model, {columns}, count) VALUES ({placeholders})
+        ON CONFLICT DO UPDATE SET count = count + excluded.count
+    '''
+
+
+def apply_rollups(cursor, news_time, source_website, results, delta=1):
+    """
+    輸入：
+        cursor
+        news_time (str)、source_website (int)：新聞的時間與來源
+        results: [(ai_model, sentiment, category_ids, keyword_ids), ...]，該新聞的分析結果
+        delta: 1 為加入、-1 為移除
+    輸出：無；更新三種粒度的彙總表，需在寫入分析結果的交易中呼叫；沒有新聞時間時不計入
+    """
+    if not news_time:
+        return
+    rows = {name: [] for name in ROLLUP_TABLES}
+    for period in PERIODS:
+        bucket = bucket_of(news_time, period)
+        for ai_model, sentiment, category_ids, keyword_ids in results:
+            rows['sentiment'].append((period, bucket, ai_model, source_website, sentiment, delta))
+            rows['category'].extend((period, bucket, ai_model, category_id, sentiment, delta) for category_id in category_ids)
+            rows['keyword'].extend((period, bucket, ai_model, keyword_id, delta) for keyword_id in keyword_ids)
+    for name, (table, dimensions) in ROLLUP_TABLES.items():
+        cursor.executemany(_upsert_sql(table, dimensions), rows[name])
+
+
+def news_rollup_results(cursor, news_id):
+    """
+    輸入：cursor、news_id
+    輸出：該新聞所有模型的分析結果 [(ai_model, sentiment, category_ids, keyword_ids), ...]（apply_rollups 的輸入）
+    """
+    results = []
+    ai_rows = cursor.execute(
+        'SELECT id, ai_model, ai_sentiment_analysis FROM ai_news WHERE news_id = ?', (news_id,)
+    ).fetchall()
+    for ai_news_id, ai_model, sentiment in ai_rows:
+        category_ids = [row[0] for row in cursor.execute(
+            'SELECT category_id FROM ai_news_category WHERE ai_news_id = ?', (ai_news_id,)
+        ).fetchall()]
+        keyword_ids = [row[0] for row in cursor.execute(
+            'SELECT keyword_id FROM ai_news_keyword WHERE ai_news_id = ?', (ai_news_id,)
+        ).fetchall()]
+        results.append((ai_model, sentiment, category_ids, keyword_ids))
+    return results
+
+
+def rebuild_rollups(cursor):
+    """
+    輸入：cursor
+    輸出：無；清空彙總表後由 ai_news 與關聯表重新計算並讓所有回應快取失效，需在交易中呼叫
+    """
+    sources = {
+        'keyword': ('ai_news_keyword.keyword_id',
+                    'JOIN ai_news_keyword ON ai_news_keyword.ai_news_id = ai_news.id'),
+        'category': ('ai_news_category.category_id, ai_news.ai_sentiment_analysis',
+                     'JOIN ai_news_category ON ai_news_category.ai_news_id = ai_news.id'),
+        'sentiment': ('news.source_website, ai_news.ai_sentiment_analysis', ''),
+    }
+    for name, (table, dimensions) in ROLLUP_TABLES.items():
+        select_columns, join = sources[name]
+        cursor.execute(f'DELETE FROM {table}')
+        for period, length in PERIODS.items():
+            cursor.execute(f'''
+                INSERT INTO {table} (period, bucket, ai_model, {', '.join(dimensions)}, count)
+                SELECT ?, substr(news.news_time, 1, {length}), ai_news.ai_model, {select_columns}, COUNT(*)
+                FROM ai_news
+                JOIN news ON news.id = ai_news.news_id
+                {join}
+                WHERE news.news_time IS NOT NULL
+                GROUP BY 2, 3, {', '.join(str(i) for i in range(4, 4 + len(dimensions)))}
+            ''', (period,))
+    bump_scopes(cursor, [ALL_SCOPES])
+
+
+def split_range(since, until):
+    """
+    輸入：since、until (datetime，含 since 不含 until，以小時為最小單位)
+    輸出：[(period, 起始 bucket, 結束 bucket), ...]；以最少的 bucket 涵蓋整個區間
+          （頭尾不足一日的部分用小時、不足一月的部分用日，中間整月用月）
+    """
+    def fmt(time, period):
+        return bucket_of(time.strftime("%Y-%m-%d %H:%M:%S"), period)
+
+    def next_month(time):
+        return (time.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    since = since.replace(minute=0, second=0, microsecond=0)
+    if until.minute or until.second or until.microsecond:
+        until = until.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    if since >= until:
+        return []
+
+    first_day = since.replace(hour=0) if since.hour == 0 else since.replace(hour=0) + timedelta(days=1)
+    last_day = until.replace(hour=0)
+    if first_day >= last_day:
+        return [('hour', fmt(since, 'hour'), fmt(until, 'hour'))]
+
+    segments = []
+    if since < first_day:
+        segments.append(('hour', fmt(since, 'hour'), fmt(first_day, 'hour')))
+    if last_day < until:
+        segments.append(('hour', fmt(last_day, 'hour'), fmt(until, 'hour')))
+
+    first_month = first_day if first_day.day == 1 else next_month(first_day)
+    last_month = last_day.replace(day=1)
+    if first_month >= last_month:
+        segments.append(('day', fmt(first_day, 'day'), fmt(last_day, 'day')))
+        return segments
+
+    if first_day < first_month:
+        segments.append(('day', fmt(first_day, 'day'), fmt(first_month, 'day')))
+    if last_month < last_day:
+        segments.append(('day', fmt(last_month, 'day'), fmt(last_day, 'day')))
+    segments.append(('month', fmt(first_month, 'month'), fmt(last_month, 'month')))
+    return segments
+
+
+if __name__ == '__main__':
+    # 用法：python rollups.py [news.db]，由既有分析結果重建彙總表
+    database = sys.argv[1] if len(sys.argv) > 1 else 'news.db'
+    with sqlite3.connect(database) as conn:
+        started = datetime.now()
+        rebuild_rollups(conn.cursor())
+        conn.commit()
+        print(f'彙總表已重建 ({(datetime.now() - started).total_seconds():.1f} 秒)')
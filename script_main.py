@@ -1,16 +1,54 @@
-import requests
-from bs4 import BeautifulSoup
-import time
 import json
-import re
 from datetime import datetime
-import random
+import traceback
+import threading
+from concurrent.futures import as_completed
 from configparser import ConfigParser
+from fetch_engine import FetchEngine
+from http_client import HttpClient
+from id_frontier import IdFrontier, FRONTIER_WINDOW, FRONTIER_MAX_JUMP
+from crawl_pipeline import CrawlPipeline, report_stats, UPLOAD_BATCH_SIZE, UPLOAD_BATCH_WAIT
+from news_parsers import parse_ttv_list, parse_ttv_article, parse_setn_article, parse_ebc_list, parse_ebc_article
 
 config = ConfigParser()
 config.read('config.ini')
 WEB_API_ADDRESS = f"{config['WEB_SERVER']['host']}:{config['WEB_SERVER']['port']}"
 
+# 各新聞網站的抓取預算 (每秒請求數, 可累積的請求數)，可由 config.ini 的 [CRAWLER] 區段覆寫
+crawler_config = config['CRAWLER'] if config.has_section('CRAWLER') else {}
+HOST_RATE = float(crawler_config.get('rate_per_host', 0.5))
+HOST_BURST = int(crawler_config.get('burst_per_host', 2))
+HOST_LIMITS = {
+    'news.ttv.com.tw': (HOST_RATE, HOST_BURST),
+    'www.setn.com': (HOST_RATE, HOST_BURST),
+    'news.ebc.net.tw': (HOST_RATE, HOST_BURST),
+}
+# 新聞網站與本地 API 共用連線；新聞清單頁以 ETag / Last-Modified 快取
+http_client = HttpClient(
+    cache_dir=crawler_config.get('cache_dir', 'http_cache'),
+    max_cache_bytes=int(crawler_config.get('cache_max_mb', 200)) * 1024 * 1024,
+)
+engine = FetchEngine(
+    max_in_flight=int(crawler_config.get('max_in_flight', 8)),
+    host_limits=HOST_LIMITS,
+    max_retries=int(crawler_config.get('max_retries', 3)),
+    session=http_client,
+)
+
+# 內文頁的分段管線（抓取 → 解析行程池 → 批次上傳），於 main() 建立後傳給 get_ttv_news / get_ebc_news
+# 解析行程數預設為 CPU 核心數；report_interval 秒輸出一次各階段佇列深度，0 為不輸出
+PARSE_WORKERS = int(crawler_config.get('parse_workers', 0)) or None
+UPLOAD_BATCH = int(crawler_config.get('upload_batch_size', UPLOAD_BATCH_SIZE))
+UPLOAD_WAIT = float(crawler_config.get('upload_batch_wait', UPLOAD_BATCH_WAIT))
+REPORT_INTERVAL = float(crawler_config.get('report_interval', 10))
+
+# 三立依 NewsID 流水號爬取：沒有爬取紀錄時由此 ID 之後開始，每次同時探測的 ID 數與空缺時最遠的搜尋距離
+SETN_START_ID = int(crawler_config.get('setn_start_id', 1667047))
+SETN_WINDOW = int(crawler_config.get('setn_window', FRONTIER_WINDOW))
+SETN_MAX_JUMP = int(crawler_config.get('setn_max_jump', FRONTIER_MAX_JUMP))
+SETN_STATE_CATEGORY = 'NewsID'  # crawl_state 中記錄 NewsID 前緣的類別名稱
+SETN_KNOWN = 'known'            # 探測結果：已寫入資料庫
+
 # TODO 限制爬取的時間區間
 
 headers = {
@@ -30,10 +68,59 @@ headers = {
     }
 
 
+def nack_query_item(query_data):
+    # 爬取失敗，釋放租約讓新聞回到待爬清單
+    items = [{'id': query_data['id'], 'lease_token': query_data['lease_token']}]
+    http_client.post(f'http://{WEB_API_ADDRESS}/wait_query_list/nack', json={'items': items})
+
 def format_datetime(news_time):
     dt_object = datetime.strptime(news_time, "%Y.%m.%d %H:%M")
     return dt_object.strftime("%Y-%m-%d %H:%M:%S")
 
+def load_crawl_state(source_website):
+    # 各清單類別上次爬取時最新的一篇 {category: {last_url, last_time, updated_at}}
+    res = http_client.get(f'http://{WEB_API_ADDRESS}/crawl_state', params={'source_website': source_website})
+    res.raise_for_status()
+    return res.json()
+
+def save_crawl_state(source_website, category, newest, last_id=None):
+    # 類別的清單爬完後記錄本次最新的一篇，下次爬到這篇為止
+    if newest is None:
+        return
+    json_data = {'source_website': source_website, 'category': category,
+                 'last_url': newest['news_url'], 'last_time': newest.get('news_time'), 'last_id': last_id}
+    http_client.put(f'http://{WEB_API_ADDRESS}/crawl_state', json=json_data).raise_for_status()
+
+def filter_new_news(req_news, state):
+    # 清單由新到舊排列：遇到上次記錄的最新一篇或更舊的新聞即停止，其餘再向 API 確認是否已寫入
+    # 回傳 (尚未寫入的新聞, 是否已到達爬過的部分)
+    new_news = []
+    for news in req_news:
+        if state and (news['news_url'] == state['last_url'] or
+                      (state['last_time'] and news.get('news_time') and news['news_time'] < state['last_time'])):
+            break
+        new_news.append(news)
+    reached_known = len(new_news) < len(req_news)
+
+    if new_news:
+        res = http_client.post(f'http://{WEB_API_ADDRESS}/news/known', json={'urls': [news['news_url'] for news in new_news]})
+        res.raise_for_status()
+        known = set(res.json()['known'])
+        if known:
+            reached_known = True
+            new_news = [news for news in new_news if news['news_url'] not in known]
+    return new_news, reached_known
+
+def upload_news_list(new_news):
+    # 上傳清單中的新新聞，回傳 (成功數, 失敗數)
+    if not new_news:
+        return 0, 0
+    res = http_client.post(f'http://{WEB_API_ADDRESS}/news', json=new_news)
+    res_objs = json.loads(res.text)
+    if res_objs['errors']:
+        print(res_objs['errors'])
+    return len(res_objs['success']), len(res_objs['errors'])
+
 def get_ttv_news_list():
     # 取新聞清單
     my_headers = {
@@ -41,47 +128,32 @@ def get_ttv_news_list():
     }
 
     category_list = ['政治', '國際', '社會', '娛樂', '生活', '氣象', '地方', '健康', '體育', '財經']
+    crawl_state = load_crawl_state(1)
     for category in category_list:
+        newest = None
         # 1~60 ok
         for i in range(1, 30):
-            req_news = []
-            res = requests.get(f'https://news.ttv.com.tw/category/{category}/{i}', headers=my_headers)
-            soup = BeautifulSoup(res.text, 'lxml')
-            news_list = soup.select('article.container a')
-            for news in news_list:
-                news_title = news.select('div.title')[0].text.strip()
-                news_time = news.select('div.time')[0].text.strip()
-
-                dt_object = datetime.strptime(news_time, "%Y.%m.%d %H:%M")
-                # 判斷時間
-                if dt_object.year < 2024:
-                    continue
-
-                news_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
-
-                # news_time = format_datetime(news_time)
-                link = news['href']
-                # print(f'標題: {news_title}')
-                # print(f'時間: {news_time}')
-                # print(f'連結: {link}')
-
-                req_news.append({'news_time': news_time, 'news_title': news_title, 'news_url': link, 'source_website': 1})
-            res = requests.post(f'http://{WEB_API_ADDRESS}/news', json=req_news)
-            # print(req_news)
-
-            # 確保清單不會一直重複查詢
-            res_objs = json.loads(res.text)
-            success_count = len(res_objs['success'])
-            errors_count = len(res_objs['errors'])
+            res = engine.fetch('GET', f'https://news.ttv.com.tw/category/{category}/{i}', headers=my_headers, cache=True)
+            if res.from_cache:
+                # 清單頁沒有變動，內容都已上傳過
+                print(f'{category} 第{i}頁 未更新')
+                break
+            req_news = parse_ttv_list(res.text)
+            if newest is None and req_news:
+                newest = req_news[0]
+
+            # 只上傳上次爬取之後的新聞，到達爬過的部分即停止
+            new_news, reached_known = filter_new_news(req_news, crawl_state.get(category))
+            success_count, errors_count = upload_news_list(new_news)
             print(f'{category} 第{i}頁 上傳成功: {success_count}, 上傳失敗: {errors_count}')
-            time.sleep(random.randint(1,3))
-            if success_count == 0:
-                print(f'{category}類別已查詢完成')
+            if reached_known or success_count == 0:
                 break
+        print(f'{category}類別已查詢完成')
+        save_crawl_state(1, category, newest)
 
-def get_ttv_news():
-    # 取得待爬清單
-    res = requests.post(f'http://{WEB_API_ADDRESS}/wait_query_list', json={'source_website': 1, 'count': 10})
+def get_ttv_news(pipeline):
+    # 取得待爬清單，交給 pipeline (CrawlPipeline) 抓取內文
+    res = http_client.post(f'http://{WEB_API_ADDRESS}/wait_query_list', json={'source_website': 1, 'count': 10})
     query_list = json.loads(res.text)
 
     # 取新聞內容
@@ -91,103 +163,83 @@ def get_ttv_news():
     if len(query_list) == 0:
         return 0
 
+    # 抓取、解析與上傳由管線分段進行，寫入內容 (query_state=2) 即完成租約
     for query_data in query_list:
-        res = requests.get(query_data['news_url'], headers=my_headers)
-        soup = BeautifulSoup(res.text, 'lxml')
-
-        # 標題
-        title = soup.select("h1.mb-ht-hf")[0].text.strip()
-        title = re.sub(r'\u3000', ' ', title)
-
-        # 類別
-        category = [soup.select("div#crumbs li")[-1].text]
-
-        # 標籤
-        ul = soup.select("ul.news-status > ul.tag li")
-        keywords = [li.text for li in ul]
-        print(keywords)
-
-        # 抓取圖片
-        imgs = soup.select("article#contentarea img")
-
-        if len(imgs) > 1:
-            src = imgs[1]['src']
-        elif len(imgs) > 0:
-            src = imgs[0]['src']
-        else:
-            src = None
-
-        # 內文
-        p = soup.select("div#newscontent > p")
-        content = '\n'.join([x.text for x in p])
-
-        # 抓取編輯
-        author = re.search(r'責任編輯／([\u4e00-\u9fff]+)', content)
-        author = author[1] if author else None
-
-        json_data = {'news_title': title, 'news_content': content, 'image_url': src, 'keywords': keywords, 'category': category, 'author': author, 'query_state': 2}
-        response = requests.put(f'http://{WEB_API_ADDRESS}/news/{query_data['id']}', json=json_data)
-        print('id:', query_data['id'], response.reason)
-
-        time.sleep(random.randint(0,3))
+        pipeline.submit('GET', query_data['news_url'], parse_ttv_article, context=query_data, headers=my_headers)
     return 1
 
-def get_setn_news():
-    # max 1667048, min 1654698
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36',
-    }
-    num = 0
-    for i in range(1667048, 1668000, 1):
-        link = f'https://www.setn.com//News.aspx?NewsID={i}&utm_campaign=viewallnews'
-        response = requests.get(link, headers=headers)
-        soup = BeautifulSoup(response.text, 'lxml')
-
-        ld_json_scripts = soup.find('script', type='application/ld+json')
-        data = json.loads(ld_json_scripts.string)
-
-        soup_news_title = soup.select('h1.news-title-3')
-        if soup_news_title == []:
-            print('無資料')
-            num += 1
-            if num > 5:
-                print('超過5筆無資料...')
-                break
+def upload_articles(batch):
+    # 管線的上傳階段：以 PUT /news 整批寫入內文，失敗的新聞釋放租約
+    items = [dict(news, id=query_data['id'], query_state=2) for query_data, news in batch]
+    res = http_client.put(f'http://{WEB_API_ADDRESS}/news', json=items)
+    res.raise_for_status()
+    res_objs = res.json()
+    print(f'上傳內文 成功: {len(res_objs["success"])}, 失敗: {len(res_objs["errors"])}')
+    failed = {error['id'] for error in res_objs['errors']}
+    for query_data, _ in batch:
+        if query_data['id'] in failed:
+            nack_query_item(query_data)
+
+def article_failed(query_data, error):
+    # 抓取、解析或上傳失敗，釋放租約讓新聞回到待爬清單
+    traceback.print_exception(error)
+    nack_query_item(query_data)
+
+setn_headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36',
+}
+
+def setn_news_url(news_id):
+    return f'https://www.setn.com//News.aspx?NewsID={news_id}&utm_campaign=viewallnews'
+
+def probe_setn_news(news_ids):
+    # 同時探測多個 NewsID：已寫入的不再請求 (SETN_KNOWN)，其餘抓取並解析，不存在 (404 或沒有標題) 為 None
+    # 請求重試後仍失敗或回應 404 以外的錯誤狀態時拋出例外，本次停止且前緣不前進，下次由已保存的進度繼續
+    links = {news_id: setn_news_url(news_id) for news_id in news_ids}
+    res = http_client.post(f'http://{WEB_API_ADDRESS}/news/known', json={'urls': list(links.values())})
+    res.raise_for_status()
+    known = set(res.json()['known'])
+
+    results = {news_id: SETN_KNOWN for news_id, link in links.items() if link in known}
+    futures = {engine.submit('GET', link, headers=setn_headers): news_id for news_id, link in links.items() if link not in known}
+    for future in as_completed(futures):
+        news_id = futures[future]
+        response = future.result()
+        if response.status_code == 404:
+            results[news_id] = None
             continue
-        news_title = soup_news_title[0].text
-
-        # 內文
-        content = data['description']
-
-        # 抓取編輯
-        author = None
-        for k, v in data['author'].items():
-            if k == 'name':
-                author = v
-
+        response.raise_for_status()
+        try:
+            results[news_id] = parse_setn_article(links[news_id], response.text)
+        except Exception:
+            traceback.print_exc()
+            results[news_id] = None
+    return results
+
+def upload_setn_news(news_id, news):
+    if news == SETN_KNOWN:
+        return
+    res = http_client.post(f'http://{WEB_API_ADDRESS}/news', json=[news])
+    print(news_id, json.loads(res.text))
 
-        # 抓取圖片
-        src = None
-        for k, v in data['image'].items():
-            if k == 'url':
-                src = v
-
-        # 日期時間
-        dt = datetime.fromisoformat(data['datePublished'])
-        news_time = dt.strftime("%Y-%m-%d %H:%M:%S")
+def get_setn_news():
+    # 由上次確認的 NewsID 往後爬取，遇到空缺時向後搜尋，直到最新
+    state = load_crawl_state(2).get(SETN_STATE_CATEGORY)
+    last_id = state['last_id'] if state and state['last_id'] else SETN_START_ID
 
-        keywords = data['keywords']
-        category = data['articleSection']
+    def checkpoint(news_id):
+        save_crawl_state(2, SETN_STATE_CATEGORY, {'news_url': setn_news_url(news_id)}, last_id=news_id)
 
-        json_data = [{'news_title': news_title, 'news_content': content, 'image_url': src, 'keywords': keywords, 'category': category, 'author': author, 'query_state': 2, 'news_url': link, 'source_website': 2, 'news_time': news_time}]
-        res = requests.post(f'http://{WEB_API_ADDRESS}/news', json=json_data)
-        print(json.loads(res.text))
-        time.sleep(random.randint(2,4))
+    frontier = IdFrontier(probe_setn_news, upload_setn_news, window=SETN_WINDOW, max_jump=SETN_MAX_JUMP)
+    newest_id = frontier.crawl(last_id, checkpoint)
+    print(f'三立 NewsID {last_id} → {newest_id}，請求 {frontier.requests} 次')
 
 def get_ebc_news_list():
     # 取新聞清單
     category_list = ['politics', 'living', 'society', 'world', 'sport', 'business', 'health']
+    crawl_state = load_crawl_state(3)
     for category in category_list:
+        newest = None
         # 30, 50
         for i in range(1, 20):
 
@@ -197,33 +249,23 @@ def get_ebc_news_list():
                 'page': i,
             }
 
-            response = requests.post(f'https://news.ebc.net.tw/category/load', headers=headers, data=data)
-
-            soup = BeautifulSoup(response.text, 'lxml')
-            news_list = soup.select('a.item.col3')
-            req_news = []
-            for news in news_list:
-                news_title = news['title']
+            response = engine.fetch('POST', 'https://news.ebc.net.tw/category/load', headers=headers, data=data)
 
-                link = f'https://news.ebc.net.tw/{news['href']}'
+            req_news = parse_ebc_list(response.text)
+            if newest is None and req_news:
+                newest = req_news[0]
 
-                req_news.append({'news_title': news_title, 'news_url': link, 'source_website': 3})
-            res = requests.post(f'http://{WEB_API_ADDRESS}/news', json=req_news)
-            # print(req_news)
-
-            # 確保清單不會一直重複查詢
-            res_objs = json.loads(res.text)
-            success_count = len(res_objs['success'])
-            errors_count = len(res_objs['errors'])
-            print(res_objs['errors'])
+            # 只上傳上次爬取之後的新聞，到達爬過的部分即停止
+            new_news, reached_known = filter_new_news(req_news, crawl_state.get(category))
+            success_count, errors_count = upload_news_list(new_news)
             print(f'上傳成功: {success_count}, 上傳失敗: {errors_count}')
-            time.sleep(random.randint(1,3))
-            if success_count == 0:
-                print(f'{category}類別已查詢完成')
+            if reached_known or success_count == 0:
                 break
+        print(f'{category}類別已查詢完成')
+        save_crawl_state(3, category, newest)
 
-def get_ebc_news():
-    res = requests.post(f'http://{WEB_API_ADDRESS}/wait_query_list', json={'source_website': 3, 'count': 10})
+def get_ebc_news(pipeline):
+    res = http_client.post(f'http://{WEB_API_ADDRESS}/wait_query_list', json={'source_website': 3, 'count': 10})
     query_list = json.loads(res.text)
 
 
@@ -232,62 +274,42 @@ def get_ebc_news():
     if len(query_list) == 0:
         return 0
 
+    # 抓取、解析與上傳由管線分段進行
     for query_data in query_list:
-        res = requests.get(query_data['news_url'], headers=headers)
-        soup = BeautifulSoup(res.text, 'lxml')
-
-        ld_json_scripts = soup.find('script', type='application/ld+json').string
-        ld_json_scripts = re.sub(r"[\x00-\x1F\x7F]", "", ld_json_scripts)
-        data = json.loads(ld_json_scripts)[0]
-
-        # 標題
-        title = data['headline']
-
-        # 類別
-        category = [data['articleSection']]
-
-        # 標籤
-        keywords = data['keywords'].split(',') if 'keywords' in data else None
-
-        # 抓取圖片
-        src = data['image']
-
-        # 內文
-        p = soup.select("div.article_content > p")
-        content = '\n'.join([x.text for x in p])
-
-        # 抓取編輯
-        # 抓取編輯
-        # 實習編輯 黃X亮
-        author = re.search(r'編輯 ([\u4e00-\u9fff]+)', data['author']['name'])
-        author = author[1] if author else data['author']['name']
-
-        # 日期時間
-        dt_object = datetime.fromisoformat(data['dateCreated'])
-        news_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
-
-        json_data = {'news_title': title, 'news_content': content, 'image_url': src, 'keywords': keywords, 'category': category, 'author': author, 'news_time': news_time, 'query_state': 2}
-
-        response = requests.put(f'http://{WEB_API_ADDRESS}/news/{query_data['id']}', json=json_data)
-        print(json_data)
-        print('id:', query_data['id'], response.reason)
-
-        time.sleep(random.randint(1,3))
+        pipeline.submit('GET', query_data['news_url'], parse_ebc_article, context=query_data, headers=headers)
     return 1
 
-# def main():
-
-if __name__ == '__main__':
-    # get_ttv_news_list()
-    # while True:
-    #     is_wait_qurey = get_ttv_news()
-    #     if is_wait_qurey == 0:
-    #         break
-
-    # get_setn_news()
+def crawl_ttv(pipeline):
+    get_ttv_news_list()
+    while get_ttv_news(pipeline):
+        pass
 
+def crawl_ebc(pipeline):
     get_ebc_news_list()
-    while True:
-        is_wait_qurey = get_ebc_news()
-        if is_wait_qurey == 0:
-            break
+    while get_ebc_news(pipeline):
+        pass
+
+def main():
+    # 內文頁的抓取、解析與上傳分段進行，解析使用多個行程；定期輸出各階段佇列深度
+    article_pipeline = CrawlPipeline(engine, upload_articles, article_failed, parse_workers=PARSE_WORKERS,
+                                     batch_size=UPLOAD_BATCH, batch_wait=UPLOAD_WAIT)
+    stop_report = threading.Event()
+    if REPORT_INTERVAL > 0:
+        threading.Thread(target=report_stats, args=(article_pipeline, REPORT_INTERVAL, stop_report), daemon=True).start()
+
+    # 三個來源同時爬取，各自受網站預算限制
+    threads = [
+        threading.Thread(target=crawl_ttv, name='crawl_ttv', args=(article_pipeline,)),
+        threading.Thread(target=get_setn_news, name='get_setn_news'),
+        threading.Thread(target=crawl_ebc, name='crawl_ebc', args=(article_pipeline,)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    article_pipeline.close()
+    stop_report.set()
+    engine.shutdown()
+
+if __name__ == '__main__':
+    main()
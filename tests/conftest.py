@@ -0,0 +1,126 @@
+import importlib
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import web_nain  # noqa: E402
+from ai_result_cache import AiResultCache  # noqa: E402
+from migrations import migrate_db  # noqa: E402
+from name_cache import NameCache  # noqa: E402
+from related_index import RelatedIndex  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+
+
+def import_with_example_config(directory, name):
+    """
+    輸入：directory (暫存目錄)、name (模組名稱)
+    輸出：模組；匯入時讀取目前目錄 config.ini 的模組，以 config.ini.example 的設定匯入
+    """
+    shutil.copy(os.path.join(ROOT, 'config.ini.example'), os.path.join(directory, 'config.ini'))
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        return importlib.import_module(name)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """
+    輸入：無
+    輸出：已升級至最新版本的暫存資料庫路徑
+    """
+    path = str(tmp_path / 'news.db')
+    with sqlite3.connect(path) as conn:
+        migrate_db(conn)
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    """
+    輸入：無
+    輸出：暫存資料庫的連線（row_factory 為 sqlite3.Row）
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def app(db_path, tmp_path, monkeypatch):
+    """
+    輸入：無
+    輸出：指向暫存資料庫的 Flask app；連線池與各快取每個測試各自一份
+    """
+    monkeypatch.setattr(web_nain, 'DATABASE', db_path)
+    monkeypatch.setattr(web_nain, 'db_pools', {})
+    monkeypatch.setattr(web_nain, 'name_cache', NameCache())
+    monkeypatch.setattr(web_nain, 'ai_result_cache', AiResultCache())
+    monkeypatch.setattr(web_nain, 'response_cache', ResponseCache())
+    monkeypatch.setattr(web_nain, 'related_index', RelatedIndex(str(tmp_path / 'related_index')))
+    web_nain.app.config['TESTING'] = True
+    yield web_nain.app
+    for pool in web_nain.db_pools.values():
+        pool.close_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_news(index, source_website=1, **fields):
+    """
+    輸入：index (int，用來產生不重複的標題與連結)、source_website、fields (覆寫的欄位)
+    輸出：POST /news 的一篇新聞 (dict)
+    """
+    news = {
+        'news_title': f'新聞標題 {index}',
+        'news_url': f'https://example.com/news/{index}',
+        'source_website': source_website,
+        'news_time': f'2025-01-01 {index % 24:02d}:00:00',
+        'news_content': f'第 {index} 篇新聞的內容，' + '各不相同的段落。' * (index % 7 + 1) + str(index) * 20,
+        'query_state': 2,
+    }
+    news.update(fields)
+    return news
+
+
+MODEL = 'gemma3:4b-it-qat'
+
+
+def add_news(client, items):
+    """
+    輸入：client、items (POST /news 的新聞 list)
+    輸出：新增的新聞 id (list，順序同 items)
+    """
+    response = client.post('/news', json=items)
+    assert response.status_code == 201
+    ids = {item['data']['news_url']: item['id'] for item in response.get_json()['success']}
+    return [ids[item['news_url']] for item in items]
+
+
+def analyze_all(client, title='AI 標題', keywords=('關鍵字',)):
+    """
+    輸入：client、title、keywords
+    輸出：完成分析的新聞 id (list)；認領所有等待分析的新聞並以相同結果寫入
+    """
+    response = client.post('/wait_ai_handle_list', json={'count': 100, 'model': MODEL})
+    news_ids = []
+    for item in response.get_json():
+        response = client.post('/add_ai_news', json={
+            'news_id': item['id'], 'model': MODEL, 'lease_token': item['lease_token'],
+            'title': title, 'category': ['政治'], 'keywords': list(keywords), 'sentiment_analysis': '中立',
+        })
+        assert response.status_code == 201
+        news_ids.append(item['id'])
+    return news_ids
@@ -0,0 +1,110 @@
+import pytest
+
+import web_nain
+from conftest import make_news
+
+MODEL = 'gemma3:4b-it-qat'
+MODEL_ID = web_nain.reversed_AI_MODEL_ENUM[MODEL]
+
+
+def analysis(news_id, lease_token, title='AI 標題'):
+    return {
+        'news_id': news_id, 'model': MODEL, 'lease_token': lease_token,
+        'title': title, 'category': ['政治'], 'keywords': ['關鍵字'], 'sentiment_analysis': '中立',
+    }
+
+
+def job_state(conn, news_id):
+    row = conn.execute('SELECT state FROM ai_job WHERE news_id = ? AND ai_model = ?', (news_id, MODEL_ID)).fetchone()
+    return row['state'] if row else None
+
+
+def claim(client, count=10, **fields):
+    response = client.post('/wait_ai_handle_list', json={'count': count, 'model': MODEL, **fields})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+@pytest.fixture
+def news_ids(client):
+    response = client.post('/news', json=[make_news(i) for i in range(3)])
+    assert response.status_code == 201
+    return sorted(item['id'] for item in response.get_json()['success'])
+
+
+def test_claim_marks_jobs_in_progress_once(client, conn, news_ids):
+    first = claim(client)
+    assert sorted(item['id'] for item in first) == news_ids
+    assert len({item['lease_token'] for item in first}) == 1
+    assert all(job_state(conn, news_id) == 1 for news_id in news_ids)
+
+    # 處理中的工作不會再被認領
+    assert claim(client) == []
+
+
+def test_add_ai_news_completes_the_job(client, conn, news_ids):
+    item = claim(client, count=1)[0]
+    response = client.post('/add_ai_news', json=analysis(item['id'], item['lease_token']))
+    assert response.status_code == 201
+    assert job_state(conn, item['id']) == 2
+    assert conn.execute('SELECT COUNT(*) FROM ai_news WHERE news_id = ?', (item['id'],)).fetchone()[0] == 1
+
+
+def test_add_ai_news_requires_lease_token(client, news_ids):
+    item = claim(client, count=1)[0]
+    data = analysis(item['id'], item['lease_token'])
+    del data['lease_token']
+    assert client.post('/add_ai_news', json=data).status_code == 400
+
+
+def test_duplicate_submit_returns_409(client, conn, news_ids):
+    item = claim(client, count=1)[0]
+    assert client.post('/add_ai_news', json=analysis(item['id'], item['lease_token'])).status_code == 201
+    response = client.post('/add_ai_news', json=analysis(item['id'], item['lease_token'], title='重送'))
+    assert response.status_code == 409
+    assert [row['ai_title'] for row in conn.execute('SELECT ai_title FROM ai_news WHERE news_id = ?', (item['id'],))] == ['AI 標題']
+
+
+def test_late_submit_after_reclaim_returns_409(client, conn, news_ids):
+    first = claim(client, count=3, lease_seconds=1)
+    # 租約過期後由另一個 worker 重新認領
+    conn.execute("UPDATE ai_job SET lease_expires_at = '2000-01-01 00:00:00'")
+    conn.commit()
+    second = claim(client, count=3)
+    assert sorted(item['id'] for item in second) == news_ids
+    assert second[0]['lease_token'] != first[0]['lease_token']
+
+    stale = first[0]
+    assert client.post('/add_ai_news', json=analysis(stale['id'], stale['lease_token'])).status_code == 409
+    assert job_state(conn, stale['id']) == 1
+
+    current = next(item for item in second if item['id'] == stale['id'])
+    assert client.post('/add_ai_news', json=analysis(current['id'], current['lease_token'])).status_code == 201
+    assert job_state(conn, stale['id']) == 2
+
+
+def test_nack_retries_then_fails(client, conn, news_ids, monkeypatch):
+    monkeypatch.setattr(web_nain, 'MAX_AI_ATTEMPTS', 2)
+    news_id = news_ids[0]
+    claimed = {item['id']: item for item in claim(client)}
+    # 未超過重試上限時放回佇列（其他工作仍在處理中，只會再認領到這篇），之後標記失敗
+    for expected_state in (0, 3):
+        item = claimed[news_id]
+        response = client.post('/wait_ai_handle_list/nack', json={
+            'items': [{'id': item['id'], 'lease_token': item['lease_token']}], 'model': MODEL,
+        })
+        assert response.get_json() == {'nacked': 1}
+        assert job_state(conn, news_id) == expected_state
+        claimed = {item['id']: item for item in claim(client)}
+    assert claimed == {}
+
+
+def test_expired_lease_is_released_or_failed(client, conn, news_ids, monkeypatch):
+    monkeypatch.setattr(web_nain, 'MAX_AI_ATTEMPTS', 1)
+    claim(client)
+    conn.execute("UPDATE ai_job SET lease_expires_at = '2000-01-01 00:00:00'")
+    conn.commit()
+
+    # 到期時回收；已達重試上限的工作標記失敗，不再被認領
+    assert claim(client) == []
+    assert all(job_state(conn, news_id) == 3 for news_id in news_ids)
@@ -0,0 +1,53 @@
+import web_nain
+from ai_result_cache import AiResultCache, content_hash
+from conftest import MODEL, add_news, make_news
+
+CONTENT = '立法院今天三讀通過修正案，未來違規者將處以更高額的罰鍰，相關規定自公布後三個月施行。' * 2
+
+
+def claim(client, prompt_version):
+    response = client.post('/wait_ai_handle_list', json={'count': 10, 'model': MODEL, 'prompt_version': prompt_version})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_content_hash_ignores_whitespace_and_width():
+    assert content_hash('ＡＢＣ １２３\n內容') == content_hash('ABC123 內容')
+    assert content_hash(' \n') is None
+
+
+def test_identical_content_reuses_the_analysis(client, conn):
+    add_news(client, [make_news(0, news_content=CONTENT)])
+    item = claim(client, 1)[0]
+    response = client.post('/add_ai_news', json={
+        'news_id': item['id'], 'model': MODEL, 'lease_token': item['lease_token'], 'prompt_version': 1,
+        'title': '快取的標題', 'category': ['政治'], 'keywords': ['修法'], 'sentiment_analysis': '中立',
+    })
+    assert response.status_code == 201
+
+    # 另一個來源轉載的相同稿件（空白不同）直接以快取結果完成，不回傳給 worker
+    reposted, = add_news(client, [make_news(1, source_website=2, news_content=' ' + CONTENT.replace('，', '， '))])
+    assert claim(client, 1) == []
+    row = conn.execute('SELECT ai_title FROM ai_news WHERE news_id = ?', (reposted,)).fetchone()
+    assert row['ai_title'] == '快取的標題'
+    assert conn.execute('SELECT state FROM ai_job WHERE news_id = ?', (reposted,)).fetchone()[0] == 2
+    assert conn.execute('SELECT hits FROM ai_result_cache').fetchone()[0] == 1
+
+    # 提示詞版本不同時不使用快取
+    add_news(client, [make_news(2, source_website=3, news_content=CONTENT)])
+    assert len(claim(client, 2)) == 1
+    assert web_nain.ai_result_cache.stats(conn)['hits'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(conn):
+    cache = AiResultCache(capacity=2, evict_interval=1)
+    cursor = conn.cursor()
+    result = {'title': 't', 'category': [], 'keywords': [], 'sentiment_analysis': '中立'}
+    for content, used_at in (('第一篇內容', '2025-01-01'), ('第二篇內容', '2025-01-03'), ('第三篇內容', '2025-01-02')):
+        cache.store(cursor, content, 1, 1, result)
+        cursor.execute('UPDATE ai_result_cache SET last_used_at = ? WHERE content_hash = ?', (used_at, content_hash(content)))
+    cache.store(cursor, '第四篇內容', 1, 1, result)
+    conn.commit()
+
+    remaining = {row[0] for row in conn.execute('SELECT content_hash FROM ai_result_cache')}
+    assert remaining == {content_hash('第二篇內容'), content_hash('第四篇內容')}
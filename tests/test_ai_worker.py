@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from conftest import import_with_example_config
+
+
+@pytest.fixture(scope='module')
+def worker(tmp_path_factory):
+    return import_with_example_config(tmp_path_factory.mktemp('worker'), 'ai_handle_main')
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.in_flight = 0
+        self.samples = []
+        self.releases = 0
+
+    def acquire(self):
+        self.in_flight += 1
+
+    def release(self, latency=None):
+        self.in_flight -= 1
+        self.releases += 1
+        if latency is not None:
+            self.samples.append(latency)
+
+
+def reply(content):
+    return {'choices': [{'message': {'content': content}}]}
+
+
+def result(news_id=None):
+    item = {'title': 't', 'category': ['政治'], 'keywords': ['k'], 'sentiment_analysis': '中立'}
+    if news_id is not None:
+        item['news_id'] = news_id
+    return item
+
+
+class FakeSession:
+    def __init__(self, batch_ids):
+        self.batch_ids = batch_ids
+        self.calls = []
+
+    def chat(self, content):
+        self.calls.append('single')
+        return reply('```json' + json.dumps(result()) + '```')
+
+    def chat_batch(self, news_list):
+        self.calls.append('batch')
+        return reply('```json' + json.dumps([result(news_id) for news_id in self.batch_ids]) + '```')
+
+
+NEWS = [{'id': news_id, 'news_content': '內容'} for news_id in (1, 2, 3, 4)]
+
+
+def test_batch_latency_is_sampled_once_per_article(worker, monkeypatch):
+    times = iter([0.0, 8.0])
+    monkeypatch.setattr(worker.time, 'time', lambda: next(times))
+    limiter = RecordingLimiter()
+
+    pairs, fallbacks = worker.analyze_batch(FakeSession([1, 2, 3, 4]), NEWS, limiter)
+    assert fallbacks == 0 and all(result_json for _, result_json in pairs)
+    assert limiter.samples == [2.0]
+    assert limiter.in_flight == 0
+
+
+def test_fallback_requests_are_not_sampled(worker):
+    limiter = RecordingLimiter()
+    session = FakeSession([1, 2])
+
+    pairs, fallbacks = worker.analyze_batch(session, NEWS, limiter)
+    assert fallbacks == 2 and all(result_json for _, result_json in pairs)
+    assert session.calls == ['batch', 'single', 'single']
+    # 每次模型請求各自取得同時請求數，只有合併請求列入樣本
+    assert limiter.releases == 3
+    assert len(limiter.samples) == 1
+    assert limiter.in_flight == 0
+
+
+def test_limiter_ignores_releases_without_latency(worker):
+    limiter = worker.AdaptiveLimiter(1, 4, target_latency=10, window=2)
+    for latency in (None, None, 1.0, None, 1.0):
+        limiter.acquire()
+        limiter.release(latency)
+    assert limiter.limit == 2
+
+    for latency in (100.0, 100.0):
+        limiter.acquire()
+        limiter.release(latency)
+    assert limiter.limit == 1
@@ -0,0 +1,79 @@
+import pytest
+
+import web_nain
+from conftest import add_news, make_news
+
+
+def claim(client, count=10, **fields):
+    response = client.post('/wait_query_list', json={'source_website': 1, 'count': count, **fields})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def lease_items(items):
+    return [{'id': item['id'], 'lease_token': item['lease_token']} for item in items]
+
+
+def crawl_state(conn, news_id):
+    return conn.execute('SELECT query_state FROM news WHERE id = ?', (news_id,)).fetchone()[0]
+
+
+@pytest.fixture
+def news_ids(client):
+    # 待爬清單：只有連結、尚未爬取內容
+    return add_news(client, [
+        make_news(i, query_state=0, news_content=None) for i in range(3)
+    ] + [make_news(9, source_website=2, query_state=0, news_content=None)])
+
+
+def test_claim_newest_first_once(client, conn, news_ids):
+    items = claim(client, count=2)
+    # RETURNING 的順序不固定，只比對認領到的新聞
+    assert sorted(item['id'] for item in items) == [news_ids[1], news_ids[2]]
+    assert all(crawl_state(conn, item['id']) == 1 for item in items)
+    assert [item['id'] for item in claim(client)] == [news_ids[0]]
+    assert claim(client) == []
+
+
+def test_ack_requires_the_current_token(client, conn, news_ids):
+    items = claim(client)
+    wrong = [{'id': items[0]['id'], 'lease_token': 'other'}]
+    assert client.post('/wait_query_list/ack', json={'items': wrong}).get_json() == {'acked': 0}
+    assert client.post('/wait_query_list/ack', json={'items': lease_items(items[:1])}).get_json() == {'acked': 1}
+    assert crawl_state(conn, items[0]['id']) == 2
+    assert client.post('/wait_query_list/ack', json={'items': [{'id': 1}]}).status_code == 400
+
+
+def test_nack_retries_until_the_attempt_limit(client, conn, news_ids, monkeypatch):
+    monkeypatch.setattr(web_nain, 'MAX_CRAWL_ATTEMPTS', 2)
+    news_id = news_ids[2]
+    for expected_state in (0, 3):
+        item = next(item for item in claim(client, count=1) if item['id'] == news_id)
+        response = client.post('/wait_query_list/nack', json={'items': lease_items([item])})
+        assert response.get_json() == {'nacked': 1}
+        assert crawl_state(conn, news_id) == expected_state
+
+    # 不重試時直接標記失敗
+    item = claim(client, count=1)[0]
+    client.post('/wait_query_list/nack', json={'items': lease_items([item]), 'retry': False})
+    assert crawl_state(conn, item['id']) == 3
+
+
+def test_expired_lease_is_reclaimed(client, conn, news_ids):
+    first = claim(client, lease_seconds=1)
+    conn.execute("UPDATE news SET lease_expires_at = '2000-01-01 00:00:00' WHERE query_state = 1")
+    conn.commit()
+    second = claim(client)
+    assert sorted(item['id'] for item in second) == sorted(item['id'] for item in first)
+    assert second[0]['lease_token'] != first[0]['lease_token']
+
+    # 過期租約的 ack 無效
+    assert client.post('/wait_query_list/ack', json={'items': lease_items(first)}).get_json() == {'acked': 0}
+
+
+def test_put_with_content_releases_the_lease(client, conn, news_ids):
+    item = claim(client, count=1)[0]
+    response = client.put(f'/news/{item["id"]}', json={'query_state': 2, 'news_content': '內容' * 40})
+    assert response.status_code == 200
+    row = conn.execute('SELECT query_state, lease_token FROM news WHERE id = ?', (item['id'],)).fetchone()
+    assert tuple(row) == (2, None)
@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import Future
+
+from crawl_pipeline import CrawlPipeline
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeEngine:
+    """
+    以執行緒模擬 FetchEngine.submit：回應內容為網址最後一段，網址含 'fail' 時抓取失敗；release 設定前不完成
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+        self.threads = []
+
+    def submit(self, method, url, on_done=None, **kwargs):
+        def fetch():
+            self.release.wait()
+            future = Future()
+            if 'fail' in url:
+                future.set_exception(ConnectionError(url))
+            else:
+                future.set_result(FakeResponse(url.rsplit('/', 1)[1]))
+            on_done(future)
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        self.threads.append(thread)
+
+
+def make_pipeline(engine, **kwargs):
+    uploads, errors = [], []
+    lock = threading.Lock()
+
+    def upload(batch):
+        with lock:
+            if any(context == 'reject' for context, _ in batch):
+                raise RuntimeError('upload failed')
+            uploads.append(batch)
+
+    def on_error(context, error):
+        with lock:
+            errors.append((context, type(error).__name__))
+
+    pipeline = CrawlPipeline(engine, upload, on_error, parse_workers=2, batch_wait=0.05, **kwargs)
+    return pipeline, uploads, errors
+
+
+def test_results_are_uploaded_in_batches_and_close_stops():
+    engine = FakeEngine()
+    pipeline, uploads, errors = make_pipeline(engine, batch_size=4)
+    for i in range(10):
+        # 解析函式需可 pickle，以內建的 int 解析回應內容
+        pipeline.submit('GET', f'https://example.com/{i}', int, context=i)
+    assert pipeline.join(timeout=10)
+    pipeline.close()
+
+    assert errors == []
+    assert all(len(batch) <= 4 for batch in uploads)
+    assert sorted(item for batch in uploads for item in batch) == [(i, i) for i in range(10)]
+    stats = pipeline.stats()
+    assert (stats['submitted'], stats['uploaded'], stats['failed']) == (10, 10, 0)
+    assert stats['fetching'] == stats['parsing'] == stats['uploading'] == 0
+    assert not any(thread.is_alive() for thread in pipeline._threads)
+
+
+def test_each_stage_reports_failures():
+    engine = FakeEngine()
+    pipeline, uploads, errors = make_pipeline(engine, batch_size=1)
+    pipeline.submit('GET', 'https://example.com/fail', int, context='fetch')
+    pipeline.submit('GET', 'https://example.com/not-a-number', int, context='parse')
+    pipeline.submit('GET', 'https://example.com/7', int, context='reject')
+    pipeline.submit('GET', 'https://example.com/8', int, context='ok')
+    pipeline.close()
+
+    assert sorted(errors) == [('fetch', 'ConnectionError'), ('parse', 'ValueError'), ('reject', 'RuntimeError')]
+    assert uploads == [[('ok', 8)]]
+    assert pipeline.stats()['failed'] == 3
+
+
+def test_join_waits_for_pending_fetches():
+    engine = FakeEngine()
+    engine.release.clear()
+    pipeline, uploads, _ = make_pipeline(engine)
+    pipeline.submit('GET', 'https://example.com/1', int, context=1)
+    assert not pipeline.join(timeout=0.1)
+    assert pipeline.stats()['fetching'] == 1
+
+    engine.release.set()
+    assert pipeline.join(timeout=10)
+    pipeline.close()
+    assert uploads == [[(1, 1)]]
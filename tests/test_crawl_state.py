@@ -0,0 +1,91 @@
+import pytest
+
+from conftest import add_news, import_with_example_config, make_news
+
+
+@pytest.fixture(scope='module')
+def crawler(tmp_path_factory):
+    return import_with_example_config(tmp_path_factory.mktemp('crawler'), 'script_main')
+
+
+class ApiResponse:
+    def __init__(self, response):
+        self.response = response
+        self.text = response.get_data(as_text=True)
+
+    def json(self):
+        return self.response.get_json()
+
+    def raise_for_status(self):
+        assert self.response.status_code < 400, self.text
+
+
+class ApiClient:
+    """
+    爬蟲對本地 API 的請求改由 Flask 測試 client 處理
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def _path(self, url):
+        return '/' + url.split('/', 3)[3]
+
+    def get(self, url, params=None):
+        return ApiResponse(self.client.get(self._path(url), query_string=params))
+
+    def post(self, url, json=None):
+        return ApiResponse(self.client.post(self._path(url), json=json))
+
+    def put(self, url, json=None):
+        return ApiResponse(self.client.put(self._path(url), json=json))
+
+
+@pytest.fixture
+def api(crawler, client, monkeypatch):
+    monkeypatch.setattr(crawler, 'http_client', ApiClient(client))
+    return crawler
+
+
+def listing(*indexes):
+    # 清單頁由新到舊
+    return [{'news_url': make_news(i)['news_url'], 'news_time': make_news(i)['news_time']} for i in indexes]
+
+
+def test_crawl_state_round_trip(client):
+    for last_url in ('https://example.com/news/1', 'https://example.com/news/2'):
+        response = client.put('/crawl_state', json={
+            'source_website': 1, 'category': '政治', 'last_url': last_url, 'last_time': '2025-01-01 02:00:00',
+        })
+        assert response.status_code == 200
+    state = client.get('/crawl_state', query_string={'source_website': 1}).get_json()
+    assert state['政治']['last_url'] == 'https://example.com/news/2'
+    assert client.get('/crawl_state', query_string={'source_website': 2}).get_json() == {}
+
+    assert client.put('/crawl_state', json={'source_website': 1, 'category': '政治'}).status_code == 400
+    assert client.put('/crawl_state', json={
+        'source_website': 1, 'category': '政治', 'last_url': 'u', 'last_time': '2025/01/01',
+    }).status_code == 400
+
+
+def test_listing_stops_at_the_high_water_mark(api):
+    api.save_crawl_state(1, '政治', listing(5)[0])
+    state = api.load_crawl_state(1)['政治']
+
+    new_news, reached_known = api.filter_new_news(listing(8, 7, 6, 5, 4), state)
+    assert [news['news_url'] for news in new_news] == [news['news_url'] for news in listing(8, 7, 6)]
+    assert reached_known
+
+    # 上次最新的一篇已從清單移除時，以時間判斷
+    new_news, reached_known = api.filter_new_news(listing(8, 7, 3), state)
+    assert len(new_news) == 2 and reached_known
+
+
+def test_listing_without_state_skips_known_news(api, client):
+    add_news(client, [make_news(6)])
+    new_news, reached_known = api.filter_new_news(listing(8, 7, 6, 5), None)
+    assert [news['news_url'] for news in new_news] == [news['news_url'] for news in listing(8, 7, 5)]
+    assert reached_known
+
+    new_news, reached_known = api.filter_new_news(listing(9), None)
+    assert len(new_news) == 1 and not reached_known
@@ -0,0 +1,31 @@
+import pytest
+
+import web_nain
+
+
+def test_pooled_connection_requires_app_context(app):
+    with pytest.raises(RuntimeError):
+        web_nain.get_db_connection()
+
+
+def test_request_reuses_one_connection(app):
+    with app.test_request_context():
+        assert web_nain.get_read_connection() is web_nain.get_read_connection()
+        assert web_nain.get_db_connection() is not web_nain.get_read_connection()
+
+
+def test_exhausted_pool_returns_503(client, monkeypatch):
+    monkeypatch.setattr(web_nain, 'DB_POOL_SIZE', 1)
+    monkeypatch.setattr(web_nain, 'DB_POOL_TIMEOUT', 0.05)
+    pool = web_nain.get_db_pool(readonly=True)
+    held = pool.acquire()
+    try:
+        response = client.get('/crawl_state?source_website=1')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(web_nain.DB_POOL_RETRY_AFTER)
+    finally:
+        pool.release(held)
+
+    # 歸還後恢復正常，且逾時的請求沒有佔用連線
+    assert client.get('/crawl_state?source_website=1').status_code == 200
+    assert pool._idle.qsize() == 1
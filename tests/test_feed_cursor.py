@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import MODEL, add_news, analyze_all, make_news
+from web_nain import FEED_PAGE_SIZE, decode_feed_cursor, encode_feed_cursor, reversed_AI_MODEL_ENUM
+
+SAME_TIME = '2025-01-01 08:00:00'
+
+
+def get_page(client, cursor=None):
+    args = {'ai_model': reversed_AI_MODEL_ENUM[MODEL]}
+    if cursor is not None:
+        args['cursor'] = cursor
+    return client.get('/api/ai_news', query_string=args)
+
+
+def test_cursor_round_trip():
+    cursor = encode_feed_cursor(SAME_TIME, 42)
+    assert decode_feed_cursor(cursor) == (SAME_TIME, 42)
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'WzEsMl0=', 'eyJhIjoxfQ=='])
+def test_malformed_cursor_is_rejected(client, cursor):
+    with pytest.raises(ValueError):
+        decode_feed_cursor(cursor)
+    assert get_page(client, cursor).status_code == 400
+
+
+def test_pages_follow_time_then_id_without_gaps(client, conn):
+    # 多篇新聞時間相同，依 news_id 決定順序；換頁時不會重複或遺漏
+    items = [make_news(i, news_time=SAME_TIME) for i in range(FEED_PAGE_SIZE + 5)]
+    items += [make_news(100 + i, news_time=f'2025-01-0{i + 2} 00:00:00') for i in range(5)]
+    add_news(client, items)
+    analyze_all(client)
+    expected = [row['news_id'] for row in conn.execute(
+        'SELECT news_id FROM ai_feed ORDER BY news_time DESC, news_id DESC'
+    )]
+    assert len(expected) == len(items)
+
+    seen = []
+    cursor = None
+    while True:
+        response = get_page(client, cursor)
+        assert response.status_code == 200
+        seen += [item['news_id'] for item in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert seen == expected
+
+    # 游標落在同時間的新聞之間時，下一頁從同時間、id 較小的新聞接續
+    response = get_page(client, encode_feed_cursor(SAME_TIME, expected[7]))
+    assert [item['news_id'] for item in response.get_json()] == expected[8:8 + FEED_PAGE_SIZE]
@@ -0,0 +1,63 @@
+import pytest
+
+from id_frontier import IdFrontier
+
+
+class FakeSite:
+    """
+    輸入：live (存在的 ID)
+    """
+
+    def __init__(self, live):
+        self.live = set(live)
+        self.probed = []
+        self.found = []
+
+    def probe_many(self, ids):
+        self.probed += ids
+        return {i: f'news {i}' for i in ids if i in self.live}
+
+    def on_found(self, news_id, result):
+        self.found.append(news_id)
+
+
+def crawl(live, last_id=100, **kwargs):
+    site = FakeSite(live)
+    checkpoints = []
+    frontier = IdFrontier(site.probe_many, site.on_found, **kwargs)
+    result = frontier.crawl(last_id, checkpoints.append)
+    # 每個 ID 最多探測一次
+    assert len(site.probed) == len(set(site.probed)) == frontier.requests
+    assert checkpoints == sorted(checkpoints)
+    return site, result, checkpoints
+
+
+def test_contiguous_ids_with_deleted_articles():
+    live = [i for i in range(101, 141) if i not in (105, 120, 121)]
+    site, result, checkpoints = crawl(live, window=16)
+    assert sorted(site.found) == live
+    assert result == 140
+    assert checkpoints[-1] == 140
+
+
+@pytest.mark.parametrize('gap_end', [200, 1000, 3000])
+def test_gap_is_crossed_with_gallop_and_bisect(gap_end):
+    # 空缺之後的 ID 連續到最新一篇（需延伸到某個跳躍探測點，之前的空缺才會被找到）
+    latest = 4300
+    live = list(range(101, 111)) + list(range(gap_end, latest + 1))
+    site, result, _ = crawl(live, window=16, max_jump=4096)
+    assert sorted(site.found) == live
+    assert result == latest
+    # 不逐一探測空缺中的每個 ID
+    assert len([i for i in site.probed if 110 < i < gap_end]) < 100
+
+
+def test_gap_beyond_max_jump_stops_at_the_frontier():
+    site, result, _ = crawl(list(range(101, 111)) + [5000], window=16, max_jump=256)
+    assert result == 110
+    assert 5000 not in site.found
+
+
+def test_no_new_ids_keeps_last_id():
+    site, result, checkpoints = crawl([], last_id=100, window=8, max_jump=64)
+    assert result == 100 and checkpoints == [] and site.found == []
@@ -0,0 +1,72 @@
+import sqlite3
+
+import migrations
+from migrations import get_schema_version, migrate_db
+from rollups import ROLLUP_TABLES, rebuild_rollups
+
+
+def migrate_to(conn, version, monkeypatch):
+    """
+    輸入：conn、version (int)
+    輸出：無；只執行到指定版本
+    """
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, 'MIGRATIONS', [m for m in migrations.MIGRATIONS if m[0] <= version])
+        migrate_db(conn)
+
+
+def test_duplicate_news_are_merged_into_the_kept_row(tmp_path, monkeypatch, capsys):
+    conn = sqlite3.connect(str(tmp_path / 'news.db'))
+    migrate_to(conn, 1, monkeypatch)
+    conn.executemany(
+        "INSERT INTO news (id, news_title, news_url, source_website, news_time) VALUES (?, ?, ?, 1, '2025-01-01 00:00:00')",
+        [(1, 'a', 'url-a'), (2, 'b', 'url-b'), (3, 'a again', 'url-a')]
+    )
+    conn.executemany("INSERT INTO keyword (id, name) VALUES (?, ?)", [(1, 'k1'), (2, 'k2')])
+    conn.executemany("INSERT INTO news_keyword (news_id, keyword_id) VALUES (?, ?)", [(1, 1), (3, 1), (3, 2)])
+    conn.executemany(
+        "INSERT INTO ai_news (id, news_id, ai_title, ai_sentiment_analysis, ai_model) VALUES (?, ?, ?, 0, ?)",
+        [(1, 1, 'first', 1), (2, 3, 'second', 1), (3, 3, 'other model', 2)]
+    )
+    conn.executemany("INSERT INTO ai_news_keyword (ai_news_id, keyword_id) VALUES (?, ?)", [(1, 1), (2, 2), (3, 1)])
+    conn.commit()
+
+    migrate_db(conn)
+
+    assert conn.execute('SELECT id FROM news ORDER BY id').fetchall() == [(1,), (2,)]
+    # 重複新聞的關聯與另一個模型的分析結果改掛到保留的新聞
+    assert conn.execute('SELECT news_id, keyword_id FROM news_keyword ORDER BY 1, 2').fetchall() == [(1, 1), (1, 2)]
+    assert conn.execute('SELECT id, news_id, ai_model FROM ai_news ORDER BY id').fetchall() == [(1, 1, 1), (3, 1, 2)]
+    assert conn.execute(
+        'SELECT ai_news_id, keyword_id FROM ai_news_keyword ORDER BY 1, 2'
+    ).fetchall() == [(1, 1), (1, 2), (3, 1)]
+
+    output = capsys.readouterr().out
+    assert '3->1' in output and '2->1' in output
+
+
+def test_rollup_backfill_matches_rebuild(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'news.db'))
+    migrate_to(conn, 9, monkeypatch)
+    conn.executemany(
+        "INSERT INTO news (id, news_title, news_url, source_website, news_time) VALUES (?, 't', ?, ?, ?)",
+        [(1, 'u1', 1, '2025-01-01 10:00:00'), (2, 'u2', 2, '2025-02-03 04:00:00'), (3, 'u3', 1, None)]
+    )
+    conn.executemany("INSERT INTO keyword (id, name) VALUES (?, ?)", [(1, 'k1'), (2, 'k2')])
+    conn.executemany("INSERT INTO category (id, name) VALUES (?, ?)", [(1, 'c1')])
+    conn.executemany(
+        "INSERT INTO ai_news (id, news_id, ai_title, ai_sentiment_analysis, ai_model) VALUES (?, ?, 't', ?, ?)",
+        [(1, 1, 1, 1), (2, 2, 2, 1), (3, 1, 0, 2), (4, 3, 0, 1)]
+    )
+    conn.executemany("INSERT INTO ai_news_keyword (ai_news_id, keyword_id) VALUES (?, ?)", [(1, 1), (2, 1), (2, 2), (4, 1)])
+    conn.executemany("INSERT INTO ai_news_category (ai_news_id, category_id) VALUES (?, ?)", [(1, 1), (3, 1)])
+    conn.commit()
+
+    migrate_db(conn)
+    assert get_schema_version(conn) == len(migrations.MIGRATIONS)
+
+    tables = [table for table, _ in ROLLUP_TABLES.values()]
+    backfilled = {table: sorted(conn.execute(f'SELECT * FROM {table}').fetchall()) for table in tables}
+    assert all(backfilled.values())
+    rebuild_rollups(conn.cursor())
+    assert {table: sorted(conn.execute(f'SELECT * FROM {table}').fetchall()) for table in tables} == backfilled
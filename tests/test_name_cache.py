@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+from name_cache import NameCache
+
+
+@pytest.fixture
+def db(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    yield conn
+    conn.close()
+
+
+def cached(cache, table):
+    return dict(cache._caches[table])
+
+
+def test_new_names_are_cached_only_after_commit(db):
+    cache = NameCache()
+    cursor = db.cursor()
+    cursor.execute('BEGIN')
+    ids = cache.resolve(cursor, 'keyword', ['颱風', '地震', '颱風'])
+    assert set(ids) == {'颱風', '地震'}
+    assert cached(cache, 'keyword') == {}
+
+    cache.commit(db)
+    assert cached(cache, 'keyword') == ids
+    cursor.execute('BEGIN')
+    assert cache.resolve(cursor, 'keyword', ['颱風']) == {'颱風': ids['颱風']}
+    assert cache.stats()['keyword']['hits'] == 1
+
+
+def test_rolled_back_names_are_discarded(db):
+    cache = NameCache()
+    cursor = db.cursor()
+    cursor.execute('BEGIN')
+    cache.resolve(cursor, 'author', ['記者甲'])
+    db.rollback()
+    cache.discard(db)
+    assert cached(cache, 'author') == {}
+
+    # 回滾後再次新增的名稱取得新的 id
+    cursor.execute('BEGIN')
+    ids = cache.resolve(cursor, 'author', ['記者甲'])
+    cache.commit(db)
+    assert db.execute("SELECT id FROM author WHERE name = '記者甲'").fetchone()[0] == ids['記者甲']
+
+
+def test_savepoint_rollback_is_not_cached(db):
+    cache = NameCache()
+    cursor = db.cursor()
+    cursor.execute('BEGIN')
+    cache.resolve(cursor, 'category', ['政治'])
+    cursor.execute('SAVEPOINT item')
+    cache.resolve(cursor, 'category', ['社會'])
+    cursor.execute('ROLLBACK TO SAVEPOINT item')
+    cursor.execute('RELEASE SAVEPOINT item')
+    cache.commit(db)
+    # commit 時重新查詢，savepoint 中回滾的名稱不進入快取
+    assert set(cached(cache, 'category')) == {'政治'}
+
+
+def test_existing_names_are_cached_immediately_and_warmed(db):
+    db.execute("INSERT INTO keyword (name) VALUES ('既有')")
+    cache = NameCache()
+    cursor = db.cursor()
+    cursor.execute('BEGIN')
+    ids = cache.resolve(cursor, 'keyword', ['既有'])
+    db.rollback()
+    assert cached(cache, 'keyword') == ids
+
+    warmed = NameCache(capacity=1)
+    db.execute("INSERT INTO keyword (name) VALUES ('較新')")
+    warmed.warm(db)
+    assert list(cached(warmed, 'keyword')) == ['較新']
+
+
+def test_invalid_table_is_rejected(db):
+    with pytest.raises(ValueError):
+        NameCache().resolve(db.cursor(), 'news', ['x'])
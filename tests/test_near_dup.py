@@ -0,0 +1,69 @@
+import random
+
+import near_dup
+from conftest import make_news
+from near_dup import minhash, similarity
+
+MODEL = 'gemma3:4b-it-qat'
+ARTICLE = '行政院今天通過明年度中央政府總預算案，總額約新台幣三兆元，其中社會福利支出占比最高，國防預算也創下新高。' * 2
+
+
+def reference_minhash(content):
+    """
+    輸入：content (str)
+    輸出：以 Python 整數逐一計算的 MinHash 簽章，與向量化版本比對
+    """
+    grams = near_dup.shingles(content)
+    if not grams:
+        return None
+    return tuple(
+        min((a * gram + b) % near_dup._PRIME for gram in grams) & near_dup._MAX_HASH
+        for a, b in near_dup._PERMUTATIONS
+    )
+
+
+def test_minhash_matches_reference():
+    rng = random.Random(1)
+    for _ in range(20):
+        content = ''.join(chr(rng.randrange(0x4e00, 0x9fff)) for _ in range(rng.randrange(50, 400)))
+        assert minhash(content) == reference_minhash(content)
+    assert minhash('太短') is None
+
+
+def test_near_duplicates_share_a_cluster_and_skip_ai(client, conn):
+    items = [
+        make_news(1, news_content=ARTICLE),
+        make_news(2, source_website=2, news_content=ARTICLE + '（中央社）'),
+        make_news(3),
+    ]
+    assert similarity(minhash(items[0]['news_content']), minhash(items[1]['news_content'])) >= near_dup.SIMILARITY_THRESHOLD
+    response = client.post('/news', json=items)
+    assert response.status_code == 201
+    ids = {item['data']['news_url']: item['id'] for item in response.get_json()['success']}
+    first, second, other = (ids[item['news_url']] for item in items)
+    clusters = dict(conn.execute('SELECT id, cluster_id FROM news').fetchall())
+    assert clusters[first] == clusters[second] == first
+    assert clusters[other] == other
+
+    # 同群組每次只認領一篇
+    response = client.post('/wait_ai_handle_list', json={'count': 10, 'model': MODEL, 'skip_cluster_duplicates': True})
+    claimed = {item['id']: item for item in response.get_json()}
+    assert set(claimed) == {second, other}
+
+    item = claimed[second]
+    response = client.post('/add_ai_news', json={
+        'news_id': second, 'model': MODEL, 'lease_token': item['lease_token'],
+        'title': 't', 'category': ['政治'], 'keywords': ['預算'], 'sentiment_analysis': '中立',
+    })
+    assert response.status_code == 201
+    # 群組中已有分析結果，其他新聞標記為略過 (state 4)
+    assert conn.execute('SELECT state FROM ai_job WHERE news_id = ?', (first,)).fetchone()[0] == 4
+
+
+def test_unclustered_news_are_not_deduplicated(client, conn):
+    assert client.post('/news', json=[make_news(i) for i in range(3)]).status_code == 201
+    # 分群前寫入的新聞沒有 cluster_id
+    conn.execute('UPDATE news SET cluster_id = NULL')
+    conn.commit()
+    response = client.post('/wait_ai_handle_list', json={'count': 10, 'model': MODEL, 'skip_cluster_duplicates': True})
+    assert len(response.get_json()) == 3
@@ -0,0 +1,61 @@
+from conftest import add_news, make_news
+
+
+def relation_names(conn, news_id, table, entity):
+    return sorted(row[0] for row in conn.execute(
+        f'SELECT {entity}.name FROM {table} JOIN {entity} ON {entity}.id = {table}.{entity}_id WHERE {table}.news_id = ?',
+        (news_id,)
+    ))
+
+
+def test_batch_inserts_news_with_relations(client, conn):
+    items = [
+        make_news(0, author='記者甲', keywords=['颱風', '停班'], category='生活'),
+        make_news(1, author='記者甲', keywords=['颱風'], category='社會'),
+    ]
+    first, second = add_news(client, items)
+
+    assert relation_names(conn, first, 'news_keyword', 'keyword') == ['停班', '颱風']
+    assert relation_names(conn, second, 'news_category', 'category') == ['社會']
+    # 同一批內重複的名稱只建立一次
+    assert conn.execute("SELECT COUNT(*) FROM keyword WHERE name = '颱風'").fetchone()[0] == 1
+    authors = conn.execute('SELECT DISTINCT author_id FROM news').fetchall()
+    assert len(authors) == 1 and authors[0][0] is not None
+
+
+def test_invalid_and_duplicate_items_are_reported(client, conn):
+    add_news(client, [make_news(0)])
+    response = client.post('/news', json=[
+        make_news(0),                                   # 資料庫中已存在
+        make_news(1), make_news(1),                     # 同一批內重複
+        make_news(2, source_website=99),
+        {k: v for k, v in make_news(3).items() if k != 'news_title'},
+    ])
+    assert response.status_code == 201
+    result = response.get_json()
+    assert [item['data']['news_url'] for item in result['success']] == [make_news(1)['news_url']]
+    assert sorted(item['error'] for item in result['errors']) == [
+        'Duplicate news (same time and URL)', 'Duplicate news (same time and URL)',
+        'Invalid source_website', 'Missing field: news_title',
+    ]
+    assert conn.execute('SELECT COUNT(*) FROM news').fetchone()[0] == 2
+
+
+def test_failed_item_falls_back_to_per_item_inserts(client, conn):
+    # 時間格式錯誤的新聞在分群時失敗（內容需夠長才會分群）
+    bad = make_news(1, news_time='not a time', keywords=['回滾'])
+    bad['news_content'] *= 3
+    items = [make_news(0, keywords=['保留']), bad, make_news(2)]
+    response = client.post('/news', json=items)
+    assert response.status_code == 201
+    result = response.get_json()
+    assert sorted(item['data']['news_url'] for item in result['success']) == [items[0]['news_url'], items[2]['news_url']]
+    assert [item['data']['news_url'] for item in result['errors']] == [items[1]['news_url']]
+
+    # 失敗的新聞與其名稱都不會寫入
+    assert conn.execute('SELECT COUNT(*) FROM news').fetchone()[0] == 2
+    assert [row[0] for row in conn.execute('SELECT name FROM keyword')] == ['保留']
+
+    # 名稱快取不保留已回滾的名稱
+    again = add_news(client, [make_news(3, keywords=['回滾'])])
+    assert relation_names(conn, again[0], 'news_keyword', 'keyword') == ['回滾']
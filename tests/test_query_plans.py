@@ -0,0 +1,26 @@
+import sqlite3
+
+import pytest
+
+from migrations import MIGRATIONS, find_full_scans, get_schema_version, migrate_db
+from web_nain import PLAN_CHECKS
+
+
+def test_migrate_db_reaches_latest_version(tmp_path):
+    with sqlite3.connect(str(tmp_path / 'news.db')) as conn:
+        assert migrate_db(conn) == [version for version, _, _ in MIGRATIONS]
+        assert get_schema_version(conn) == len(MIGRATIONS)
+
+        # 已是最新版本時不再執行任何 migration
+        assert migrate_db(conn) == []
+        assert get_schema_version(conn) == len(MIGRATIONS)
+        assert conn.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0] == len(MIGRATIONS)
+
+
+@pytest.mark.parametrize('name, sql, params', PLAN_CHECKS, ids=[name for name, _, _ in PLAN_CHECKS])
+def test_hot_query_uses_index(conn, name, sql, params):
+    assert find_full_scans(conn, [(name, sql, params)]) == {}
+
+
+def test_all_plan_checks_use_indexes(conn):
+    assert find_full_scans(conn, PLAN_CHECKS) == {}
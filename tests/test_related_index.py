@@ -0,0 +1,60 @@
+import sqlite3
+import time
+
+import web_nain
+from conftest import add_news, analyze_all, make_news
+from related_index import RelatedIndex
+
+ARTICLES = [
+    '颱風明天清晨登陸東部，氣象署發布海上與陸上颱風警報，各地停班停課情形請留意公告。',
+    '颱風明天清晨登陸東部，氣象署發布陸上颱風警報，東部與北部山區可能出現豪雨。',
+    '央行理事會決議維持利率不變，總裁表示將持續關注通膨與房市的變化。',
+]
+
+
+def add_articles(client):
+    news_ids = add_news(client, [make_news(i, news_content=content * 2) for i, content in enumerate(ARTICLES)])
+    analyze_all(client)
+    return news_ids
+
+
+def test_query_does_not_refresh_and_refresh_swaps_state(client, conn):
+    news_ids = add_articles(client)
+    index = web_nain.related_index
+    before = index._state
+    # 查詢只讀取目前的狀態，新的分析結果由 refresh（背景執行緒）補上
+    assert index.query(conn.cursor(), news_ids[0], 5) == []
+    assert index._state is before
+
+    index.refresh(conn)
+    assert before.delta_docs == {}
+    assert index.stats()['delta_docs'] == 3
+    related = index.query(conn.cursor(), news_ids[0], 5)
+    assert [news_id for news_id, _ in related][0] == news_ids[1]
+
+    response = client.get(f'/api/ai_news/{news_ids[0]}/related')
+    assert response.status_code == 200
+    assert response.get_json()[0]['news_id'] == news_ids[1]
+
+
+def test_large_delta_triggers_rebuild(client, conn, tmp_path):
+    news_ids = add_articles(client)
+    index = RelatedIndex(str(tmp_path / 'rebuilt'), max_delta_docs=2)
+    index.refresh(conn)
+    stats = index.stats()
+    assert stats['version'] is not None
+    assert (stats['base_docs'], stats['delta_docs']) == (3, 0)
+    assert index.query(conn.cursor(), news_ids[0], 5)[0][0] == news_ids[1]
+
+
+def test_notify_refreshes_in_the_background(client, db_path, tmp_path, monkeypatch):
+    index = RelatedIndex(str(tmp_path / 'background'), database=db_path, interval=60)
+    monkeypatch.setattr(web_nain, 'related_index', index)
+    add_articles(client)
+    # 寫入分析結果後喚醒背景執行緒
+    deadline = time.monotonic() + 5
+    while index.stats()['delta_docs'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert index.stats()['delta_docs'] == 3
+    with sqlite3.connect(db_path) as conn:
+        assert index.stats()['last_ai_news_id'] == conn.execute('SELECT MAX(id) FROM ai_news').fetchone()[0]
@@ -0,0 +1,70 @@
+import sqlite3
+
+from conftest import MODEL, add_news, analyze_all, make_news
+from near_dup import rebuild_clusters
+from response_cache import ALL_SCOPES, bump_scopes
+from web_nain import reversed_AI_MODEL_ENUM
+
+FEED = f'/api/ai_news?ai_model={reversed_AI_MODEL_ENUM[MODEL]}'
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+def test_etag_not_modified_until_a_write(client):
+    news_ids = add_news(client, [make_news(i) for i in range(2)])
+    analyze_all(client)
+    detail = f'/api/ai_news/{news_ids[0]}'
+    for url in (FEED, detail):
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert revalidate(client, url, etag).status_code == 304
+
+    feed_etag = client.get(FEED).headers['ETag']
+    detail_etag = client.get(detail).headers['ETag']
+    response = client.put(f'/news/{news_ids[0]}', json={'news_title': '更新後的標題'})
+    assert response.status_code == 200
+    assert revalidate(client, FEED, feed_etag).status_code == 200
+    response = revalidate(client, detail, detail_etag)
+    assert response.status_code == 200
+    assert response.get_json()['news_title'] == '更新後的標題'
+
+
+def test_unrelated_write_keeps_the_etag(client):
+    news_ids = add_news(client, [make_news(i) for i in range(2)])
+    analyze_all(client)
+    detail = f'/api/ai_news/{news_ids[0]}'
+    etag = client.get(detail).headers['ETag']
+    assert client.put(f'/news/{news_ids[1]}', json={'news_title': '其他新聞'}).status_code == 200
+    assert revalidate(client, detail, etag).status_code == 304
+
+
+def test_writes_from_other_processes_invalidate(client, db_path):
+    add_news(client, [make_news(i) for i in range(2)])
+    analyze_all(client)
+    etag = client.get(FEED).headers['ETag']
+
+    # 其他程式（bulk_load.py、near_dup.py 等）以自己的連線寫入
+    with sqlite3.connect(db_path) as conn:
+        rebuild_clusters(conn)
+    assert revalidate(client, FEED, etag).status_code == 200
+    etag = client.get(FEED).headers['ETag']
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE ai_feed SET ai_title = '外部寫入'")
+        bump_scopes(conn.cursor(), [f'feed:{reversed_AI_MODEL_ENUM[MODEL]}'])
+    response = revalidate(client, FEED, etag)
+    assert response.status_code == 200
+    assert {item['ai_title'] for item in response.get_json()} == {'外部寫入'}
+
+
+def test_rolled_back_write_does_not_invalidate(client, db_path):
+    add_news(client, [make_news(0)])
+    analyze_all(client)
+    etag = client.get(FEED).headers['ETag']
+    with sqlite3.connect(db_path) as conn:
+        bump_scopes(conn.cursor(), [ALL_SCOPES])
+        conn.rollback()
+    assert revalidate(client, FEED, etag).status_code == 304
@@ -0,0 +1,85 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_news, analyze_all, make_news
+from rollups import ROLLUP_TABLES, apply_rollups, rebuild_rollups, split_range
+
+
+def segment_hours(period, start, end):
+    """
+    輸入：split_range 的一段
+    輸出：該段涵蓋的每個小時 (list of datetime)
+    """
+    parse = {'hour': '%Y-%m-%d %H', 'day': '%Y-%m-%d', 'month': '%Y-%m'}[period]
+    time, end = datetime.strptime(start, parse), datetime.strptime(end, parse)
+    hours = []
+    while time < end:
+        hours.append(time)
+        time += timedelta(hours=1)
+    return hours
+
+
+@pytest.mark.parametrize('since, until, expected', [
+    ('2025-01-01 05:00', '2025-01-01 09:30', [('hour', '2025-01-01 05', '2025-01-01 10')]),
+    ('2025-01-01 00:00', '2025-01-03 00:00', [('day', '2025-01-01', '2025-01-03')]),
+    ('2025-01-31 22:00', '2025-04-01 02:00', [
+        ('hour', '2025-01-31 22', '2025-02-01 00'), ('hour', '2025-04-01 00', '2025-04-01 02'),
+        ('month', '2025-02', '2025-04'),
+    ]),
+])
+def test_split_range_examples(since, until, expected):
+    parse = '%Y-%m-%d %H:%M'
+    assert split_range(datetime.strptime(since, parse), datetime.strptime(until, parse)) == expected
+
+
+def test_split_range_covers_each_hour_once():
+    rng = random.Random(1)
+    start = datetime(2024, 1, 1)
+    for _ in range(200):
+        since = start + timedelta(hours=rng.randrange(24 * 500))
+        until = since + timedelta(hours=rng.randrange(24 * 120))
+        hours = [hour for segment in split_range(since, until) for hour in segment_hours(*segment)]
+        assert len(hours) == len(set(hours))
+        assert sorted(hours) == [since + timedelta(hours=i) for i in range((until - since) // timedelta(hours=1))]
+
+
+def rollup_rows(conn):
+    return {
+        table: sorted(tuple(row) for row in conn.execute(f'SELECT * FROM {table} WHERE count != 0'))
+        for table, _ in ROLLUP_TABLES.values()
+    }
+
+
+def rebuilt_rows(conn):
+    conn.execute('BEGIN')
+    rebuild_rollups(conn.cursor())
+    rows = rollup_rows(conn)
+    conn.rollback()
+    return rows
+
+
+def test_apply_and_remove_cancel_out(conn):
+    cursor = conn.cursor()
+    results = [(1, 0, [1, 2], [3]), (2, 1, [1], [])]
+    apply_rollups(cursor, '2025-01-01 10:00:00', 1, results)
+    assert conn.execute("SELECT count FROM rollup_category WHERE period = 'month' AND category_id = 1 AND ai_model = 1").fetchone()[0] == 1
+    apply_rollups(cursor, '2025-01-01 10:00:00', 1, results, delta=-1)
+    apply_rollups(cursor, None, 1, results)
+    assert all(rows == [] for rows in rollup_rows(conn).values())
+
+
+def test_incremental_rollups_match_a_rebuild(client, conn):
+    news_ids = add_news(client, [make_news(i, source_website=i % 3 + 1) for i in range(6)])
+    analyze_all(client, keywords=('颱風', '停班'))
+    assert any(rollup_rows(conn).values())
+    assert rollup_rows(conn) == rebuilt_rows(conn)
+
+    # 新聞時間或來源變更時，分析結果移到新的 bucket
+    assert client.put(f'/news/{news_ids[0]}', json={'news_time': '2025-03-05 12:00:00'}).status_code == 200
+    assert client.put(f'/news/{news_ids[1]}', json={'source_website': 3}).status_code == 200
+    assert rollup_rows(conn) == rebuilt_rows(conn)
+    assert conn.execute(
+        "SELECT count FROM rollup_sentiment WHERE period = 'month' AND bucket = '2025-03'"
+    ).fetchone()[0] == 1
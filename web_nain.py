@@ -1,8 +1,21 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, g, has_app_context, stream_with_context
 import sqlite3
+import base64
+import queue
+import json
 import traceback
+import uuid
 from configparser import ConfigParser
 from datetime import datetime, timedelta
+from migrations import migrate_db
+from db_pool import ConnectionPool, DEFAULT_PRAGMAS, apply_pragmas
+from name_cache import NameCache, SELECT_IDS_SQL
+from ai_result_cache import AiResultCache, LOOKUP_SQL as AI_CACHE_LOOKUP_SQL, EVICT_SQL as AI_CACHE_EVICT_SQL
+from near_dup import assign_cluster, minhash, similar_news_query
+from related_index import RelatedIndex
+from rollups import PERIODS, apply_rollups, bucket_of, news_rollup_results, split_range
+from response_cache import ResponseCache, SCOPE_SEQ_SQL
+from news_export import EXPORT_FORMATS, iter_export, iter_gzip, parse_export_time
 
 app = Flask(__name__)
 DATABASE = 'news.db'
@@ -26,116 +39,121 @@ AI_MODEL_ENUM = {
 
 reversed_AI_MODEL_ENUM = {v: k for k, v in AI_MODEL_ENUM.items()}
 
-# 初始化資料庫
+# 爬取租約：預設租約秒數、同一篇新聞最多認領次數
+DEFAULT_LEASE_SECONDS = 600
+MAX_CRAWL_ATTEMPTS = 5
+
+# AI 工作租約：預設租約秒數、同一個 (news_id, ai_model) 最多嘗試次數
+DEFAULT_AI_LEASE_SECONDS = 900
+MAX_AI_ATTEMPTS = 3
+
+# 資料庫連線設定，可由 config.ini 的 [DATABASE] 區段覆寫
+DB_PRAGMAS = dict(DEFAULT_PRAGMAS)
+DB_POOL_SIZE = 8
+# 連線池已滿時等待歸還的秒數，逾時回應 503 並以 Retry-After 建議重試的秒數
+DB_POOL_TIMEOUT = 10
+DB_POOL_RETRY_AFTER = 1
+db_pools = {}
+
+# 作者、關鍵字、類別的名稱 → id 快取
+name_cache = NameCache()
+
+# AI 分析結果快取；認領工作時最多重複幾輪（命中快取的工作直接完成，再補認領）
+ai_result_cache = AiResultCache()
+AI_CACHE_MAX_ROUNDS = 5
+
+# /api/ai_news 與 /api/ai_news/<id> 的回應快取，依寫入的資料範圍失效
+response_cache = ResponseCache()
+
+# 相關新聞推薦索引（python related_index.py 建立，之後的分析結果由背景執行緒補上，見 related_index.py）
+related_index = RelatedIndex('related_index')
+
+# 初始化資料庫（新建或升級至最新版本）
 def init_db():
     with sqlite3.connect(DATABASE) as conn:
-        cursor = conn.cursor()
-        # author 表
-        cursor.execute('''
-        CREATE TABLE author (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 作者唯一識別碼
-            name VARCHAR(50) NOT NULL,            -- 作者姓名
-            notes TEXT                            -- 備註
-        );
-        ''')
-
-        # news 表
-        cursor.execute('''
-        CREATE TABLE news (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
-            news_time DATETIME,                   -- 新聞時間
-            news_title VARCHAR(50) NOT NULL,      -- 新聞標題
-            news_content TEXT,                    -- 新聞內容
-            image_url TEXT,                       -- 圖片連結
-            news_url TEXT NOT NULL,               -- 新聞連結
-            source_website INTEGER NOT NULL,      -- 來源網站
-            author_id INTEGER,                    -- 作者
-            query_state INTEGER DEFAULT 0,        -- 查詢狀態 (0: 有清單沒內容, 1: 查詢中, 2: 有內容)
-            FOREIGN KEY(author_id) REFERENCES author(id)
-        );
-        ''')
-
-        # keyword 表
-        cursor.execute('''
-        CREATE TABLE keyword (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 關鍵字唯一識別碼
-            name VARCHAR(50) NOT NULL             -- 關鍵字名稱
-        );
-        ''')
-
-        # news_keyword 表
-        cursor.execute('''
-        CREATE TABLE news_keyword (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
-            news_id INTEGER NOT NULL,             -- 關聯新聞 ID
-            keyword_id INTEGER NOT NULL,          -- 關聯關鍵字 ID
-            FOREIGN KEY(news_id) REFERENCES news(id),
-            FOREIGN KEY(keyword_id) REFERENCES keyword(id)
-        );
-        ''')
-
-        # category 表
-        cursor.execute('''
-        CREATE TABLE category (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 類別唯一識別碼
-            name VARCHAR(50) NOT NULL             -- 類別名稱
-        );
-        ''')
-
-        # news_category 表
-        cursor.execute('''
-        CREATE TABLE news_category (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
-            news_id INTEGER NOT NULL,             -- 關聯新聞 ID
-            category_id INTEGER NOT NULL,         -- 關聯類別 ID
-            FOREIGN KEY(news_id) REFERENCES news(id),
-            FOREIGN KEY(category_id) REFERENCES category(id)
-        );
-        ''')
-
-        # ai_news 表
-        cursor.execute('''
-        CREATE TABLE ai_news (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,    -- 唯一識別碼
-            news_id INTEGER NOT NULL,                -- 關聯新聞 ID
-            ai_title VARCHAR(50),                    -- AI 標題
-            ai_sentiment_analysis INTEGER NOT NULL,  -- AI 語意分析 (0:中立、1:正面、2:負面)
-            ai_model INTEGER NOT NULL,               -- AI 模型 (1:gemma3:12b-it-qat、)
-            FOREIGN KEY(news_id) REFERENCES news(id)
-        );
-        ''')
-
-        # ai_news_keyword 表
-        cursor.execute('''
-        CREATE TABLE ai_news_keyword (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
-            ai_news_id INTEGER NOT NULL,          -- 關聯 AI 新聞 ID
-            keyword_id INTEGER NOT NULL,          -- 關聯關鍵字 ID
-            FOREIGN KEY(ai_news_id) REFERENCES ai_news(id),
-            FOREIGN KEY(keyword_id) REFERENCES keyword(id)
-        );
-        ''')
-
-        # ai_news_category 表
-        cursor.execute('''
-        CREATE TABLE ai_news_category (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一識別碼
-            ai_news_id INTEGER NOT NULL,          -- 關聯 AI 新聞 ID
-            category_id INTEGER NOT NULL,         -- 關聯類別 ID
-            FOREIGN KEY(ai_news_id) REFERENCES ai_news(id),
-            FOREIGN KEY(category_id) REFERENCES category(id)
-        );
-        ''')
+        apply_pragmas(conn, {'journal_mode': DB_PRAGMAS['journal_mode']})
+        migrate_db(conn)
+
+def get_db_pool(readonly=False):
+    """
+    輸入：readonly (bool)
+    輸出：目前 DATABASE 對應的連線池（讀寫或唯讀）
+    """
+    key = (DATABASE, readonly)
+    if key not in db_pools:
+        db_pools[key] = ConnectionPool(DATABASE, size=DB_POOL_SIZE, readonly=readonly, pragmas=DB_PRAGMAS)
+    return db_pools[key]
+
+class DatabaseBusy(Exception):
+    """
+    連線池在 DB_POOL_TIMEOUT 秒內沒有可用的連線
+    """
+
+@app.errorhandler(DatabaseBusy)
+def database_busy(error):
+    """
+    輸入：DatabaseBusy
+    輸出：503 錯誤回應，Retry-After 為 DB_POOL_RETRY_AFTER 秒
+    """
+    response = jsonify({'error': 'Database is busy, retry later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(DB_POOL_RETRY_AFTER)
+    return response
+
+def _get_pooled_connection(readonly):
+    """
+    輸入：readonly (bool)
+    輸出：本次請求使用的連線；同一個請求重複取得時回傳同一條連線，請求結束時歸還
+          (只能在 app context 中取得，否則沒有歸還的時機；請求以外請使用 get_db_pool(...).acquire() / release())
+          連線池已滿且 DB_POOL_TIMEOUT 秒內沒有歸還時拋出 DatabaseBusy (503)
+    """
+    if not has_app_context():
+        raise RuntimeError('Database connections from get_db_connection() require an app context')
+
+    pool = get_db_pool(readonly)
+    attr = 'db_read_conn' if readonly else 'db_conn'
+    conn = g.get(attr)
+    if conn is None:
+        try:
+            conn = pool.acquire(timeout=DB_POOL_TIMEOUT)
+        except queue.Empty:
+            raise DatabaseBusy()
+        setattr(g, attr, conn)
+    return conn
 
 # 資料庫連線
 def get_db_connection():
     """
     輸入：無
-    輸出：sqlite3 資料庫連線物件
+    輸出：sqlite3 資料庫連線物件（讀寫）
     """
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return _get_pooled_connection(readonly=False)
+
+def get_read_connection():
+    """
+    輸入：無
+    輸出：sqlite3 資料庫連線物件（唯讀），供查詢用的路由使用
+    """
+    return _get_pooled_connection(readonly=True)
+
+@app.teardown_appcontext
+def release_db_connections(exception):
+    """
+    輸入：exception
+    輸出：無；將本次請求借用的連線歸還連線池
+    """
+    for attr, readonly in (('db_conn', False), ('db_read_conn', True)):
+        conn = g.pop(attr, None)
+        if conn is not None:
+            name_cache.discard(conn)
+            get_db_pool(readonly).release(conn)
+
+def mark_stale(cursor, *scopes):
+    """
+    輸入：cursor、資料範圍 (str)，例如 feed:<model>、news:<id>、cluster:<id>
+    輸出：無；在寫入的同一個交易中更新 cache_scope，commit 後依賴這些範圍的回應快取失效（回滾時不失效）
+    """
+    response_cache.invalidate(cursor, *scopes)
 
 def validate_required_fields(data, required_fields):
     """
@@ -147,18 +165,31 @@ def validate_required_fields(data, required_fields):
             return field
     return None
 
+# IN (...) 查詢的分批大小，避免超過 SQLite 參數上限
+SQL_CHUNK_SIZE = 500
+
+def chunked(items, size=SQL_CHUNK_SIZE):
+    """
+    輸入：items (list), size (int)
+    輸出：依 size 切分的子清單 (generator)
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+EXISTING_NEWS_SQL = "SELECT news_url FROM news WHERE news_url IN ({placeholders})"
+
 def check_existing_news_batch(cursor, news_items):
     """
     輸入：cursor, news_items (list of dict)
     輸出：set，存在於資料庫中的 news_url
     """
     urls = [item['news_url'] for item in news_items]
-    if not urls:
-        return set()
-    placeholders = ', '.join(['?'] * len(urls))
-    sql = f"SELECT news_url FROM news WHERE news_url IN ({placeholders})"
-    cursor.execute(sql, urls)
-    return set(row['news_url'] for row in cursor.fetchall())
+    existing = set()
+    for chunk in chunked(urls):
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(EXISTING_NEWS_SQL.format(placeholders=placeholders), chunk)
+        existing.update(row['news_url'] for row in cursor.fetchall())
+    return existing
 
 def construct_insert_query(table_name, data_sample):
     """
@@ -175,30 +206,28 @@ def get_or_create(cursor, table, name):
     輸入：cursor, table (str), name (str)
     輸出：資料表對應的 id (int)，若不存在則新增
     """
+    return get_or_create_id_map(cursor, table, [name])[name]
 
-    cursor.execute(f"SELECT id FROM {table} WHERE name = ?", (name,))
-    record = cursor.fetchone()
-    if record:
-        return record['id']
-    cursor.execute(f"INSERT INTO {table} (name) VALUES (?)", (name,))
-    return cursor.lastrowid
+RELATION_IDS_SQL = "SELECT {entity_table}_id FROM {relation_table} WHERE news_id = ?"
 
 def update_relations(cursor, relation_table, news_id, entity_table, names):
     """
     輸入：cursor, relation_table (str), news_id (int), entity_table (str), names (list of str)
     輸出：無，建立關聯並避免重複
     """
-    for name in names:
-        entity_id = get_or_create(cursor, entity_table, name)
-        cursor.execute(
-            f"SELECT 1 FROM {relation_table} WHERE news_id = ? AND {entity_table}_id = ?",
-            (news_id, entity_id)
-        )
-        if not cursor.fetchone():
-            cursor.execute(
-                f"INSERT INTO {relation_table} (news_id, {entity_table}_id) VALUES (?, ?)",
-                (news_id, entity_id)
-            )
+    if not names:
+        return
+    if isinstance(names, str):
+        names = [names]
+    id_map = get_or_create_id_map(cursor, entity_table, names)
+
+    cursor.execute(RELATION_IDS_SQL.format(entity_table=entity_table, relation_table=relation_table), (news_id,))
+    existing_ids = set(row[0] for row in cursor.fetchall())
+    new_ids = [entity_id for entity_id in id_map.values() if entity_id not in existing_ids]
+    cursor.executemany(
+        f"INSERT INTO {relation_table} (news_id, {entity_table}_id) VALUES (?, ?)",
+        [(news_id, entity_id) for entity_id in new_ids]
+    )
 
 def get_news_by_id(cursor, news_id):
     """
@@ -221,68 +250,349 @@ def update_news_record(cursor, news_id, data, allowed_fields):
         author_id = get_or_create(cursor, 'author', data['author'])
         valid_data['author_id'] = author_id
 
+    # 寫入內容即完成爬取，釋放租約
+    if 'query_state' in valid_data and valid_data['query_state'] != 1:
+        valid_data['lease_token'] = None
+        valid_data['lease_expires_at'] = None
+
     if valid_data:
         set_clause = ', '.join([f"{key} = ?" for key in valid_data.keys()])
         query = f"UPDATE news SET {set_clause} WHERE id = ?"
         cursor.execute(query, list(valid_data.values()) + [news_id])
 
-def fetch_waiting_news(cursor, source_website, count):
+RELEASE_EXPIRED_LEASES_SQL = """
+    UPDATE news
+    SET query_state = CASE WHEN crawl_attempts >= ? THEN 3 ELSE 0 END,
+        lease_token = NULL,
+        lease_expires_at = NULL
+    WHERE query_state = 1 AND (lease_expires_at IS NULL OR lease_expires_at <= ?)
+"""
+
+def release_expired_leases(cursor, now):
     """
-    輸入：cursor、source_website (int)、count (int)
-    輸出：查詢到待處理新聞 (list of Row)
+    輸入：cursor、now (str，"%Y-%m-%d %H:%M:%S")
+    輸出：無；租約過期的新聞放回待爬清單，超過重試上限則標記為失敗
     """
-    query = """
-        SELECT id, news_url
+    cursor.execute(RELEASE_EXPIRED_LEASES_SQL, (MAX_CRAWL_ATTEMPTS, now))
+
+CLAIM_WAITING_NEWS_SQL = """
+    UPDATE news
+    SET query_state = 1, lease_token = ?, lease_expires_at = ?, crawl_attempts = crawl_attempts + 1
+    WHERE id IN (
+        SELECT id
         FROM news
         WHERE query_state = 0 AND source_website = ?
         ORDER BY news_time DESC
-        LIMIT ?;
+        LIMIT ?
+    )
+    RETURNING id, news_url;
+"""
+
+def claim_waiting_news(cursor, source_website, count, lease_seconds):
+    """
+    輸入：cursor、source_website (int)、count (int)、lease_seconds (int)
+    輸出：(lease_token, 認領到的新聞 list of Row)；在同一個寫入交易中認領，不同 worker 不會拿到相同新聞
     """
-    cursor.execute(query, (source_website, count))
-    return cursor.fetchall()
+    now = datetime.now()
+    expires_at = (now + timedelta(seconds=lease_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+    lease_token = uuid.uuid4().hex
+
+    cursor.execute("BEGIN IMMEDIATE")
+    release_expired_leases(cursor, now.strftime("%Y-%m-%d %H:%M:%S"))
+    cursor.execute(CLAIM_WAITING_NEWS_SQL, (lease_token, expires_at, source_website, count))
+    return lease_token, cursor.fetchall()
 
-def mark_news_as_in_query(cursor, news_ids):
+def finish_leases(cursor, items, retry):
     """
-    輸入：cursor、news_ids (list of int)
-    輸出：無；批次更新 query_state 為 1
+    輸入：cursor、items (list of {id, lease_token})、retry (bool 或 None)
+    輸出：實際更新筆數 (int)；retry 為 None 時標記完成 (ack)，否則釋放租約 (nack)
     """
-    if not news_ids:
-        return
-    placeholder = ", ".join(["?"] * len(news_ids))
-    query = f"UPDATE news SET query_state = 1 WHERE id IN ({placeholder});"
-    cursor.execute(query, news_ids)
+    if retry is None:
+        state_sql = "2"
+        params = []
+    else:
+        state_sql = "CASE WHEN ? AND crawl_attempts < ? THEN 0 ELSE 3 END"
+        params = [1 if retry else 0, MAX_CRAWL_ATTEMPTS]
+
+    query = f"""
+        UPDATE news
+        SET query_state = {state_sql}, lease_token = NULL, lease_expires_at = NULL
+        WHERE id = ? AND lease_token = ? AND query_state = 1
+    """
+    updated = 0
+    for item in items:
+        cursor.execute(query, params + [item['id'], item['lease_token']])
+        updated += cursor.rowcount
+    return updated
 
-def fetch_waiting_ai_news(cursor, count, model):
+def waiting_ai_news_query(count, model, source_website=None, skip_cluster_duplicates=False):
     """
-    輸入：cursor、count (int)、model(int)
-    輸出：查詢到尚未經 AI 處理之新聞內容 (list of dict)
+    輸入：count (int)、model (int)、source_website (int 或 None)、skip_cluster_duplicates (bool)
+    輸出：(sql, params)；查詢尚未經 AI 處理、也未被其他 worker 認領之新聞 (id, cluster_id)，依時間新到舊
     """
     query = '''
-        SELECT *
+        SELECT news.id, news.cluster_id
         FROM news
         LEFT JOIN ai_news ON ai_news.ai_model = ? and news.id = ai_news.news_id
+        LEFT JOIN ai_job ON ai_job.ai_model = ? and news.id = ai_job.news_id
         WHERE news.query_state = 2 AND ai_news.ai_model IS NULL
-        ORDER BY news_time DESC
-        LIMIT ?;
     '''
-    cursor.execute(query, (model, count))
-    return cursor.fetchall()
+    # 略過 (4) 的工作只在不略過群組重複時認領
+    if skip_cluster_duplicates:
+        query += " AND (ai_job.state IS NULL OR ai_job.state = 0)"
+    else:
+        query += " AND (ai_job.state IS NULL OR ai_job.state IN (0, 4))"
+    params = [model, model]
+    if source_website is not None:
+        query += " AND news.source_website = ?"
+        params.append(source_website)
+    if skip_cluster_duplicates:
+        query += '''
+        AND NOT EXISTS (
+            SELECT 1 FROM news AS sibling
+            JOIN ai_job AS sibling_job ON sibling_job.news_id = sibling.id AND sibling_job.ai_model = ?
+            WHERE sibling.cluster_id = news.cluster_id AND sibling.id != news.id AND sibling_job.state IN (1, 2)
+        )
+        '''
+        params.append(model)
+    query += " ORDER BY news.news_time DESC LIMIT ?"
+    params.append(count)
+    return query, params
+
+def fetch_waiting_ai_news(cursor, count, model, source_website=None, seen_clusters=None):
+    """
+    輸入：cursor、count (int)、model(int)、source_website (int 或 None)、
+          seen_clusters (set 或 None；提供時略過同群組已有新聞完成或正在分析的新聞，
+                         且每個群組只取一篇，已取過的群組記錄在 seen_clusters)
+    輸出：查詢到尚未經 AI 處理、也未被其他 worker 認領之新聞 id (list of int)，依時間新到舊
+    """
+    cursor.execute(*waiting_ai_news_query(count, model, source_website, seen_clusters is not None))
+
+    news_ids = []
+    for row in cursor.fetchall():
+        # 尚未分群 (cluster_id 為 NULL) 的新聞各自獨立，不互相略過
+        if seen_clusters is not None and row['cluster_id'] is not None:
+            if row['cluster_id'] in seen_clusters:
+                continue
+            seen_clusters.add(row['cluster_id'])
+        news_ids.append(row['id'])
+    return news_ids
+
+RELEASE_EXPIRED_AI_JOBS_SQL = """
+    UPDATE ai_job
+    SET state = CASE WHEN attempts >= ? THEN 3 ELSE 0 END,
+        lease_token = NULL,
+        lease_expires_at = NULL
+    WHERE state = 1 AND lease_expires_at <= ?
+"""
+
+# 群組中已有新聞分析完成的模型，同群組其他尚未分析的新聞在該模型的工作標記為略過 (state 4)，
+# 之後 skip_cluster_duplicates 的認領不再掃描這些新聞；不略過群組重複的 worker 仍可認領
+CLUSTER_MODELS_SQL = """
+    SELECT ai_news.ai_model
+    FROM news AS sibling
+    JOIN ai_news ON ai_news.news_id = sibling.id
+    WHERE sibling.cluster_id = ?
+"""
+
+SKIP_CLUSTER_DUPLICATES_SQL = """
+    INSERT INTO ai_job (news_id, ai_model, state)
+    SELECT member.id, ?, 4
+    FROM news AS member
+    WHERE member.cluster_id = ? AND NOT EXISTS (
+        SELECT 1 FROM ai_news WHERE ai_news.news_id = member.id AND ai_news.ai_model = ?
+    )
+    ON CONFLICT (news_id, ai_model) DO UPDATE SET state = 4 WHERE ai_job.state = 0
+"""
+
+def mark_cluster_duplicates(cursor, cluster_id):
+    """
+    輸入：cursor、cluster_id (None 時不處理)
+    輸出：無；見 SKIP_CLUSTER_DUPLICATES_SQL，需在交易中呼叫
+    """
+    if cluster_id is None:
+        return
+    models = {row[0] for row in cursor.execute(CLUSTER_MODELS_SQL, (cluster_id,)).fetchall()}
+    for model in models:
+        cursor.execute(SKIP_CLUSTER_DUPLICATES_SQL, (model, cluster_id, model))
+
+def release_expired_ai_jobs(cursor, now):
+    """
+    輸入：cursor、now (str，"%Y-%m-%d %H:%M:%S")
+    輸出：無；租約過期的 AI 工作放回佇列，超過重試上限則標記為失敗
+    """
+    cursor.execute(RELEASE_EXPIRED_AI_JOBS_SQL, (MAX_AI_ATTEMPTS, now))
+
+def claim_ai_jobs(cursor, count, model, lease_seconds, source_order=None, skip_cluster_duplicates=False):
+    """
+    輸入：cursor、count (int)、model (int)、lease_seconds (int)、
+          source_order (list of int 或 None；None 為全部來源依時間新到舊，否則依來源順序優先)、
+          skip_cluster_duplicates (bool，見 fetch_waiting_ai_news)
+    輸出：(lease_token, 認領到的新聞 list of Row)；同一個 (news_id, ai_model) 同時只會被一個 worker 認領
+    """
+    now = datetime.now()
+    expires_at = (now + timedelta(seconds=lease_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+    lease_token = uuid.uuid4().hex
+
+    cursor.execute("BEGIN IMMEDIATE")
+    release_expired_ai_jobs(cursor, now.strftime("%Y-%m-%d %H:%M:%S"))
+
+    news_ids = []
+    seen_clusters = set() if skip_cluster_duplicates else None
+    for source_website in (source_order or [None]):
+        if len(news_ids) >= count:
+            break
+        news_ids += fetch_waiting_ai_news(cursor, count - len(news_ids), model, source_website, seen_clusters)
+
+    cursor.executemany(
+        """
+        INSERT INTO ai_job (news_id, ai_model, state, lease_token, lease_expires_at, attempts)
+        VALUES (?, ?, 1, ?, ?, 1)
+        ON CONFLICT (news_id, ai_model) DO UPDATE
+        SET state = 1, lease_token = excluded.lease_token, lease_expires_at = excluded.lease_expires_at,
+            attempts = ai_job.attempts + 1
+        WHERE ai_job.state IN (0, 4)
+        """,
+        [(news_id, model, lease_token, expires_at) for news_id in news_ids]
+    )
+
+    rows = []
+    for chunk in chunked(news_ids):
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"SELECT * FROM news WHERE id IN ({placeholders}) ORDER BY news_time DESC", chunk)
+        rows += cursor.fetchall()
+    return lease_token, rows
+
+def finish_ai_jobs(cursor, items, model, retry):
+    """
+    輸入：cursor、items (list of {id, lease_token})、model (int)、retry (bool)
+    輸出：實際更新筆數 (int)；retry 且未超過重試上限時放回佇列，否則標記失敗
+    """
+    updated = 0
+    for item in items:
+        cursor.execute(
+            """
+            UPDATE ai_job
+            SET state = CASE WHEN ? AND attempts < ? THEN 0 ELSE 3 END, lease_token = NULL, lease_expires_at = NULL
+            WHERE news_id = ? AND ai_model = ? AND lease_token = ? AND state = 1
+            """,
+            (1 if retry else 0, MAX_AI_ATTEMPTS, item['id'], model, item['lease_token'])
+        )
+        updated += cursor.rowcount
+    return updated
+
+def parse_ai_result(data):
+    """
+    輸入：分析結果 dict {title, category, keywords, sentiment_analysis}
+    輸出：(title, sentiment_key, categories, keywords)；欄位缺少或格式錯誤時拋出 ValueError
+    """
+    title = data.get('title')
+    categories = data.get('category', [])
+    keywords = data.get('keywords', [])
+    sentiment_val = data.get('sentiment_analysis')
+    sentiment_val = '中立' if sentiment_val == '中性' else sentiment_val
+    sentiment_key = get_sentiment_analysis_key(sentiment_val)
+    if not (title and categories and keywords and sentiment_key is not None):
+        raise ValueError('Invalid data')
+    return title, sentiment_key, categories, keywords
+
+class StaleAiJob(Exception):
+    """
+    AI 工作的租約已過期（可能已被其他 worker 認領）或結果已寫入
+    """
+
+# 只有仍持有租約的 worker 能完成工作
+COMPLETE_AI_JOB_SQL = """
+    UPDATE ai_job SET state = 2, lease_token = NULL, lease_expires_at = NULL
+    WHERE news_id = ? AND ai_model = ? AND lease_token = ? AND state = 1
+"""
+
+def insert_ai_news(cursor, news_id, model, lease_token, title, sentiment_key, categories, keywords):
+    """
+    輸入：cursor、news_id、model (int)、lease_token (認領時取得)、title、sentiment_key、categories、keywords
+    輸出：ai_news_id；將 AI 工作標記為完成後寫入分析結果與類別、關鍵字關聯，需在交易中呼叫
+          租約已失效時拋出 StaleAiJob，結果已存在時拋出 sqlite3.IntegrityError（呼叫端需回滾）
+    """
+    # 完成 AI 工作
+    cursor.execute(COMPLETE_AI_JOB_SQL, (news_id, model, lease_token))
+    if cursor.rowcount != 1:
+        raise StaleAiJob(f'No active lease for news {news_id}')
+
+    # 建立 ai_news 主表資料
+    cursor.execute(
+        '''
+        INSERT INTO ai_news (news_id, ai_title, ai_sentiment_analysis, ai_model)
+        VALUES (?, ?, ?, ?)
+        ''',
+        (news_id, title, sentiment_key, model)
+    )
+    ai_news_id = cursor.lastrowid
+
+    # 類別與關聯
+    category_ids = get_or_create_ids(cursor, "category", categories)
+    insert_relations(cursor, "ai_news_category", "ai_news_id", "category_id", ai_news_id, category_ids)
+
+    # 關鍵字與關聯
+    keyword_ids = get_or_create_ids(cursor, "keyword", keywords)
+    insert_relations(cursor, "ai_news_keyword", "ai_news_id", "keyword_id", ai_news_id, keyword_ids)
+
+    # 趨勢彙總表（/api/trends）
+    news = cursor.execute("SELECT news_time, source_website, cluster_id FROM news WHERE id = ?", (news_id,)).fetchone()
+    if news:
+        apply_rollups(cursor, news['news_time'], news['source_website'], [(model, sentiment_key, category_ids, keyword_ids)])
+
+    # feed 表（/api/ai_news）
+    cursor.execute(
+        '''
+        INSERT INTO ai_feed (ai_model, news_id, news_time, source_website, ai_title, image_url, news_url, cluster_id)
+        SELECT ?, id, news_time, source_website, ?, image_url, news_url, cluster_id FROM news WHERE id = ?
+        ''',
+        (model, title, news_id)
+    )
+
+    # 同群組尚未分析的新聞標記為略過
+    if news:
+        mark_cluster_duplicates(cursor, news['cluster_id'])
+    mark_stale(cursor, f'feed:{model}', f'news:{news_id}')
+    return ai_news_id
+
+def refresh_ai_feed(cursor, news_id):
+    """
+    輸入：cursor、news_id
+    輸出：無；以 news 目前的欄位更新該新聞在 feed 表中的所有列（新聞尚未分析時不會有列）
+    """
+    cursor.execute(
+        '''
+        UPDATE ai_feed
+        SET (news_time, source_website, image_url, news_url, cluster_id) = (
+            SELECT news_time, source_website, image_url, news_url, cluster_id FROM news WHERE id = ?
+        )
+        WHERE news_id = ?
+        ''',
+        (news_id, news_id)
+    )
+
+def apply_cached_ai_results(cursor, news_rows, model, prompt_version, lease_token):
+    """
+    輸入：cursor、news_rows (剛認領的新聞)、model (int)、prompt_version (int)、lease_token (認領時取得)
+    輸出：未命中快取、仍需模型分析的新聞 (list of Row)；命中的新聞直接寫入快取的分析結果
+    """
+    cached = ai_result_cache.lookup(cursor, news_rows, model, prompt_version)
+    remaining = []
+    for row in news_rows:
+        result = cached.get(row['id'])
+        if result is None:
+            remaining.append(row)
+            continue
+        insert_ai_news(cursor, row['id'], model, lease_token, *parse_ai_result(result))
+    return remaining
 
 def get_or_create_ids(cursor, table, names):
     """
     輸入：table: str, names: list[str]
-    輸出：對應名稱在資料表中的 id list[int]
-    """
-    ids = []
-    for name in names:
-        cursor.execute(f"SELECT id FROM {table} WHERE name = ?", (name,))
-        record = cursor.fetchone()
-        if not record:
-            cursor.execute(f"INSERT INTO {table} (name) VALUES (?)", (name,))
-            ids.append(cursor.lastrowid)
-        else:
-            ids.append(record["id"])
-    return ids
+    輸出：對應名稱在資料表中的 id list[int]（依名稱順序、不重複）
+    """
+    return list(get_or_create_id_map(cursor, table, names).values())
 
 def insert_relations(cursor, relation_table, foreign_key1, foreign_key2, id1, ids2):
     """
@@ -311,6 +621,183 @@ def get_sentiment_analysis_key(value):
     return None
 
 
+# add_news 寫入 news 表的欄位
+NEWS_INSERT_KEYS = ['news_title', 'news_content', 'image_url', 'query_state', 'news_url', 'source_website', 'news_time', 'author_id']
+
+def get_or_create_id_map(cursor, table, names):
+    """
+    輸入：cursor, table (str), names (iterable of str)
+    輸出：{name: id}（依名稱順序）；先查快取，未命中的名稱一次查詢，缺少的以 upsert 一次新增
+    """
+    names = list(dict.fromkeys(name for name in names if name))
+    id_map = name_cache.resolve(cursor, table, names)
+    return {name: id_map[name] for name in names}
+
+def insert_news_rows(cursor, items):
+    """
+    輸入：cursor, items (list of dict，已含 author_id)
+    輸出：{news_url: news_id}；相同欄位組合的資料以 executemany 一次寫入
+    """
+    groups = {}
+    for data in items:
+        columns = tuple(k for k in NEWS_INSERT_KEYS if k in data)
+        groups.setdefault(columns, []).append(tuple(data[col] for col in columns))
+
+    for columns, rows in groups.items():
+        insert_sql, _ = construct_insert_query('news', dict.fromkeys(columns))
+        cursor.executemany(insert_sql, rows)
+
+    url_to_id = {}
+    urls = [data['news_url'] for data in items]
+    for chunk in chunked(urls):
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"SELECT id, news_url FROM news WHERE news_url IN ({placeholders})", chunk)
+        url_to_id.update((row['news_url'], row['id']) for row in cursor.fetchall())
+    return url_to_id
+
+def insert_news_relations(cursor, items, url_to_id, category_ids, keyword_ids):
+    """
+    輸入：cursor, items (list of dict), url_to_id (dict), category_ids (dict), keyword_ids (dict)
+    輸出：無；以 executemany 寫入 news_category 與 news_keyword
+    """
+    category_rows = []
+    keyword_rows = []
+    for data in items:
+        news_id = url_to_id[data['news_url']]
+        if data.get('category'):
+            category_rows.append((news_id, category_ids[data['category']]))
+        if isinstance(data.get('keywords'), list):
+            for keyword in dict.fromkeys(data['keywords']):
+                if keyword:
+                    keyword_rows.append((news_id, keyword_ids[keyword]))
+
+    cursor.executemany("INSERT INTO news_category (news_id, category_id) VALUES (?, ?)", category_rows)
+    cursor.executemany("INSERT INTO news_keyword (news_id, keyword_id) VALUES (?, ?)", keyword_rows)
+
+def news_signatures(items):
+    """
+    輸入：items (list of dict)
+    輸出：{news_url: MinHash 簽章}，只包含有內容的新聞；在交易開始前計算，寫入鎖只涵蓋 LSH 查詢與寫入
+    """
+    return {data['news_url']: minhash(data['news_content']) for data in items if data.get('news_content')}
+
+def bulk_insert_news(cursor, items, signatures=None):
+    """
+    輸入：cursor, items (list of dict，已驗證且不重複), signatures (news_signatures 的結果，None 時在此計算)
+    輸出：{news_url: news_id}；名稱批次解析後寫入新聞與關聯，需在交易中呼叫
+    """
+    if signatures is None:
+        signatures = news_signatures(items)
+
+    author_ids = get_or_create_id_map(cursor, 'author', (data.get('author') for data in items))
+    category_ids = get_or_create_id_map(cursor, 'category', (data.get('category') for data in items))
+    keyword_ids = get_or_create_id_map(cursor, 'keyword', (
+        keyword
+        for data in items if isinstance(data.get('keywords'), list)
+        for keyword in data['keywords']
+    ))
+
+    for data in items:
+        if data.get('author'):
+            data['author_id'] = author_ids[data['author']]
+
+    url_to_id = insert_news_rows(cursor, items)
+    insert_news_relations(cursor, items, url_to_id, category_ids, keyword_ids)
+
+    # 近似重複分群
+    for data in items:
+        if data.get('news_content'):
+            news_id = url_to_id[data['news_url']]
+            cluster_id = assign_cluster(cursor, news_id, signatures[data['news_url']], data.get('news_time'))
+            if cluster_id != news_id:
+                mark_cluster_duplicates(cursor, cluster_id)
+                mark_stale(cursor, f'cluster:{cluster_id}')
+    return url_to_id
+
+def ingest_news_batch(conn, items, results):
+    """
+    輸入：conn, items (list of dict，已驗證且不重複), results (dict)
+    輸出：無；整批在同一個交易中寫入，整批失敗時改以 savepoint 逐筆寫入並記錄個別錯誤
+    """
+    signatures = news_signatures(items)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("SAVEPOINT news_batch")
+        try:
+            url_to_id = bulk_insert_news(cursor, items, signatures)
+            cursor.execute("RELEASE SAVEPOINT news_batch")
+            for data in items:
+                results['success'].append({'data': data, 'id': url_to_id[data['news_url']]})
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT news_batch")
+            cursor.execute("RELEASE SAVEPOINT news_batch")
+            traceback.print_exc()
+
+            # 逐筆寫入，找出有問題的資料
+            for data in items:
+                data.pop('author_id', None)
+                cursor.execute("SAVEPOINT news_item")
+                try:
+                    url_to_id = bulk_insert_news(cursor, [data], signatures)
+                    cursor.execute("RELEASE SAVEPOINT news_item")
+                    results['success'].append({'data': data, 'id': url_to_id[data['news_url']]})
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT news_item")
+                    cursor.execute("RELEASE SAVEPOINT news_item")
+                    results['errors'].append({'data': data, 'error': str(e)})
+        name_cache.commit(conn)
+    except Exception:
+        conn.rollback()
+        name_cache.discard(conn)
+        raise
+
+
+def validate_news_items(data_list, results):
+    """
+    輸入：data_list (list of news objects), results (dict，含 success 與 errors)
+    輸出：欄位合法的新聞 (list of dict)；缺少必要欄位或來源不合法的資料記錄在 results['errors']
+    """
+    required_fields = ['news_title', 'news_url', 'source_website']
+
+    insert_data = []
+    for data in data_list:
+        # 檢查必要欄位
+        for field in required_fields:
+            if not data.get(field):
+                results['errors'].append({'data': data, 'error': f'Missing field: {field}'})
+                break
+        else:
+            # 檢查網站來源是否合法
+            try:
+                source_website = int(data['source_website'])
+                if source_website not in SOURCE_WEBSITE_ENUM:
+                    raise ValueError()
+            except Exception:
+                results['errors'].append({'data': data, 'error': 'Invalid source_website'})
+                continue
+
+            insert_data.append(data)
+    return insert_data
+
+
+def remove_duplicate_news(cursor, insert_data, results):
+    """
+    輸入：cursor, insert_data (list of dict), results (dict)
+    輸出：不重複的新聞 (list of dict)；與資料庫內或同一批內 news_url 重複的資料記錄在 results['errors']
+    """
+    existing_keys = check_existing_news_batch(cursor, insert_data)
+
+    final_data = []
+    for data in insert_data:
+        if data['news_url'] in existing_keys:
+            results['errors'].append({'data': data, 'error': 'Duplicate news (same time and URL)'})
+            continue
+        existing_keys.add(data['news_url'])
+        final_data.append(data)
+    return final_data
+
+
 @app.route('/news', methods=['POST'])
 def add_news():
     """
@@ -321,102 +808,77 @@ def add_news():
     if not isinstance(data_list, list):
         return jsonify({'error': 'Input should be a list of news objects'}), 400
 
-    required_fields = ['news_title', 'news_url', 'source_website']
     results = {'success': [], 'errors': []}
 
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        insert_data = []
-        for data in data_list:
-            # 檢查必要欄位
-            for field in required_fields:
-                if not data.get(field):
-                    results['errors'].append({'data': data, 'error': f'Missing field: {field}'})
-                    break
-            else:
-                # 檢查網站來源是否合法
-                try:
-                    source_website = int(data['source_website'])
-                    if source_website not in SOURCE_WEBSITE_ENUM:
-                        raise ValueError()
-                except Exception:
-                    results['errors'].append({'data': data, 'error': 'Invalid source_website'})
-                    continue
-
-                insert_data.append(data)
-
+        insert_data = validate_news_items(data_list, results)
         if not insert_data:
             return jsonify(results), 400
 
-        # 檢查是否有重複的資料
-        existing_keys = check_existing_news_batch(cursor, insert_data)
-
-        final_data = []
-        for data in insert_data:
-            if data['news_url'] in existing_keys:
-                results['errors'].append({'data': data, 'error': 'Duplicate news (same time and URL)'})
-                continue
-            final_data.append(data)
+        # 檢查是否有重複的資料（資料庫內或同一批內）
+        final_data = remove_duplicate_news(cursor, insert_data, results)
 
-        # 寫入資料庫
-        for data in final_data:
-            try:
-                # author 處理
-                author_id = None
-                if 'author' in data:
-                    if data['author']:
-                        author_id = get_or_create(cursor, 'author', data['author'])
-                        data['author_id'] = author_id
-
-                # category 處理（單筆字串）
-                category_id = None
-                if 'category' in data and data['category']:
-                    cursor.execute("SELECT id FROM category WHERE name = ?", (data['category'],))
-                    category = cursor.fetchone()
-                    if not category:
-                        cursor.execute("INSERT INTO category (name) VALUES (?)", (data['category'],))
-                        category_id = cursor.lastrowid
-                    else:
-                        category_id = category['id']
-
-                # 想取出的 keys
-                keys_to_extract = ['news_title', 'news_content', 'image_url', 'query_state', 'news_url', 'source_website', 'news_time', 'author_id']
-                # 建立新的 dict
-                new_dict = {k: data[k] for k in keys_to_extract if k in data}
-
-                # 組合插入欄位與 SQL
-                insert_sql, column_names = construct_insert_query('news', new_dict)
-                values = tuple(data.get(col) for col in column_names)
-
-                cursor.execute(insert_sql, values)
-                news_id = cursor.lastrowid
-
-                # 新增 category 關聯
-                if category_id:
-                    cursor.execute("INSERT INTO news_category (news_id, category_id) VALUES (?, ?)", (news_id, category_id))
-
-                # 新增 keyword 關聯
-                if 'keywords' in data and isinstance(data['keywords'], list):
-                    for keyword in data['keywords']:
-                        cursor.execute("SELECT id FROM keyword WHERE name = ?", (keyword,))
-                        kw = cursor.fetchone()
-                        if not kw:
-                            cursor.execute("INSERT INTO keyword (name) VALUES (?)", (keyword,))
-                            keyword_id = cursor.lastrowid
-                        else:
-                            keyword_id = kw['id']
-                        cursor.execute("INSERT INTO news_keyword (news_id, keyword_id) VALUES (?, ?)", (news_id, keyword_id))
-
-                results['success'].append({'data': data, 'id': news_id})
-                conn.commit()
-            except Exception as e:
-                conn.rollback()
-                results['errors'].append({'data': data, 'error': str(e)})
-                traceback.print_exc()
+        # 寫入資料庫（單一交易）
+        if final_data:
+            ingest_news_batch(conn, final_data, results)
 
     return jsonify(results), 201
 
+# PUT /news/<id> 與 PUT /news 可更新的欄位
+NEWS_UPDATE_FIELDS = [
+    'news_time', 'news_title', 'news_content', 'image_url',
+    'news_url', 'source_website', 'query_state'
+]
+
+def apply_news_update(cursor, news_id, data, signature=None):
+    """
+    輸入：cursor, news_id (int), data (dict，可含 NEWS_UPDATE_FIELDS、author、keywords、category)、
+          signature (minhash(data['news_content'])，在交易開始前計算；None 時在此計算)
+    輸出：是否找到新聞 (bool)；更新欄位與關聯、重新分群並同步 feed 與彙總表，需在交易中呼叫
+    """
+    news = get_news_by_id(cursor, news_id)
+    if not news:
+        return False
+    old_cluster_id = news['cluster_id']
+    old_news_time, old_source_website = news['news_time'], news['source_website']
+
+    update_news_record(cursor, news_id, data, NEWS_UPDATE_FIELDS)
+
+    if 'keywords' in data:
+        update_relations(cursor, 'news_keyword', news_id, 'keyword', data['keywords'])
+
+    if 'category' in data:
+        update_relations(cursor, 'news_category', news_id, 'category', data['category'])
+
+    # 內容變更時重新分群
+    news = get_news_by_id(cursor, news_id)
+    cluster_id = old_cluster_id
+    if 'news_content' in data:
+        if signature is None:
+            signature = minhash(news['news_content'])
+        cluster_id = assign_cluster(cursor, news_id, signature, news['news_time'])
+        # 原本因群組重複而略過的工作依新的群組重新判斷
+        cursor.execute("UPDATE ai_job SET state = 0 WHERE news_id = ? AND state = 4", (news_id,))
+        mark_cluster_duplicates(cursor, cluster_id)
+
+    refresh_ai_feed(cursor, news_id)
+
+    # 時間或來源變更時，將已分析結果從舊的彙總 bucket 移到新的
+    if (news['news_time'], news['source_website']) != (old_news_time, old_source_website):
+        results = news_rollup_results(cursor, news_id)
+        apply_rollups(cursor, old_news_time, old_source_website, results, delta=-1)
+        apply_rollups(cursor, news['news_time'], news['source_website'], results)
+
+    # 詳細頁、所在群組與已分析過此新聞的模型 feed
+    cursor.execute("SELECT ai_model FROM ai_news WHERE news_id = ?", (news_id,))
+    mark_stale(
+        cursor, f'news:{news_id}', f'cluster:{old_cluster_id}', f'cluster:{cluster_id}',
+        *(f'feed:{row["ai_model"]}' for row in cursor.fetchall())
+    )
+    return True
+
 @app.route('/news/<int:news_id>', methods=['PUT'])
 def update_news(news_id):
     """
@@ -424,28 +886,15 @@ def update_news(news_id):
     輸出：更新成功訊息或錯誤回應（JSON）
     """
     data = request.get_json()
-    allowed_fields = [
-        'news_time', 'news_title', 'news_content', 'image_url',
-        'news_url', 'source_website', 'query_state'
-    ]
 
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        # 檢查新聞是否存在
-        if not get_news_by_id(cursor, news_id):
-            return jsonify({'error': 'News not found'}), 404
-
         try:
-            update_news_record(cursor, news_id, data, allowed_fields)
-
-            if 'keywords' in data:
-                update_relations(cursor, 'news_keyword', news_id, 'keyword', data['keywords'])
-
-            if 'category' in data:
-                update_relations(cursor, 'news_category', news_id, 'category', data['category'])
-
-            conn.commit()
+            # 檢查新聞是否存在
+            if not apply_news_update(cursor, news_id, data):
+                return jsonify({'error': 'News not found'}), 404
+            name_cache.commit(conn)
             return jsonify({'message': 'News updated successfully'}), 200
         except ValueError as ve:
             traceback.print_exc()
@@ -455,52 +904,297 @@ def update_news(news_id):
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
 
+@app.route('/news', methods=['PUT'])
+def update_news_batch():
+    """
+    輸入：PUT 請求 (list of {id: int, ...}，其餘欄位同 PUT /news/<id>)
+    輸出：JSON 結果，包含 success ([{id}]) 與 errors ([{id, error}])
+    整批在同一個交易中寫入，每筆以 savepoint 隔開，單筆失敗不影響其他筆
+    """
+    data_list = request.get_json()
+    if not isinstance(data_list, list):
+        return jsonify({'error': 'Input should be a list of news objects'}), 400
+
+    results = {'success': [], 'errors': []}
+    # 簽章在交易外計算
+    signatures = [
+        minhash(data['news_content']) if isinstance(data, dict) and isinstance(data.get('news_content'), str) else None
+        for data in data_list
+    ]
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            for data, signature in zip(data_list, signatures):
+                news_id = data.get('id') if isinstance(data, dict) else None
+                if not isinstance(news_id, int):
+                    results['errors'].append({'id': news_id, 'error': 'Each item needs id (int)'})
+                    continue
+                cursor.execute("SAVEPOINT news_update")
+                try:
+                    found = apply_news_update(cursor, news_id, data, signature)
+                    cursor.execute("RELEASE SAVEPOINT news_update")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT news_update")
+                    cursor.execute("RELEASE SAVEPOINT news_update")
+                    results['errors'].append({'id': news_id, 'error': str(e)})
+                    continue
+                if found:
+                    results['success'].append({'id': news_id})
+                else:
+                    results['errors'].append({'id': news_id, 'error': 'News not found'})
+            name_cache.commit(conn)
+        except Exception:
+            conn.rollback()
+            name_cache.discard(conn)
+            raise
+
+    return jsonify(results), 200
+
 @app.route('/wait_query_list', methods=['POST'])
 def wait_query_list():
     """
-    輸入：JSON {source_website: int, count: int}
-    輸出：[{id: int, news_url: str}, ...]
+    輸入：JSON {source_website: int, count: int, lease_seconds: int (選填)}
+    輸出：[{id: int, news_url: str, lease_token: str}, ...]
+    認領的新聞在 lease_seconds 內未以 PUT /news/<id> (query_state=2) 或 ack 完成，會自動放回待爬清單
     """
     data = request.get_json()
     try:
         source_website = int(data.get('source_website'))
         count = int(data.get('count'))
+        lease_seconds = int(data.get('lease_seconds', DEFAULT_LEASE_SECONDS))
     except (ValueError, TypeError):
-        return jsonify({'error': 'Invalid source_website or count'}), 400
+        return jsonify({'error': 'Invalid source_website, count or lease_seconds'}), 400
 
     if source_website not in SOURCE_WEBSITE_ENUM:
         return jsonify({'error': 'Invalid source_website value'}), 400
 
+    if count <= 0 or lease_seconds <= 0:
+        return jsonify({'error': 'count and lease_seconds must be positive'}), 400
+
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        news_rows = fetch_waiting_news(cursor, source_website, count)
-
-        # 更新 query_state 為 1
-        news_ids = [row['id'] for row in news_rows]
-        mark_news_as_in_query(cursor, news_ids)
+        lease_token, news_rows = claim_waiting_news(cursor, source_website, count, lease_seconds)
         conn.commit()
 
-        news_list = [{'id': row['id'], 'news_url': row['news_url']} for row in news_rows]
+        news_list = [{'id': row['id'], 'news_url': row['news_url'], 'lease_token': lease_token} for row in news_rows]
         return jsonify(news_list), 200
 
+def parse_lease_items(data):
+    """
+    輸入：JSON {items: [{id: int, lease_token: str}, ...]}
+    輸出：items (list of dict)；格式錯誤時拋出 ValueError
+    """
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise ValueError('items should be a list')
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int) or not isinstance(item.get('lease_token'), str):
+            raise ValueError('Each item needs id (int) and lease_token (str)')
+    return items
+
+@app.route('/wait_query_list/ack', methods=['POST'])
+def ack_query_list():
+    """
+    輸入：JSON {items: [{id: int, lease_token: str}, ...]}
+    輸出：{acked: int}；租約仍有效的新聞標記為已完成 (query_state = 2)
+    """
+    try:
+        items = parse_lease_items(request.get_json())
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+
+    with get_db_connection() as conn:
+        acked = finish_leases(conn.cursor(), items, retry=None)
+        conn.commit()
+    return jsonify({'acked': acked}), 200
+
+@app.route('/wait_query_list/nack', methods=['POST'])
+def nack_query_list():
+    """
+    輸入：JSON {items: [{id: int, lease_token: str}, ...], retry: bool (預設 true)}
+    輸出：{nacked: int}；釋放租約，retry 且未超過重試上限時放回待爬清單，否則標記失敗 (query_state = 3)
+    """
+    data = request.get_json()
+    try:
+        items = parse_lease_items(data)
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    retry = bool(data.get('retry', True))
+
+    with get_db_connection() as conn:
+        nacked = finish_leases(conn.cursor(), items, retry=retry)
+        conn.commit()
+    return jsonify({'nacked': nacked}), 200
+
+@app.route('/news/known', methods=['POST'])
+def known_news():
+    """
+    輸入：JSON {urls: [str, ...]}
+    輸出：{known: [str, ...], new: [str, ...]}；依輸入順序分為已在資料庫中與尚未寫入的連結
+    供爬蟲在上傳清單前先過濾，只讀取 news_url 索引
+    """
+    data = request.get_json()
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        return jsonify({'error': 'urls should be a list of strings'}), 400
+
+    with get_read_connection() as conn:
+        existing = check_existing_news_batch(conn.cursor(), [{'news_url': url} for url in urls])
+    return jsonify({
+        'known': [url for url in urls if url in existing],
+        'new': [url for url in urls if url not in existing],
+    }), 200
+
+CRAWL_STATE_SQL = 'SELECT category, last_url, last_time, last_id, updated_at FROM crawl_state WHERE source_website = ?'
+
+@app.route('/crawl_state', methods=['GET'])
+def get_crawl_state():
+    """
+    輸入：source_website (query string，int)
+    輸出：{category: {last_url: str, last_time: str, last_id: int, updated_at: str}, ...}；該來源各清單類別的爬取進度
+    """
+    source_website = request.args.get('source_website', type=int)
+    if source_website not in SOURCE_WEBSITE_ENUM:
+        return jsonify({'error': 'Invalid source_website value'}), 400
+
+    rows = query_db(CRAWL_STATE_SQL, (source_website,))
+    return jsonify({
+        row['category']: {
+            'last_url': row['last_url'], 'last_time': row['last_time'],
+            'last_id': row['last_id'], 'updated_at': row['updated_at']
+        }
+        for row in rows
+    }), 200
+
+@app.route('/crawl_state', methods=['PUT'])
+def update_crawl_state():
+    """
+    輸入：JSON {
+        source_website: int,
+        category: str,
+        last_url: str,
+        last_time: str (選填，YYYY-MM-DD HH:MM:SS),
+        last_id: int (選填，依流水號爬取的來源)
+    }
+    輸出：更新成功訊息；記錄該清單類別本次爬取時最新的一篇，下次爬取到此為止
+    """
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Input should be a JSON object'}), 400
+    missing_field = validate_required_fields(data, ['source_website', 'category', 'last_url'])
+    if missing_field:
+        return jsonify({'error': f'Missing required field: {missing_field}'}), 400
+    if data['source_website'] not in SOURCE_WEBSITE_ENUM:
+        return jsonify({'error': 'Invalid source_website value'}), 400
+    if not isinstance(data['category'], str) or not isinstance(data['last_url'], str):
+        return jsonify({'error': 'category and last_url should be strings'}), 400
+    last_time = data.get('last_time')
+    if last_time is not None:
+        try:
+            datetime.strptime(last_time, "%Y-%m-%d %H:%M:%S")
+        except (ValueError, TypeError):
+            return jsonify({'error': 'last_time should be YYYY-MM-DD HH:MM:SS'}), 400
+    last_id = data.get('last_id')
+    if last_id is not None and (not isinstance(last_id, int) or isinstance(last_id, bool)):
+        return jsonify({'error': 'last_id should be an integer'}), 400
+
+    with get_db_connection() as conn:
+        conn.execute(
+            '''
+            INSERT INTO crawl_state (source_website, category, last_url, last_time, last_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (source_website, category) DO UPDATE SET
+                last_url = excluded.last_url, last_time = excluded.last_time, last_id = excluded.last_id,
+                updated_at = excluded.updated_at
+            ''',
+            (data['source_website'], data['category'], data['last_url'], last_time, last_id,
+             datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+        conn.commit()
+    return jsonify({'message': 'Crawl state updated successfully'}), 200
+
 @app.route('/wait_ai_handle_list', methods=['POST'])
 def wait_ai_handle_list():
     """
-    輸入：JSON {count: int, model: str}
-    輸出：[{id: int, news_content: str}, ...]
+    輸入：JSON {
+        count: int,
+        model: str,
+        lease_seconds: int (選填),
+        priority: "newest" | "source" (選填，預設 newest),
+        source_order: list[int] (priority 為 source 時的來源順序，選填),
+        prompt_version: int (選填，提供時先查分析結果快取),
+        skip_cluster_duplicates: bool (選填，略過同一事件群組中已有其他新聞分析過或正在分析的新聞；
+                                       已分析過的群組中其他新聞會標記為略過，不再重複掃描)
+    }
+    輸出：[{id: int, news_content: str, lease_token: str, ...}, ...]
+    認領的工作在 lease_seconds 內未以 /add_ai_news 完成，會自動放回佇列
     """
     data = request.get_json()
     try:
         count = int(data.get('count'))
         model = reversed_AI_MODEL_ENUM[data.get('model')]
-
-    except (ValueError, TypeError):
-        return jsonify({'error': 'Invalid count'}), 400
+        lease_seconds = int(data.get('lease_seconds', DEFAULT_AI_LEASE_SECONDS))
+    except (ValueError, TypeError, KeyError):
+        return jsonify({'error': 'Invalid count, model or lease_seconds'}), 400
+
+    if count <= 0 or lease_seconds <= 0:
+        return jsonify({'error': 'count and lease_seconds must be positive'}), 400
+
+    priority = data.get('priority', 'newest')
+    if priority == 'newest':
+        source_order = None
+    elif priority == 'source':
+        source_order = data.get('source_order', list(SOURCE_WEBSITE_ENUM.keys()))
+        if not isinstance(source_order, list) or any(source not in SOURCE_WEBSITE_ENUM for source in source_order):
+            return jsonify({'error': 'Invalid source_order'}), 400
+        # 未列出的來源排在最後
+        source_order = source_order + [source for source in SOURCE_WEBSITE_ENUM if source not in source_order]
+    else:
+        return jsonify({'error': 'Invalid priority'}), 400
+
+    prompt_version = data.get('prompt_version')
+    if prompt_version is not None and not isinstance(prompt_version, int):
+        return jsonify({'error': 'Invalid prompt_version'}), 400
+    skip_cluster_duplicates = bool(data.get('skip_cluster_duplicates', False))
 
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        news_rows = fetch_waiting_ai_news(cursor, count, model)
-        return jsonify([dict(row) for row in news_rows]), 200
+        news_list = []
+        # 命中分析結果快取的工作直接完成，不回傳給 worker；再補認領不足的數量
+        for _ in range(AI_CACHE_MAX_ROUNDS):
+            lease_token, news_rows = claim_ai_jobs(
+                cursor, count - len(news_list), model, lease_seconds, source_order, skip_cluster_duplicates
+            )
+            claimed = len(news_rows)
+            if prompt_version is not None and news_rows:
+                news_rows = apply_cached_ai_results(cursor, news_rows, model, prompt_version, lease_token)
+            name_cache.commit(conn)
+            if claimed != len(news_rows):
+                related_index.notify()
+            news_list += [{**dict(row), 'lease_token': lease_token} for row in news_rows]
+            if claimed == len(news_rows) or len(news_list) >= count:
+                break
+        return jsonify(news_list), 200
+
+@app.route('/wait_ai_handle_list/nack', methods=['POST'])
+def nack_ai_handle_list():
+    """
+    輸入：JSON {items: [{id: int, lease_token: str}, ...], model: str, retry: bool (預設 true)}
+    輸出：{nacked: int}；處理失敗時釋放工作，未超過重試上限會再被認領
+    """
+    data = request.get_json()
+    try:
+        items = parse_lease_items(data)
+        model = reversed_AI_MODEL_ENUM[data.get('model')]
+    except (ValueError, KeyError):
+        return jsonify({'error': 'Invalid items or model'}), 400
+    retry = bool(data.get('retry', True))
+
+    with get_db_connection() as conn:
+        nacked = finish_ai_jobs(conn.cursor(), items, model, retry)
+        conn.commit()
+    return jsonify({'nacked': nacked}), 200
 
 @app.route('/add_ai_news', methods=['POST'])
 def add_ai_news():
@@ -511,75 +1205,143 @@ def add_ai_news():
         keywords: list[str],
         sentiment_analysis: str,
         news_id: int,
-        model: str
+        model: str,
+        lease_token: str (/wait_ai_handle_list 認領時取得),
+        prompt_version: int (選填，提供時寫入分析結果快取)
     }
-    輸出：201 + 新增成功訊息 或 400/500 錯誤
+    輸出：201 + 新增成功訊息 或 400/500 錯誤；
+          租約已過期（已被其他 worker 重新認領）或結果已寫入（重複送出）時為 409，不寫入任何資料
     """
     try:
         data = request.get_json()
 
         # 取得資料與驗證
-        title = data.get('title')
-        categories = data.get('category', [])
-        keywords = data.get('keywords', [])
-        sentiment_val = data.get('sentiment_analysis')
-        sentiment_val = '中立' if sentiment_val == '中性' else sentiment_val
         news_id = data.get('news_id')
         model = reversed_AI_MODEL_ENUM[data.get('model')]
-
-        sentiment_key = get_sentiment_analysis_key(sentiment_val)
-        if not (title and categories and keywords and sentiment_key is not None and isinstance(news_id, int)):
+        lease_token = data.get('lease_token')
+        prompt_version = data.get('prompt_version')
+        try:
+            title, sentiment_key, categories, keywords = parse_ai_result(data)
+        except ValueError:
+            return jsonify({"error": "Invalid data"}), 400
+        if not isinstance(news_id, int) or not (prompt_version is None or isinstance(prompt_version, int)):
             return jsonify({"error": "Invalid data"}), 400
+        if not isinstance(lease_token, str):
+            return jsonify({"error": "Missing lease_token"}), 400
 
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            try:
+                insert_ai_news(cursor, news_id, model, lease_token, title, sentiment_key, categories, keywords)
+            except (StaleAiJob, sqlite3.IntegrityError) as e:
+                conn.rollback()
+                name_cache.discard(conn)
+                return jsonify({"error": f"Stale lease or duplicate result: {e}"}), 409
 
-            # 建立 ai_news 主表資料
-            cursor.execute(
-                '''
-                INSERT INTO ai_news (news_id, ai_title, ai_sentiment_analysis, ai_model)
-                VALUES (?, ?, ?, ?)
-                ''',
-                (news_id, title, sentiment_key, model)
-            )
-            ai_news_id = cursor.lastrowid
-
-            # 類別與關聯
-            category_ids = get_or_create_ids(cursor, "category", categories)
-            insert_relations(cursor, "ai_news_category", "ai_news_id", "category_id", ai_news_id, category_ids)
-
-            # 關鍵字與關聯
-            keyword_ids = get_or_create_ids(cursor, "keyword", keywords)
-            insert_relations(cursor, "ai_news_keyword", "ai_news_id", "keyword_id", ai_news_id, keyword_ids)
+            if prompt_version is not None:
+                news = get_news_by_id(cursor, news_id)
+                if news:
+                    ai_result_cache.store(cursor, news['news_content'], model, prompt_version, data)
 
-            conn.commit()
+            name_cache.commit(conn)
+        related_index.notify()
 
         return jsonify({"message": "AI news added successfully"}), 201
 
+    except DatabaseBusy:
+        raise
+
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/ai_result_cache/stats', methods=['GET'])
+def ai_result_cache_stats():
+    """
+    輸入：無
+    輸出：AI 分析結果快取的命中統計 (JSON)
+    """
+    return jsonify(ai_result_cache.stats(get_read_connection()))
+
+
+@app.route('/api/response_cache/stats', methods=['GET'])
+def response_cache_stats():
+    """
+    輸入：無
+    輸出：讀取 API 回應快取的命中、304 與失效統計 (JSON)
+    """
+    return jsonify(response_cache.stats())
+
 
 def query_db(query, args=(), one=False):
     """
-    Execute a query on the SQLite database.
+    輸入：query (str), args (tuple), one (bool)
+    輸出：以唯讀連線查詢的結果列；one 為 True 時只回傳第一列（沒有時為 None）
     """
-    with get_db_connection() as conn:
+    with get_read_connection() as conn:
         cur = conn.execute(query, args)
         rv = cur.fetchall()
         return (rv[0] if rv else None) if one else rv
 
 
-@app.route('/api/ai_news', methods=['POST'])
+FEED_PAGE_SIZE = 10
+
+# Relative times in the feed ("N hours ago") are rendered into cached pages,
+# so a cached page is only reused within the same time bucket
+FEED_TIME_BUCKET_SECONDS = 300
+
+
+def cached_json_response(entry):
+    """
+    輸入：entry (ResponseCache 的快取項目)
+    輸出：回應；請求的 If-None-Match 與 ETag 相符時為 304
+          (Cache-Control 為 no-cache，用戶端每次都要重新驗證，寫入後立即看得到)
+    """
+    if response_cache.is_not_modified(entry, request.headers.get('If-None-Match')):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype='application/json')
+    response.headers.update(entry.headers)
+    if entry.etag is not None:
+        response.headers['ETag'] = entry.etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def encode_feed_cursor(news_time, news_id):
+    """
+    輸入：news_time (str), news_id (int)，頁面最後一筆的排序鍵
+    輸出：不透明的游標字串
+    """
+    raw = json.dumps([news_time, news_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_feed_cursor(cursor):
+    """
+    輸入：cursor (str)，encode_feed_cursor 產生的游標
+    輸出：(news_time, news_id)；格式錯誤時拋出 ValueError
+    """
+    try:
+        news_time, news_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(news_time, str) or not isinstance(news_id, int):
+        raise ValueError('Invalid cursor')
+    return news_time, news_id
+
+
+@app.route('/api/ai_news', methods=['GET', 'POST'])
 def ai_news_list():
     """
     API for fetching a list of news items.
 
-    Input:
+    Input (JSON body for POST, query string for GET):
     - ai_model (required): Integer, AI model ID.
     - source_website (optional): Integer, source website ID.
-    - offset (optional): Integer, the starting position for the query (default is 0).
+    - cursor (optional): String, the X-Next-Cursor value of the previous page.
+    - offset (optional): Integer, legacy starting position, ignored when cursor is given (default is 0).
+    - collapse_clusters (optional): Boolean, show only the newest item of each story cluster (default is false).
 
     Output:
     JSON array of news items, each containing:
@@ -587,12 +1349,26 @@ def ai_news_list():
     - ai_title: String, AI-generated title.
     - image_url: String, image URL.
     - source_website: String, source website name.
-    Sorted by time in descending order.
+    - cluster_id: Integer, story cluster the news item belongs to.
+    - cluster_size: Integer, number of news items in the cluster.
+    Sorted by (time, news_id) in descending order.
+    When a full page is returned, the X-Next-Cursor header holds the cursor of the next page.
+    Responses carry an ETag; a request with a matching If-None-Match gets 304 Not Modified.
     """
-    data = request.json
-    ai_model = data.get('ai_model', None)
-    source_website = data.get('source_website', None)
-    offset = data.get('offset', 0)
+    if request.method == 'GET':
+        args = request.args
+        ai_model = args.get('ai_model', None, type=int)
+        source_website = args.get('source_website', None, type=int)
+        cursor = args.get('cursor', None)
+        offset = args.get('offset', 0, type=int)
+        collapse_clusters = args.get('collapse_clusters', '').lower() in ('1', 'true')
+    else:
+        data = request.json
+        ai_model = data.get('ai_model', None)
+        source_website = data.get('source_website', None)
+        cursor = data.get('cursor', None)
+        offset = data.get('offset', 0)
+        collapse_clusters = bool(data.get('collapse_clusters', False))
 
     # Validate required parameters
     if not ai_model or ai_model not in AI_MODEL_ENUM:
@@ -602,40 +1378,100 @@ def ai_news_list():
     if not isinstance(offset, int) or offset < 0:
         return jsonify({"error": "'offset' must be a non-negative integer."}), 400
 
-    # Build SQL query with optional filtering
+    cursor_time = cursor_id = None
+    if cursor is not None:
+        if not isinstance(cursor, str):
+            return jsonify({"error": "'cursor' must be a string."}), 400
+        try:
+            cursor_time, cursor_id = decode_feed_cursor(cursor)
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+
+    now = datetime.now()
+    cache_key = (
+        'ai_news_list', ai_model, source_website, cursor, offset if cursor is None else 0, collapse_clusters,
+        int(now.timestamp()) // FEED_TIME_BUCKET_SECONDS
+    )
+    conn = get_read_connection()
+    entry = response_cache.get(conn, cache_key)
+    if entry is None:
+        seq = response_cache.begin(conn)
+        body, headers, rows = render_ai_news_list(
+            now, ai_model, source_website, cursor_time, cursor_id, offset, collapse_clusters
+        )
+        deps = [f'feed:{ai_model}'] + [f'cluster:{row["cluster_id"]}' for row in rows]
+        entry = response_cache.put(conn, cache_key, seq, deps, body, headers)
+    return cached_json_response(entry)
+
+
+def build_feed_query(ai_model, source_website, cursor_time, cursor_id, offset, collapse_clusters):
+    """
+    輸入：ai_model, source_website, cursor_time, cursor_id, offset, collapse_clusters
+    輸出：(sql, params)，查詢一頁 feed
+    """
+    # Build SQL query with optional filtering; ai_feed holds one row per (model, analysed news item)
     query = '''
     SELECT
-        news.id AS news_id,
-        news.news_time AS time,
-        ai_news.ai_title AS ai_title,
-        news.image_url AS image_url,
-        news.source_website AS source_website,
-        news.news_url AS news_url
-    FROM ai_news
-    JOIN news ON ai_news.news_id = news.id
-    WHERE ai_news.ai_model = ?
+        feed.news_id AS news_id,
+        feed.news_time AS time,
+        feed.ai_title AS ai_title,
+        feed.image_url AS image_url,
+        feed.source_website AS source_website,
+        feed.news_url AS news_url,
+        feed.cluster_id AS cluster_id,
+        (SELECT COUNT(*) FROM news AS member WHERE member.cluster_id = feed.cluster_id) AS cluster_size
+    FROM ai_feed AS feed
+    WHERE feed.ai_model = ?
     '''
     params = [ai_model]
 
     if source_website:
-        query += " AND news.source_website = ?"
+        query += " AND feed.source_website = ?"
         params.append(source_website)
 
-    query += " ORDER BY news.news_time DESC LIMIT 10 OFFSET ?"
-    params.append(offset)
-
-    # Execute query
-    rows = query_db(query, params)
+    # Collapse story clusters: skip items that have a newer analysed item in the same cluster
+    if collapse_clusters:
+        query += '''
+        AND NOT EXISTS (
+            SELECT 1 FROM ai_feed AS newer
+            WHERE newer.ai_model = feed.ai_model AND newer.cluster_id = feed.cluster_id
+              AND (newer.news_time, newer.news_id) > (feed.news_time, feed.news_id)
+        '''
+        if source_website:
+            query += " AND newer.source_website = ?"
+            params.append(source_website)
+        query += ")"
+
+    # Keyset pagination: continue right after the last (news_time, id) of the previous page
+    if cursor_time is not None:
+        query += " AND (feed.news_time, feed.news_id) < (?, ?)"
+        params.extend([cursor_time, cursor_id])
+
+    query += " ORDER BY feed.news_time DESC, feed.news_id DESC LIMIT ?"
+    params.append(FEED_PAGE_SIZE)
+
+    if cursor_time is None and offset:
+        query += " OFFSET ?"
+        params.append(offset)
+    return query, params
+
+
+def render_ai_news_list(now, ai_model, source_website, cursor_time, cursor_id, offset, collapse_clusters):
+    """
+    輸入：now (datetime)，其餘同 build_feed_query
+    輸出：(JSON 內容 bytes, 額外的回應標頭 dict, 查詢結果列)
+    """
+    rows = query_db(*build_feed_query(ai_model, source_website, cursor_time, cursor_id, offset, collapse_clusters))
 
-    # Format output
-    now = datetime.now()
+    # Format output; times are 'YYYY-MM-DD HH:MM:SS' strings, so only items from the last 24 hours need parsing
     formatted_results = []
+    recent_cutoff = (now - timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
     for row in rows:
-        time = datetime.strptime(row['time'], "%Y-%m-%d %H:%M:%S")
-        if now - time < timedelta(hours=24):
-            formatted_time = f"{int((now - time).total_seconds() // 3600)} hours ago"
+        if row['time'] > recent_cutoff:
+            age = now - datetime.fromisoformat(row['time'])
+            formatted_time = f"{int(age.total_seconds() // 3600)} hours ago"
         else:
-            formatted_time = time.strftime("%Y-%m-%d")
+            formatted_time = row['time'][:10]
 
         formatted_results.append({
             "time": formatted_time,
@@ -643,10 +1479,15 @@ def ai_news_list():
             "image_url": row['image_url'],
             "source_website": SOURCE_WEBSITE_ENUM.get(row['source_website'], "Unknown"),
             "news_id": row['news_id'],
-            "news_url": row['news_url']
+            "news_url": row['news_url'],
+            "cluster_id": row['cluster_id'],
+            "cluster_size": row['cluster_size']
         })
 
-    return jsonify(formatted_results)
+    headers = {}
+    if len(rows) == FEED_PAGE_SIZE:
+        headers['X-Next-Cursor'] = encode_feed_cursor(rows[-1]['time'], rows[-1]['news_id'])
+    return jsonify(formatted_results).get_data(), headers, rows
 
 
 @app.route('/api/ai_news/<int:news_id>', methods=['GET'])
@@ -678,37 +1519,143 @@ def ai_news_detail(news_id):
     - image_url: String, URL of the news image.
     - source_website: String, name of the source website.
     - news_url: String, URL of the original news.
+    - cluster_id: Integer, story cluster the news item belongs to.
+    - cluster_news: List of the other news items in the same cluster (news_id, news_title, news_time,
+      source_website, news_url), oldest first.
+    Responses carry an ETag; a request with a matching If-None-Match gets 304 Not Modified.
     """
-    # SQL query to fetch detailed news information
-    news_query = '''
-    SELECT
-        news.news_title AS news_title,
-        news.news_time AS news_time,
-        news.news_content AS news_content,
-        news.image_url AS image_url,
-        news.source_website AS source_website,
-        news.news_url AS news_url
-    FROM news
-    WHERE news.id = ?
-    '''
+    cache_key = ('ai_news_detail', news_id)
+    conn = get_read_connection()
+    entry = response_cache.get(conn, cache_key)
+    if entry is None:
+        seq = response_cache.begin(conn)
+        response = render_ai_news_detail(news_id)
+        if response is None:
+            return jsonify({"error": "News item not found."}), 404
+        deps = [f'news:{news_id}', f'cluster:{response["cluster_id"]}']
+        entry = response_cache.put(conn, cache_key, seq, deps, jsonify(response).get_data())
+    return cached_json_response(entry)
+
+
+RELATED_DEFAULT_COUNT = 10
+RELATED_MAX_COUNT = 50
+# Candidates fetched per requested item; near-duplicates of the article (same story cluster) are dropped afterwards
+RELATED_OVERFETCH = 3
+
+
+@app.route('/api/ai_news/<int:news_id>/related', methods=['GET'])
+def ai_news_related(news_id):
+    """
+    API for news items related to a given one (TF-IDF cosine similarity over content and AI keywords).
 
-    ai_query = '''
-    SELECT
-        ai_news.ai_title AS ai_title,
-        ai_news.ai_model AS ai_model,
-        ai_news.ai_sentiment_analysis AS ai_sentiment_analysis
-    FROM ai_news
-    WHERE ai_news.news_id = ?
-    '''
+    Input:
+    - news_id (required): Integer, ID of the news item.
+    - k (optional, query string): Integer, number of items (default 10, at most 50).
+    - ai_model (optional, query string): Integer, AI model ID whose AI title is returned.
 
+    Output:
+    JSON array of news items, most similar first, each containing:
+    - news_id, news_title, ai_title (null without ai_model or analysis), news_time, image_url,
+      source_website, news_url
+    - score: Float, cosine similarity (0 to 1).
+    Items in the same story cluster as the news item (other reports of the same story) are excluded.
+    """
+    k = request.args.get('k', RELATED_DEFAULT_COUNT, type=int)
+    ai_model = request.args.get('ai_model', None, type=int)
+    if k is None or not 1 <= k <= RELATED_MAX_COUNT:
+        return jsonify({"error": f"'k' must be between 1 and {RELATED_MAX_COUNT}."}), 400
+    if ai_model is not None and ai_model not in AI_MODEL_ENUM:
+        return jsonify({"error": "Invalid 'ai_model' parameter."}), 400
+
+    cursor = get_read_connection().cursor()
+    related = related_index.query(cursor, news_id, k * RELATED_OVERFETCH)
+    if related is None:
+        return jsonify({"error": "News item not found."}), 404
+    if not related:
+        return jsonify([])
+
+    cluster_id = cursor.execute("SELECT cluster_id FROM news WHERE id = ?", (news_id,)).fetchone()['cluster_id']
+    placeholders = ', '.join(['?'] * len(related))
+    rows = cursor.execute(f'''
+        SELECT news.id, news.news_title, ai_news.ai_title, news.news_time, news.image_url,
+               news.source_website, news.news_url, news.cluster_id
+        FROM news LEFT JOIN ai_news ON ai_news.news_id = news.id AND ai_news.ai_model = ?
+        WHERE news.id IN ({placeholders})
+    ''', [ai_model] + [related_id for related_id, _ in related]).fetchall()
+    by_id = {row['id']: row for row in rows}
+
+    results = []
+    for related_id, score in related:
+        row = by_id.get(related_id)
+        if row is None or (cluster_id is not None and row['cluster_id'] == cluster_id):
+            continue
+        results.append({
+            "news_id": related_id,
+            "news_title": row['news_title'],
+            "ai_title": row['ai_title'],
+            "news_time": row['news_time'],
+            "image_url": row['image_url'],
+            "source_website": SOURCE_WEBSITE_ENUM.get(row['source_website'], "Unknown"),
+            "news_url": row['news_url'],
+            "score": round(score, 4),
+        })
+        if len(results) == k:
+            break
+    return jsonify(results)
+
+
+# SQL query to fetch detailed news information
+NEWS_DETAIL_SQL = '''
+SELECT
+    news.news_title AS news_title,
+    news.news_time AS news_time,
+    news.news_content AS news_content,
+    news.image_url AS image_url,
+    news.source_website AS source_website,
+    news.news_url AS news_url,
+    news.cluster_id AS cluster_id
+FROM news
+WHERE news.id = ?
+'''
+
+CLUSTER_MEMBERS_SQL = '''
+SELECT
+    member.id AS news_id,
+    member.news_title AS news_title,
+    member.news_time AS news_time,
+    member.source_website AS source_website,
+    member.news_url AS news_url
+FROM news AS member
+WHERE member.cluster_id = ? AND member.id != ?
+ORDER BY member.news_time
+'''
+
+AI_DETAILS_SQL = '''
+SELECT
+    ai_news.ai_title AS ai_title,
+    ai_news.ai_model AS ai_model,
+    ai_news.ai_sentiment_analysis AS ai_sentiment_analysis
+FROM ai_news
+WHERE ai_news.news_id = ?
+'''
+
+
+def render_ai_news_detail(news_id):
+    """
+    輸入：news_id (int)
+    輸出：新聞與各模型的 AI 結果、同一事件的其他報導 (回應物件)；新聞不存在時為 None
+    """
     # Fetch data from database
-    with get_db_connection() as conn:
+    with get_read_connection() as conn:
         cursor = conn.cursor()
-        news_result = cursor.execute(news_query, (news_id,)).fetchone()
-        ai_results = cursor.execute(ai_query, (news_id,)).fetchall()
+        news_result = cursor.execute(NEWS_DETAIL_SQL, (news_id,)).fetchone()
+        ai_results = cursor.execute(AI_DETAILS_SQL, (news_id,)).fetchall()
+        cluster_results = []
+        if news_result and news_result["cluster_id"] is not None:
+            cluster_results = cursor.execute(CLUSTER_MEMBERS_SQL, (news_result["cluster_id"], news_id)).fetchall()
 
     if not news_result:
-        return jsonify({"error": "News item not found."}), 404
+        return None
 
     # Format AI details
     ai_details = [
@@ -728,10 +1675,625 @@ def ai_news_detail(news_id):
         "news_content": news_result["news_content"],
         "image_url": news_result["image_url"],
         "source_website": SOURCE_WEBSITE_ENUM.get(news_result["source_website"], "Unknown"),
-        "news_url": news_result["news_url"]
+        "news_url": news_result["news_url"],
+        "cluster_id": news_result["cluster_id"],
+        "cluster_news": [
+            {
+                "news_id": member["news_id"],
+                "news_title": member["news_title"],
+                "news_time": member["news_time"],
+                "source_website": SOURCE_WEBSITE_ENUM.get(member["source_website"], "Unknown"),
+                "news_url": member["news_url"]
+            }
+            for member in cluster_results
+        ]
     }
 
-    return jsonify(response)
+    return response
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+SEARCH_MAX_TERMS = 10
+
+# The trigram tokenizer only matches terms of 3 or more characters; shorter terms fall back to LIKE
+SEARCH_MIN_MATCH_LENGTH = 3
+
+
+def fts_phrase(term):
+    """
+    輸入：term (str)
+    輸出：以雙引號包住的 FTS5 片語，運算子與標點符號都照字面比對
+    """
+    return '"' + term.replace('"', '""') + '"'
+
+
+def like_pattern(term):
+    """
+    輸入：term (str)
+    輸出：在欄位任意位置比對 term 的 LIKE 樣式（搭配 ESCAPE '\\' 使用）
+    """
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+# News ids matching one FTS5 query, with a BM25 score per match (lower is more relevant).
+# Titles are weighted higher than content; a matching AI title or keyword counts like a title match.
+SEARCH_SCORES_SQL = '''
+    SELECT rowid AS news_id, bm25(news_fts, 10.0, 1.0) AS score FROM news_fts WHERE news_fts MATCH ?
+    UNION ALL
+    SELECT ai_news.news_id, bm25(ai_news_fts) * 10.0
+    FROM ai_news_fts JOIN ai_news ON ai_news.id = ai_news_fts.rowid
+    WHERE ai_news_fts MATCH ?
+    UNION ALL
+    SELECT news_keyword.news_id, matched.score
+    FROM (SELECT rowid AS keyword_id, bm25(keyword_fts) * 10.0 AS score FROM keyword_fts WHERE keyword_fts MATCH ?) AS matched
+    JOIN news_keyword ON news_keyword.keyword_id = matched.keyword_id
+    UNION ALL
+    SELECT ai_news.news_id, matched.score
+    FROM (SELECT rowid AS keyword_id, bm25(keyword_fts) * 10.0 AS score FROM keyword_fts WHERE keyword_fts MATCH ?) AS matched
+    JOIN ai_news_keyword ON ai_news_keyword.keyword_id = matched.keyword_id
+    JOIN ai_news ON ai_news.id = ai_news_keyword.ai_news_id
+'''
+
+# Short terms cannot use the trigram index and are matched with LIKE against the same fields
+SEARCH_LIKE_SQL = '''
+    AND (
+        news.news_title LIKE ? ESCAPE '\\' OR news.news_content LIKE ? ESCAPE '\\'
+        OR EXISTS (SELECT 1 FROM ai_news WHERE ai_news.news_id = news.id AND ai_news.ai_title LIKE ? ESCAPE '\\')
+        OR EXISTS (
+            SELECT 1 FROM news_keyword JOIN keyword ON keyword.id = news_keyword.keyword_id
+            WHERE news_keyword.news_id = news.id AND keyword.name LIKE ? ESCAPE '\\'
+        )
+        OR EXISTS (
+            SELECT 1 FROM ai_news
+            JOIN ai_news_keyword ON ai_news_keyword.ai_news_id = ai_news.id
+            JOIN keyword ON keyword.id = ai_news_keyword.keyword_id
+            WHERE ai_news.news_id = news.id AND keyword.name LIKE ? ESCAPE '\\'
+        )
+    )
+'''
+
+
+def build_search_query(terms, source_website=None, ai_model=None):
+    """
+    輸入：terms (list of str), source_website, ai_model
+    輸出：(sql, params)
+          每個詞都要出現在新聞標題、內文、AI 標題或關鍵字中；
+          有長度足以使用 trigram 索引的詞時依 BM25 排序，只有短詞時依 news_time 排序
+    """
+    long_terms = [term for term in terms if len(term) >= SEARCH_MIN_MATCH_LENGTH]
+    short_terms = [term for term in terms if len(term) < SEARCH_MIN_MATCH_LENGTH]
+
+    ai_title_filter = "AND ai_news.ai_model = ?" if ai_model else ""
+    columns = f'''
+        news.id AS news_id,
+        news.news_title AS news_title,
+        news.news_time AS news_time,
+        news.image_url AS image_url,
+        news.source_website AS source_website,
+        news.news_url AS news_url,
+        (SELECT ai_title FROM ai_news WHERE ai_news.news_id = news.id {ai_title_filter}
+         ORDER BY ai_news.ai_model LIMIT 1) AS ai_title
+    '''
+    column_params = [ai_model] if ai_model else []
+
+    if long_terms:
+        match_any = ' OR '.join(fts_phrase(term) for term in long_terms)
+        query = f'''
+        WITH scores AS ({SEARCH_SCORES_SQL})
+        SELECT {columns}, SUM(scores.score) AS score
+        FROM scores
+        JOIN news ON news.id = scores.news_id
+        WHERE 1 = 1
+        '''
+        params = [match_any] * 4 + column_params
+        # A term may match any of the indexes, so with several terms each one is checked on its own
+        if len(long_terms) > 1:
+            for term in long_terms:
+                query += f" AND news.id IN (SELECT news_id FROM ({SEARCH_SCORES_SQL}))"
+                params.extend([fts_phrase(term)] * 4)
+    else:
+        query = f'''
+        SELECT {columns}, NULL AS score
+        FROM news
+        WHERE 1 = 1
+        '''
+        params = column_params
+
+    for term in short_terms:
+        query += SEARCH_LIKE_SQL
+        params.extend([like_pattern(term)] * 5)
+
+    if source_website:
+        query += " AND news.source_website = ?"
+        params.append(source_website)
+
+    if ai_model:
+        query += " AND EXISTS (SELECT 1 FROM ai_news WHERE ai_news.news_id = news.id AND ai_news.ai_model = ?)"
+        params.append(ai_model)
+
+    if long_terms:
+        query += " GROUP BY news.id ORDER BY score, news.news_time DESC"
+    else:
+        query += " ORDER BY news.news_time DESC"
+    return query, params
+
+
+@app.route('/api/search', methods=['GET'])
+def search_news():
+    """
+    API for full-text search over news titles, content, AI titles and keywords.
+
+    Input (query string):
+    - q (required): String, search terms separated by spaces; every term must match.
+    - page (optional): Integer, page number starting from 1 (default is 1).
+    - page_size (optional): Integer, results per page (default 20, at most 50).
+    - source_website (optional): Integer, source website ID.
+    - ai_model (optional): Integer, only return news analysed by this model, with its AI title.
+
+    Output:
+    JSON array of news items, each containing:
+    - news_id, news_title, ai_title, news_time, image_url, source_website, news_url
+    - score: Float, BM25 score (lower is more relevant), null when only short terms were given.
+    When a full page is returned, the X-Next-Page header holds the next page number.
+    """
+    terms = list(dict.fromkeys(request.args.get('q', '').split()))
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', SEARCH_PAGE_SIZE, type=int)
+    source_website = request.args.get('source_website', None, type=int)
+    ai_model = request.args.get('ai_model', None, type=int)
+
+    # Validate parameters
+    if not terms:
+        return jsonify({"error": "Missing 'q' parameter."}), 400
+    if len(terms) > SEARCH_MAX_TERMS:
+        return jsonify({"error": f"At most {SEARCH_MAX_TERMS} search terms are allowed."}), 400
+    if page is None or page < 1:
+        return jsonify({"error": "'page' must be a positive integer."}), 400
+    if page_size is None or not 1 <= page_size <= SEARCH_MAX_PAGE_SIZE:
+        return jsonify({"error": f"'page_size' must be between 1 and {SEARCH_MAX_PAGE_SIZE}."}), 400
+    if ai_model is not None and ai_model not in AI_MODEL_ENUM:
+        return jsonify({"error": "Invalid 'ai_model' parameter."}), 400
+
+    query, params = build_search_query(terms, source_website, ai_model)
+    query += " LIMIT ? OFFSET ?"
+    params.extend([page_size, (page - 1) * page_size])
+    rows = query_db(query, params)
+
+    results = [
+        {
+            "news_id": row['news_id'],
+            "news_title": row['news_title'],
+            "ai_title": row['ai_title'],
+            "news_time": row['news_time'],
+            "image_url": row['image_url'],
+            "source_website": SOURCE_WEBSITE_ENUM.get(row['source_website'], "Unknown"),
+            "news_url": row['news_url'],
+            "score": round(row['score'], 4) if row['score'] is not None else None,
+        }
+        for row in rows
+    ]
+
+    response = jsonify(results)
+    if len(rows) == page_size:
+        response.headers['X-Next-Page'] = str(page + 1)
+    return response
+
+@app.route('/export', methods=['GET'])
+def export_news():
+    """
+    Stream news items with authors, keywords, categories and per-model AI results.
+
+    Input (query string):
+    - format (optional): 'ndjson' (default, one JSON object per line) or 'csv'.
+    - since / until (optional): news_time range, YYYY-MM-DD[ HH:MM:SS]; since is inclusive, until exclusive.
+    - source_website (optional): Integer, source website ID.
+    - after_id (optional): Integer, only export news with a larger id; pass the last id received to resume.
+    - limit (optional): Integer, maximum number of news items.
+    - gzip (optional): '1' to receive a gzip-compressed file.
+
+    Output:
+    NDJSON or CSV in ascending id order, streamed in batches so memory use does not grow with the result size.
+    """
+    args = request.args
+    export_format = args.get('format', 'ndjson')
+    source_website = args.get('source_website', None, type=int)
+    after_id = args.get('after_id', 0, type=int)
+    limit = args.get('limit', None, type=int)
+    compress = args.get('gzip', '').lower() in ('1', 'true')
+
+    # Validate parameters
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"'format' must be one of {', '.join(EXPORT_FORMATS)}."}), 400
+    if after_id is None or after_id < 0:
+        return jsonify({"error": "'after_id' must be a non-negative integer."}), 400
+    if 'limit' in args and (limit is None or limit < 1):
+        return jsonify({"error": "'limit' must be a positive integer."}), 400
+    try:
+        since = parse_export_time(args['since']) if 'since' in args else None
+        until = parse_export_time(args['until']) if 'until' in args else None
+    except ValueError:
+        return jsonify({"error": "'since' and 'until' must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS."}), 400
+
+    chunks = iter_export(
+        get_read_connection(), export_format, (SOURCE_WEBSITE_ENUM, SENTIMENT_ANALYSIS_ENUM, AI_MODEL_ENUM),
+        after_id=after_id, since=since, until=until, source_website=source_website, limit=limit
+    )
+    filename = f'news_export.{export_format}'
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    if compress:
+        chunks = iter_gzip(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    # The read connection stays checked out until the stream finishes (teardown runs after the last chunk)
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+TRENDS_DEFAULT_DAYS = 30
+TRENDS_TOP_LIMIT = 20
+TRENDS_MAX_TOP_LIMIT = 100
+
+
+def parse_trend_args(args):
+    """
+    輸入：args (request.args)
+    輸出：(ai_model, since, until)，since/until 為 datetime；參數不合法時拋出 ValueError
+          until 預設為現在，since 預設為 until 的 TRENDS_DEFAULT_DAYS 天前
+    """
+    ai_model = args.get('ai_model', None, type=int)
+    if ai_model not in AI_MODEL_ENUM:
+        raise ValueError("Invalid or missing 'ai_model' parameter.")
+    try:
+        until = datetime.fromisoformat(args['until']) if 'until' in args else datetime.now()
+        since = datetime.fromisoformat(args['since']) if 'since' in args else until - timedelta(days=TRENDS_DEFAULT_DAYS)
+    except ValueError:
+        raise ValueError("'since' and 'until' must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS.")
+    if since >= until:
+        raise ValueError("'since' must be earlier than 'until'.")
+    return ai_model, since, until
+
+
+def parse_trend_top_args(args):
+    """
+    輸入：args (request.args)
+    輸出：(ai_model, segments, limit)，segments 以最少的 rollup bucket 涵蓋 [since, until)
+    """
+    ai_model, since, until = parse_trend_args(args)
+    limit = args.get('limit', TRENDS_TOP_LIMIT, type=int)
+    if limit is None or not 1 <= limit <= TRENDS_MAX_TOP_LIMIT:
+        raise ValueError(f"'limit' must be between 1 and {TRENDS_MAX_TOP_LIMIT}.")
+    return ai_model, split_range(since, until), limit
+
+
+def parse_trend_series_args(args):
+    """
+    輸入：args (request.args)
+    輸出：(ai_model, period, first_bucket, last_bucket)，bucket 範圍包含兩端
+    """
+    ai_model, since, until = parse_trend_args(args)
+    period = args.get('period', 'day')
+    if period not in PERIODS:
+        raise ValueError(f"'period' must be one of {', '.join(PERIODS)}.")
+    last = until - timedelta(seconds=1)
+    return (ai_model, period, bucket_of(since.strftime("%Y-%m-%d %H:%M:%S"), period),
+            bucket_of(last.strftime("%Y-%m-%d %H:%M:%S"), period))
+
+
+def rollup_segments_sql(table, columns, ai_model, segments):
+    """
+    輸入：table, columns (list of str), ai_model, segments [(period, 起始 bucket, 結束 bucket), ...]
+    輸出：(sql, params)，以 UNION ALL 合併各段的 rollup 列，選出 columns 與 count
+    """
+    parts = []
+    params = []
+    for period, first, end in segments:
+        parts.append(f"SELECT {columns}, count FROM {table} WHERE period = ? AND ai_model = ? AND bucket >= ? AND bucket < ?")
+        params.extend([period, ai_model, first, end])
+    return ' UNION ALL '.join(parts), params
+
+
+# Lookup of a keyword or category id by name
+NAME_ID_SQL = "SELECT id FROM {table} WHERE name = ?"
+
+KEYWORD_SERIES_SQL = '''
+    SELECT bucket, count FROM rollup_keyword
+    WHERE period = ? AND ai_model = ? AND keyword_id = ? AND bucket >= ? AND bucket <= ? AND count > 0
+    ORDER BY bucket
+'''
+
+CATEGORY_SERIES_SQL = '''
+    SELECT bucket, sentiment, count FROM rollup_category
+    WHERE period = ? AND ai_model = ? AND category_id = ? AND bucket >= ? AND bucket <= ?
+    ORDER BY bucket
+'''
+
+
+def sentiment_series_query(ai_model, period, first, last, source_website=None):
+    """
+    輸入：ai_model, period, first, last, source_website (None 為全部來源)
+    輸出：(sql, params)，查詢情緒時間序列
+    """
+    query = '''
+        SELECT bucket, sentiment, count FROM rollup_sentiment
+        WHERE period = ? AND ai_model = ? AND bucket >= ? AND bucket <= ?
+    '''
+    params = [period, ai_model, first, last]
+    if source_website:
+        query += " AND source_website = ?"
+        params.append(source_website)
+    query += " ORDER BY bucket"
+    return query, params
+
+
+def sentiment_counts(pairs):
+    """
+    輸入：pairs [(情緒代碼, 篇數), ...]
+    輸出：{情緒名稱: 篇數, ..., "total": 總篇數}
+    """
+    counts = {name: 0 for name in SENTIMENT_ANALYSIS_ENUM.values()}
+    for sentiment, count in pairs:
+        name = SENTIMENT_ANALYSIS_ENUM.get(sentiment, "Unknown")
+        counts[name] = counts.get(name, 0) + count
+    counts['total'] = sum(counts.values())
+    return counts
+
+
+@app.route('/api/trends/keywords', methods=['GET'])
+def trends_top_keywords():
+    """
+    API for the most frequent AI keywords in a time range.
+
+    Input (query string):
+    - ai_model (required): Integer, AI model ID.
+    - since / until (optional): YYYY-MM-DD[ HH:MM:SS], since inclusive and until exclusive, hour resolution
+      (default is the last 30 days).
+    - limit (optional): Integer, number of keywords (default 20, at most 100).
+
+    Output:
+    JSON array of {keyword, count}, most frequent first.
+    """
+    try:
+        ai_model, segments, limit = parse_trend_top_args(request.args)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    if not segments:
+        return jsonify([])
+
+    union_sql, params = rollup_segments_sql('rollup_keyword', 'keyword_id', ai_model, segments)
+    rows = query_db(f'''
+        SELECT keyword.name AS keyword, top.total AS count
+        FROM (
+            SELECT keyword_id, SUM(count) AS total FROM ({union_sql})
+            GROUP BY keyword_id HAVING total > 0 ORDER BY total DESC LIMIT ?
+        ) AS top
+        JOIN keyword ON keyword.id = top.keyword_id
+        ORDER BY top.total DESC, keyword.name
+    ''', params + [limit])
+    return jsonify([{"keyword": row['keyword'], "count": row['count']} for row in rows])
+
+
+@app.route('/api/trends/keywords/<path:name>', methods=['GET'])
+def trends_keyword_series(name):
+    """
+    API for the frequency of one AI keyword over time.
+
+    Input (query string):
+    - ai_model (required): Integer, AI model ID.
+    - since / until (optional): time range (default is the last 30 days).
+    - period (optional): 'hour', 'day' (default) or 'month'.
+
+    Output:
+    JSON array of {bucket, count} in time order; buckets without any item are omitted.
+    """
+    try:
+        ai_model, period, first, last = parse_trend_series_args(request.args)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    keyword = query_db(NAME_ID_SQL.format(table='keyword'), (name,), one=True)
+    if keyword is None:
+        return jsonify({"error": "Keyword not found."}), 404
+
+    rows = query_db(KEYWORD_SERIES_SQL, (period, ai_model, keyword['id'], first, last))
+    return jsonify([{"bucket": row['bucket'], "count": row['count']} for row in rows])
+
+
+@app.route('/api/trends/categories', methods=['GET'])
+def trends_top_categories():
+    """
+    API for the most frequent AI categories in a time range, with their sentiment mix.
+
+    Input (query string):
+    - ai_model (required): Integer, AI model ID.
+    - since / until (optional): time range, hour resolution (default is the last 30 days).
+    - limit (optional): Integer, number of categories (default 20, at most 100).
+
+    Output:
+    JSON array of {category, count, sentiment: {中立, 正面, 負面, total}}, most frequent first.
+    """
+    try:
+        ai_model, segments, limit = parse_trend_top_args(request.args)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    if not segments:
+        return jsonify([])
+
+    union_sql, params = rollup_segments_sql('rollup_category', 'category_id, sentiment', ai_model, segments)
+    rows = query_db(f'''
+        SELECT category.name AS category, totals.sentiment AS sentiment, totals.total AS total
+        FROM (SELECT category_id, sentiment, SUM(count) AS total FROM ({union_sql}) GROUP BY category_id, sentiment) AS totals
+        JOIN category ON category.id = totals.category_id
+    ''', params)
+
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['category'], []).append((row['sentiment'], row['total']))
+    results = [{"category": category, "sentiment": sentiment_counts(pairs)} for category, pairs in grouped.items()]
+    for result in results:
+        result['count'] = result['sentiment']['total']
+    results = [result for result in results if result['count'] > 0]
+    results.sort(key=lambda result: (-result['count'], result['category']))
+    return jsonify(results[:limit])
+
+
+@app.route('/api/trends/categories/<path:name>', methods=['GET'])
+def trends_category_series(name):
+    """
+    API for the frequency and sentiment mix of one AI category over time.
+
+    Input (query string):
+    - ai_model (required): Integer, AI model ID.
+    - since / until (optional): time range (default is the last 30 days).
+    - period (optional): 'hour', 'day' (default) or 'month'.
+
+    Output:
+    JSON array of {bucket, sentiment: {中立, 正面, 負面, total}} in time order; empty buckets are omitted.
+    """
+    try:
+        ai_model, period, first, last = parse_trend_series_args(request.args)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    category = query_db(NAME_ID_SQL.format(table='category'), (name,), one=True)
+    if category is None:
+        return jsonify({"error": "Category not found."}), 404
+
+    rows = query_db(CATEGORY_SERIES_SQL, (period, ai_model, category['id'], first, last))
+    return jsonify(bucket_sentiment_series(rows))
+
+
+def bucket_sentiment_series(rows):
+    """
+    輸入：rows [(bucket, 情緒代碼, 篇數), ...]，依 bucket 排序
+    輸出：[{bucket, sentiment: {...}}, ...]，略過沒有資料的 bucket
+    """
+    series = []
+    for row in rows:
+        if not series or series[-1][0] != row['bucket']:
+            series.append((row['bucket'], []))
+        series[-1][1].append((row['sentiment'], row['count']))
+    results = [{"bucket": bucket, "sentiment": sentiment_counts(pairs)} for bucket, pairs in series]
+    return [result for result in results if result['sentiment']['total'] > 0]
+
+
+@app.route('/api/trends/sentiment', methods=['GET'])
+def trends_sentiment_by_source():
+    """
+    API for the sentiment mix of each source website in a time range.
+
+    Input (query string):
+    - ai_model (required): Integer, AI model ID.
+    - since / until (optional): time range, hour resolution (default is the last 30 days).
+
+    Output:
+    JSON array of {source_website, sentiment: {中立, 正面, 負面, total}}.
+    """
+    try:
+        ai_model, since, until = parse_trend_args(request.args)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    segments = split_range(since, until)
+    if not segments:
+        return jsonify([])
+
+    union_sql, params = rollup_segments_sql('rollup_sentiment', 'source_website, sentiment', ai_model, segments)
+    rows = query_db(f'''
+        SELECT source_website, sentiment, SUM(count) AS total FROM ({union_sql})
+        GROUP BY source_website, sentiment
+    ''', params)
+
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['source_website'], []).append((row['sentiment'], row['total']))
+    results = [
+        {"source_website": SOURCE_WEBSITE_ENUM.get(source, "Unknown"), "sentiment": sentiment_counts(pairs)}
+        for source, pairs in sorted(grouped.items())
+    ]
+    return jsonify([result for result in results if result['sentiment']['total'] > 0])
+
+
+@app.route('/api/trends/sentiment/series', methods=['GET'])
+def trends_sentiment_series():
+    """
+    API for the sentiment mix over time, for all sources or a single one.
+
+    Input (query string):
+    - ai_model (required): Integer, AI model ID.
+    - source_website (optional): Integer, source website ID.
+    - since / until (optional): time range (default is the last 30 days).
+    - period (optional): 'hour', 'day' (default) or 'month'.
+
+    Output:
+    JSON array of {bucket, sentiment: {中立, 正面, 負面, total}} in time order; empty buckets are omitted.
+    """
+    try:
+        ai_model, period, first, last = parse_trend_series_args(request.args)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    source_website = request.args.get('source_website', None, type=int)
+    query, params = sentiment_series_query(ai_model, period, first, last, source_website)
+    return jsonify(bucket_sentiment_series(query_db(query, params)))
+
+@app.route('/api/related_index/stats', methods=['GET'])
+def related_index_stats():
+    """
+    輸入：無
+    輸出：相關新聞索引的版本、基礎與增量篇數 (JSON)
+    """
+    return jsonify(related_index.stats())
+
+@app.route('/api/name_cache/stats', methods=['GET'])
+def name_cache_stats():
+    """
+    輸入：無
+    輸出：作者、關鍵字、類別名稱快取的命中統計 (JSON)
+    """
+    return jsonify(name_cache.stats())
+
+# 熱點查詢的執行計畫檢查 (python migrations.py 執行)：(名稱, SQL, 參數)
+# SQL 由實際執行查詢的常數與組合函式產生；排行需跨 bucket 加總（GROUP BY 必然使用暫存表）、
+# 全文檢索需跨索引加總分數，這兩者只檢查其中的範圍查詢與各索引的比對
+PLAN_SAMPLE_TIME = '2025-01-01 00:00:00'
+
+PLAN_CHECKS = [
+    ('check_existing_news_batch', EXISTING_NEWS_SQL.format(placeholders='?, ?'), ('a', 'b')),
+    ('get_or_create', SELECT_IDS_SQL.format(table='keyword', placeholders='?, ?'), ('a', 'b')),
+    ('update_relations', RELATION_IDS_SQL.format(entity_table='keyword', relation_table='news_keyword'), (1,)),
+    ('release_expired_leases', RELEASE_EXPIRED_LEASES_SQL, (MAX_CRAWL_ATTEMPTS, PLAN_SAMPLE_TIME)),
+    ('claim_waiting_news', CLAIM_WAITING_NEWS_SQL, ('token', PLAN_SAMPLE_TIME, 1, 10)),
+    ('fetch_waiting_ai_news', *waiting_ai_news_query(10, 1)),
+    ('fetch_waiting_ai_news (source_website)', *waiting_ai_news_query(10, 1, source_website=1)),
+    ('fetch_waiting_ai_news (skip_cluster_duplicates)', *waiting_ai_news_query(10, 1, skip_cluster_duplicates=True)),
+    ('release_expired_ai_jobs', RELEASE_EXPIRED_AI_JOBS_SQL, (MAX_AI_ATTEMPTS, PLAN_SAMPLE_TIME)),
+    ('mark_cluster_duplicates (models)', CLUSTER_MODELS_SQL, (1,)),
+    ('mark_cluster_duplicates', SKIP_CLUSTER_DUPLICATES_SQL, (1, 1, 1)),
+    ('ai_result_cache lookup', AI_CACHE_LOOKUP_SQL.format(placeholders='?, ?'), ('a', 'b', 1, 1)),
+    ('ai_result_cache evict', AI_CACHE_EVICT_SQL, (10,)),
+    ('near_dup find_similar', *similar_news_query(1, 1, PLAN_SAMPLE_TIME)),
+    ('near_dup find_similar (no news_time)', *similar_news_query(1, 1, None)),
+    ('ai_news_list', *build_feed_query(1, None, None, None, 0, False)),
+    ('ai_news_list (cursor)', *build_feed_query(1, None, PLAN_SAMPLE_TIME, 1, 0, False)),
+    ('ai_news_list (source_website)', *build_feed_query(1, 1, PLAN_SAMPLE_TIME, 1, 0, False)),
+    ('ai_news_list (collapse_clusters)', *build_feed_query(1, None, PLAN_SAMPLE_TIME, 1, 0, True)),
+    ('ai_news_list (source_website, collapse_clusters)', *build_feed_query(1, 1, None, None, 0, True)),
+    ('ai_news_detail', NEWS_DETAIL_SQL, (1,)),
+    ('response_cache scope versions', SCOPE_SEQ_SQL.format(placeholders='?, ?'), ('feed:1', '*')),
+    ('ai_news_detail (ai_news)', AI_DETAILS_SQL, (1,)),
+    ('ai_news_detail (cluster)', CLUSTER_MEMBERS_SQL, (1, 1)),
+    ('search (scores)', SEARCH_SCORES_SQL, ('"abc"',) * 4),
+    ('crawl_state', CRAWL_STATE_SQL, (1,)),
+    ('trends name lookup', NAME_ID_SQL.format(table='keyword'), ('a',)),
+    ('trends top keywords', *rollup_segments_sql('rollup_keyword', 'keyword_id', 1, [('day', '2025-01-01', '2025-02-01')])),
+    ('trends top categories',
+     *rollup_segments_sql('rollup_category', 'category_id, sentiment', 1, [('day', '2025-01-01', '2025-02-01')])),
+    ('trends sentiment by source',
+     *rollup_segments_sql('rollup_sentiment', 'source_website, sentiment', 1, [('day', '2025-01-01', '2025-02-01')])),
+    ('trends keyword series', KEYWORD_SERIES_SQL, ('day', 1, 1, '2025-01-01', '2025-02-01')),
+    ('trends category series', CATEGORY_SERIES_SQL, ('day', 1, 1, '2025-01-01', '2025-02-01')),
+    ('trends sentiment series', *sentiment_series_query(1, 'day', '2025-01-01', '2025-02-01')),
+    ('trends sentiment series (source_website)', *sentiment_series_query(1, 'day', '2025-01-01', '2025-02-01', 1)),
+]
 
 @app.route('/')
 def index():
@@ -739,14 +2301,30 @@ def index():
     return render_template('news.html', domain=domain)
 
 def main():
+    global DB_POOL_SIZE, DB_POOL_TIMEOUT
     config = ConfigParser()
     config.read('config.ini')
 
     host = config['WEB_SERVER']['host']
     port = int(config['WEB_SERVER']['port'])
 
+    # 連線池大小與 pragma 設定
+    if config.has_section('DATABASE'):
+        db_config = dict(config['DATABASE'])
+        DB_POOL_SIZE = int(db_config.pop('pool_size', DB_POOL_SIZE))
+        DB_POOL_TIMEOUT = float(db_config.pop('pool_timeout', DB_POOL_TIMEOUT))
+        name_cache.capacity = int(db_config.pop('name_cache_size', name_cache.capacity))
+        ai_result_cache.capacity = int(db_config.pop('ai_result_cache_size', ai_result_cache.capacity))
+        response_cache.capacity = int(db_config.pop('response_cache_size', response_cache.capacity))
+        related_index.directory = db_config.pop('related_index_dir', related_index.directory)
+        related_index.max_delta_docs = int(db_config.pop('related_index_max_delta', related_index.max_delta_docs))
+        DB_PRAGMAS.update(db_config)
+
+    init_db()
+    with sqlite3.connect(DATABASE) as conn:
+        name_cache.warm(conn)
+    related_index.database = DATABASE
     app.run(debug=True, host=host, port=port)
 
 if __name__ == '__main__':
-    # init_db()
     main()